@@ -0,0 +1,90 @@
+"""
+Time and peak memory of the open or consume decision on large stock entry lists
+
+Compares parsing the whole /entries response, with json and with the faster
+backend when it is installed, to streaming it until the decision is known.
+The opened entry is put first, in the middle or nowhere in the response.
+
+Run from the repository root:
+    python -m benchmarks.bench_entries --entries 5000 --iterations 20
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable
+from unittest.mock import MagicMock
+
+from src import stock_entry
+from src.product import Product
+from src.stock_entry import iter_entries, load_entries, parse_entries
+
+FIXTURE = "tests/responses/product_stock_entries_open.json"
+
+
+def response(entries: int, opened: int | None) -> bytes:
+    """
+    A response with the given number of entries, the one at index opened is open
+    """
+    with open(FIXTURE, "r") as f:
+        template = json.load(f)[1]
+    return json.dumps(
+        [
+            dict(
+                template,
+                id=str(index),
+                stock_id=f"{index:013x}",
+                open="1" if index == opened else "0",
+            )
+            for index in range(entries)
+        ]
+    ).encode()
+
+
+def measure(step: Callable[[], object], iterations: int) -> tuple[float, float]:
+    """
+    Return the time in milliseconds and the peak memory in KiB of a call
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        step()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    step()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed / iterations * 1000, peak / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    product = Product(id=1, api_client=MagicMock())
+    backend = stock_entry.loads.__module__
+    strategies: dict[str, Callable[[bytes], object]] = {
+        "json, whole response": lambda data: product._is_opened(
+            parse_entries(json.loads(data))
+        ),
+        f"{backend}, whole response": lambda data: product._is_opened(
+            load_entries(data)
+        ),
+        "streamed, early exit": lambda data: product._is_opened(iter_entries(data)),
+    }
+    positions = {"first": 0, "middle": args.entries // 2, "none": None}
+
+    print(f"{args.entries} entries, JSON backend: {backend}")
+    print(f"{'strategy':<24} {'opened':<8} {'ms/op':>8} {'peak KiB':>10}")
+    for position, opened in positions.items():
+        data = response(args.entries, opened)
+        for name, decide in strategies.items():
+            duration, peak = measure(lambda: decide(data), args.iterations)
+            print(f"{name:<24} {position:<8} {duration:8.2f} {peak:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Journal throughput against a local mock Grocy server
+
+Run from the repository root:
+    python -m benchmarks.bench_journal --operations 500 --latency 0.005
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from src.api_client import ApiClient
+from src.journal import Journal, JournalReplayer
+from src.product import Product
+from tests.mock_grocy import MockGrocy
+
+
+def stock_entries(products: int, amount: int) -> dict[int, list[dict]]:
+    return {
+        product_id: [
+            {"stock_id": f"stock{product_id}", "amount": str(amount), "open": "0"}
+        ]
+        for product_id in range(1, products + 1)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, MockGrocy(
+        entries=stock_entries(args.products, args.operations), latency=args.latency
+    ) as grocy:
+        journal = Journal(os.path.join(directory, "journal.sqlite3"))
+
+        start = time.perf_counter()
+        for index in range(args.operations):
+            product_id = index % args.products + 1
+            journal.append(
+                "consume", Product(id=product_id, stock_id=f"stock{product_id}")
+            )
+        append_time = time.perf_counter() - start
+
+        replayer = JournalReplayer(
+            journal, api_client=ApiClient(api_url=grocy.url, api_key="benchmark")
+        )
+        start = time.perf_counter()
+        while journal.pending():
+            if not replayer.replay_one():
+                raise RuntimeError("Mock Grocy rejected an operation")
+        replay_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        journal.compact()
+        compact_time = time.perf_counter() - start
+        journal.close()
+
+    print(f"operations: {args.operations}, mock latency: {args.latency * 1000:.1f} ms")
+    print(f"append:  {args.operations / append_time:10.1f} ops/s")
+    print(f"replay:  {args.operations / replay_time:10.1f} ops/s")
+    print(f"compact: {compact_time * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
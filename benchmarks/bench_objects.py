@@ -0,0 +1,86 @@
+"""
+Time and memory of the per-scan objects, without any I/O
+
+Measures each step between a scanned code and the open or consume decision:
+parsing the code, getting its Product, parsing the stock entries and deciding.
+
+Run from the repository root:
+    python -m benchmarks.bench_objects --iterations 100000
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from unittest.mock import MagicMock
+
+from src.grocycode import GrocyCode, parse
+from src.pipeline import ScanPipeline
+from src.stock_cache import StockCache
+from src.stock_entry import parse_entries
+
+FIXTURE = "tests/responses/product_stock_entries_open.json"
+
+
+def measure(step: Callable[[int], object], iterations: int) -> tuple[float, float]:
+    """
+    Return the time in microseconds and the bytes allocated per call
+    """
+    start = time.perf_counter()
+    for index in range(iterations):
+        step(index)
+    elapsed = time.perf_counter() - start
+
+    # Results are kept so that what a step allocates is still counted
+    kept: list[object] = [None] * min(iterations, 10000)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for index in range(len(kept)):
+        kept[index] = step(index)
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed / iterations * 1e6, allocated / len(kept)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--codes", type=int, default=20, help="distinct codes")
+    args = parser.parse_args()
+
+    codes = [f"grcy:p:{index + 1}:62505f88ea718" for index in range(args.codes)]
+    with open(FIXTURE, "r") as f:
+        response = json.load(f)
+    entries = parse_entries(response)
+    pipeline = ScanPipeline(api_client=MagicMock())
+    cache = StockCache()
+    for product_id in range(1, args.codes + 1):
+        cache.put(product_id, entries)
+    product = parse(codes[0]).get_product(api_client=MagicMock())
+
+    steps: dict[str, Callable[[int], object]] = {
+        "GrocyCode(code)": lambda i: GrocyCode(codes[i % args.codes]),
+        "parse(code), cached": lambda i: parse(codes[i % args.codes]),
+        "get_product()": lambda i: parse(codes[i % args.codes]).get_product(),
+        "pipeline product, cached": lambda i: pipeline._product(
+            codes[i % args.codes], None
+        ),
+        "parse_entries(response)": lambda i: parse_entries(response),
+        "stock cache get": lambda i: cache.get(i % args.codes + 1),
+        "open or consume decision": lambda i: product._is_opened(entries),
+    }
+    print(f"{'step':<28} {'us/op':>8} {'bytes/op':>10}")
+    for name, step in steps.items():
+        duration, allocated = measure(step, args.iterations)
+        print(f"{name:<28} {duration:8.2f} {allocated:10.0f}")
+
+    print()
+    print(f"size of a Product:    {sys.getsizeof(product)} bytes")
+    print(f"size of a StockEntry: {sys.getsizeof(entries[0])} bytes")
+    print(f"size of an entry dict: {sys.getsizeof(response[0])} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Scan pipeline throughput and latency against a mock Grocy server
+
+Codes are written to a pty at a controlled rate and read back through the
+scanner, as they would come from a serial barcode scanner. The mock Grocy
+server runs in its own process so CPU and memory figures are the client's.
+
+Run from the repository root:
+    python -m benchmarks.bench_scan --scans 500 --rate 50 --latency 0.005
+    python -m benchmarks.bench_scan --cache --mode async --json
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import pty
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tty
+import urllib.request
+
+from src.api_client import ApiClient
+from src.pipeline import ScanPipeline
+from src.scanner import Scanner, ScannerGroup
+from src.stock_cache import StockCache
+
+
+def start_mock_grocy(args) -> tuple[subprocess.Popen, str]:
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "tests.mock_grocy",
+            "--latency",
+            str(args.latency),
+            "--error-rate",
+            str(args.error_rate),
+            "--fixture",
+            args.fixture,
+            "--products",
+            str(args.products),
+            "--amount",
+            str(args.scans * 2),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    url = process.stdout.readline().strip()  # type: ignore
+    return process, url
+
+
+def write_scans(master: int, args, sent: collections.deque) -> None:
+    interval = 1 / args.rate if args.rate else 0
+    start = time.perf_counter()
+    for index in range(args.scans):
+        if interval:
+            delay = start + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent.append(time.perf_counter())
+        os.write(master, f"grcy:p:{index % args.products + 1}\r".encode())
+
+
+def run_sync(group: ScannerGroup, pipeline: ScanPipeline, args, sent, results):
+    while len(results) < args.scans:
+        for _, code in group.read_codes():
+            try:
+                pipeline.process(code)
+                ok = True
+            except Exception:
+                ok = False
+            results.append((time.perf_counter() - sent.popleft(), ok))
+
+
+async def run_async(group: ScannerGroup, pipeline: ScanPipeline, args, sent, results):
+    async def handle(code: str, started: float) -> None:
+        try:
+            await pipeline.process_async(code)
+            ok = True
+        except Exception:
+            ok = False
+        results.append((time.perf_counter() - started, ok))
+
+    tasks = []
+    async for _, code in group.async_codes():
+        tasks.append(asyncio.create_task(handle(code, sent.popleft())))
+        if len(tasks) == args.scans:
+            break
+    await asyncio.gather(*tasks)
+
+
+def percentile(latencies: list[float], percent: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[percent - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=0, help="scans/s, 0 for max")
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock latency, s")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--fixture", default="tests/responses/product_stock_entries_not_open.json"
+    )
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--cache", action="store_true", help="use the stock cache")
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args()
+
+    process, url = start_mock_grocy(args)
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    group = ScannerGroup(timeout=1)
+    group.add(Scanner(os.fdopen(slave, "rb", buffering=0), name="benchmark"))
+    pipeline = ScanPipeline(
+        api_client=ApiClient(api_url=url, api_key="benchmark"),
+        stock_cache=StockCache() if args.cache else None,
+    )
+
+    sent: collections.deque = collections.deque()
+    results: list[tuple[float, bool]] = []
+    writer = threading.Thread(target=write_scans, args=(master, args, sent))
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    writer.start()
+    try:
+        if args.mode == "async":
+            asyncio.run(run_async(group, pipeline, args, sent, results))
+        else:
+            run_sync(group, pipeline, args, sent, results)
+        elapsed = time.perf_counter() - start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with urllib.request.urlopen(f"{url}/mock/stats") as response:
+            requests_made = json.load(response)
+    finally:
+        writer.join()
+        group.close()
+        os.close(master)
+        process.terminate()
+        process.wait()
+
+    latencies = [latency for latency, _ in results]
+    cpu = (usage.ru_utime - usage_start.ru_utime) + (
+        usage.ru_stime - usage_start.ru_stime
+    )
+    report = {
+        "mode": args.mode,
+        "cache": args.cache,
+        "scans": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "throughput": len(results) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "cpu_percent": cpu / elapsed * 100,
+        "max_rss_mb": usage.ru_maxrss / 1024,
+        "api_requests": requests_made["requests"],
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(
+        f"mode: {args.mode}, cache: {args.cache}, scans: {report['scans']}, "
+        f"errors: {report['errors']}, rate: {args.rate or 'max'}, "
+        f"mock latency: {args.latency * 1000:.1f} ms"
+    )
+    print(f"throughput:   {report['throughput']:8.1f} scans/s")
+    print(
+        f"latency:      p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms,"
+        f" p99 {report['p99_ms']:.1f} ms"
+    )
+    print(f"cpu:          {report['cpu_percent']:8.1f} %")
+    print(f"max rss:      {report['max_rss_mb']:8.1f} MB")
+    print(f"api requests: {report['api_requests']:8d}")
+
+
+if __name__ == "__main__":
+    main()
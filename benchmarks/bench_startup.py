@@ -0,0 +1,93 @@
+"""
+Import time profile of the application cold start
+
+Runs `python -X importtime -c "import main"` in fresh interpreters and
+reports the median total and the modules that take the longest to import,
+cumulated per top-level package.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --runs 5 --top 15
+"""
+
+import argparse
+import collections
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+MODULE = "main"
+
+
+def profile(module: str = MODULE) -> tuple[float, dict[str, int]]:
+    """
+    Import the module in a new interpreter
+
+    Returns the wall time and the self import time in microseconds per module.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = int(own)
+    return elapsed, modules
+
+
+def by_package(modules: dict[str, int]) -> dict[str, int]:
+    packages: collections.Counter = collections.Counter()
+    for name, own in modules.items():
+        package = name.split(".")[0]
+        # The application modules are reported one by one
+        packages[name if package in ("src", MODULE) else package] += own
+    return packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="print a JSON report")
+    args = parser.parse_args()
+
+    walls = []
+    imports = []
+    packages: dict[str, list[int]] = collections.defaultdict(list)
+    for _ in range(args.runs):
+        wall, modules = profile()
+        walls.append(wall)
+        imports.append(sum(modules.values()))
+        for package, own in by_package(modules).items():
+            packages[package].append(own)
+
+    medians = sorted(
+        ((package, statistics.median(times)) for package, times in packages.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )[: args.top]
+    report = {
+        "runs": args.runs,
+        "wall_ms": statistics.median(walls) * 1000,
+        "import_ms": statistics.median(imports) / 1000,
+        "packages_ms": {package: own / 1000 for package, own in medians},
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"interpreter start + import {MODULE}: {report['wall_ms']:.1f} ms")
+    print(f"imports:                          {report['import_ms']:.1f} ms")
+    for package, own in report["packages_ms"].items():
+        print(f"  {package:<32} {own:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,45 @@
+import functools
 import logging
 import os
 import sys
-from datetime import datetime
+import time
+from contextlib import contextmanager
 
-from pendulum.tz import timezone
 import serial
 from serial.tools import list_ports
 
-from src.api_client import APIException
-from src.grocycode import GrocyCode, InvalidGrocyCodeException
-from src.ntfy import NtfyHandler
-from src.product import NoStockEntriesException, Product, ProductNotExistsException
+from src.aggregate import AGGREGATE_WINDOW, ScanAggregator
+from src.api_client import APIException, ApiClient
+from src.barcode import BarcodeResolver
+from src.batch import BATCH_IDLE, BatchProcessor
+from src.change_watcher import CHANGE_WATCH_INTERVAL, ChangeWatcher
+from src.dedup import DEDUP_WINDOW, ScanDeduplicator
+from src.grocycode import InvalidGrocyCodeException, UnknownCodeTypeException
+from src.journal import JOURNAL_PATH, Journal, JournalReplayer
+from src.logs import (
+    LOG_DIR,
+    LOG_FORMAT,
+    BackgroundHandler,
+    JsonFormatter,
+    RotatingFileHandler,
+)
+from src.metrics import METRICS_PORT, REGISTRY, MetricsServer
+from src.pipeline import (
+    DuplicateScanException,
+    ScanPipeline,
+    ScanQueuedException,
+    ScanResult,
+    scan_log_message,
+)
+from src.product import NoStockEntriesException, ProductNotExistsException
+from src.product_index import PRODUCT_INDEX_REFRESH, ProductIndex
+from src.scanner import Scanner, ScannerGroup, report_scanner_problem
+from src.stock_cache import STOCK_CACHE_TTL, StockCache
+from src.stock_snapshot import STOCK_SNAPSHOT_INTERVAL, StockSnapshot
+from src.warm_state import STATE_INTERVAL, STATE_PATH, WarmState
+
+# How often to look for scanners that were plugged in or removed, in seconds
+HOTPLUG_INTERVAL = float(os.getenv("HOTPLUG_INTERVAL", "5"))
 
 
 class SerialDeviceNotFoundException(Exception):
@@ -21,16 +50,16 @@ class SerialDeviceNotFoundException(Exception):
     pass
 
 
-def find_serial_device(vid_pid: str):
+def parse_vid_pid(vid_pid: str) -> tuple[int | None, int | None, int | None]:
     """
-    Find serial device
+    Parse a VID:PID[@location_id] entry, "*" matches any VID or PID
     """
-    ports = list(list_ports.grep(vid_pid))
+    vid_pid, _, location = vid_pid.strip().partition("@")
     try:
         vid, pid = vid_pid.split(":")
         # Convert vid and pid to integers to match the output of list_ports
-        vid = int("0x" + vid, 16)
-        pid = int("0x" + pid, 16)
+        vid = None if vid == "*" else int("0x" + vid, 16)
+        pid = None if pid == "*" else int("0x" + pid, 16)
     except ValueError as e:
         if str(e).startswith("too many values to unpack") or str(e).startswith(
             "not enough values to unpack"
@@ -45,70 +74,403 @@ def find_serial_device(vid_pid: str):
         else:
             raise
 
-    for port in ports:
-        if port.vid == vid and port.pid == pid:
-            return port.device
+    if not location:
+        return vid, pid, None
+    if not location.isdigit():
+        raise ValueError(
+            f'Location must be a Grocy location id. VID:PID provided was "{vid_pid}@{location}"'
+        )
+    return vid, pid, int(location)
+
+
+def find_serial_devices(vid_pids: str) -> dict[str, int | None]:
+    """
+    Find the serial devices matching a comma separated list of VID:PID[@location_id]
+
+    Returns the location of each device, keyed by device path
+    """
+    patterns = [parse_vid_pid(vid_pid) for vid_pid in vid_pids.split(",")]
+    devices = {}
+    for port in list_ports.comports():
+        for vid, pid, location_id in patterns:
+            if (vid is None or port.vid == vid) and (pid is None or port.pid == pid):
+                devices.setdefault(port.device, location_id)
+    return devices
+
+
+def find_serial_device(vid_pid: str):
+    """
+    Find serial device
+    """
+    devices = find_serial_devices(vid_pid)
+    if devices:
+        return next(iter(devices))
 
     raise SerialDeviceNotFoundException(f"Serial device {vid_pid} not found")
 
 
-def main():
+def sync_scanners(group: ScannerGroup, vid_pids: str, logger: logging.Logger) -> None:
     """
-    Main function
+    Open scanners that were plugged in and close the ones that went away
+    """
+    devices = find_serial_devices(vid_pids)
+    for name, scanner in list(group.scanners.items()):
+        if name not in devices:
+            group.remove(scanner)
+            report_scanner_problem(
+                group, name, f"Scanner {name} was disconnected", logger
+            )
+        else:
+            # Connected for a whole interval, its next problem is reported again
+            group.reported.discard(name)
+    for device, location_id in devices.items():
+        if device in group.scanners:
+            continue
+        try:
+            port = serial.Serial(device, 19200, timeout=0)
+        except serial.SerialException as e:
+            report_scanner_problem(
+                group, device, f"Could not open scanner {device}: {e}", logger
+            )
+            continue
+        group.add(Scanner(port, name=device, location_id=location_id))
+        logger.info(f"Scanner {device} connected")
+
+
+def configure_logger() -> logging.Logger:
+    """
+    Configure the application logger
     """
-    # Get timezone
-    tz = timezone(os.getenv("TZ", default="UTC"))
-    # Configure the logger
     logger = logging.getLogger(__name__)
-    formatter = logging.Formatter("%(asctime)s [%(name)s] %(levelname)-8s %(message)s")
+    if LOG_FORMAT == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s [%(name)s] %(levelname)-8s %(message)s"
+        )
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setFormatter(formatter)
     stream_handler.setLevel(logging.INFO)
-    logger.addHandler(stream_handler)
+    handlers: list[logging.Handler] = [stream_handler]
 
     # Add file logger if the application is running inside a Docker container
     if os.getenv("AM_I_IN_A_DOCKER_CONTAINER", default=False):
-        file_handler = logging.FileHandler(
-            f"/var/log/grocy_client/{__name__}_{datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}.log"
-        )
+        file_handler = RotatingFileHandler(os.path.join(LOG_DIR, "grocy_client.log"))
         file_handler.setFormatter(formatter)
         file_handler.setLevel(logging.DEBUG)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    # Writing happens on a background thread, so scans never wait on the disk.
+    # Each handler filters by its own level, records none of them takes are
+    # dropped before being queued
+    logger.setLevel(logging.DEBUG)
+    background_handler = BackgroundHandler(*handlers)
+    background_handler.setLevel(min(handler.level for handler in handlers))
+    logger.addHandler(background_handler)
+    REGISTRY.register_stats("grocy_client_logging", background_handler.stats)
 
     # Add a Ntfy handler if the server was specified
     if os.getenv("NTFY_SERVER", default=False):
+        from src.ntfy import NtfyHandler
+
         ntfy_handler = NtfyHandler()
         ntfy_formatter = logging.Formatter("%(levelname)s - %(message)s")
         ntfy_handler.setFormatter(ntfy_formatter)
         ntfy_handler.setLevel(logging.WARNING)
         logger.addHandler(ntfy_handler)
+        REGISTRY.register_stats("grocy_client_ntfy", ntfy_handler.stats)
+
+    return logger
+
+
+def create_pipeline(logger: logging.Logger) -> ScanPipeline:
+    """
+    Create the scan pipeline and the services it relies on
+    """
+    # One client for the whole process so scans reuse pooled connections
+    api_client = ApiClient()
+    stock_cache = StockCache() if STOCK_CACHE_TTL > 0 else None
+    product_index = (
+        ProductIndex(api_client=api_client, logger=logger)
+        if PRODUCT_INDEX_REFRESH > 0
+        else None
+    )
+    barcode_resolver = BarcodeResolver(api_client=api_client)
+
+    # Start from what the previous run knew, rather than from an empty cache
+    warm_state = None
+    if STATE_INTERVAL > 0 and (
+        os.getenv("STATE_PATH") or os.getenv("AM_I_IN_A_DOCKER_CONTAINER")
+    ):
+        warm_state = WarmState(
+            STATE_PATH,
+            api_client=api_client,
+            stock_cache=stock_cache,
+            product_index=product_index,
+            barcode_resolver=barcode_resolver,
+            logger=logger,
+        )
+        if warm_state.restore():
+            logger.info(f"Restored the state saved in {STATE_PATH}")
+        warm_state.start()
+
+    # Refresh cached data when Grocy changed, rather than on a timer
+    change_watcher = (
+        ChangeWatcher(api_client=api_client, logger=logger)
+        if CHANGE_WATCH_INTERVAL > 0
+        else None
+    )
+
+    # Fill the cache with the whole stock at once instead of a request per scan
+    stock_snapshot = None
+    if stock_cache is not None and STOCK_SNAPSHOT_INTERVAL > 0:
+        stock_snapshot = StockSnapshot(
+            stock_cache,
+            api_client=api_client,
+            interval=0 if change_watcher is not None else STOCK_SNAPSHOT_INTERVAL,
+            logger=logger,
+        )
+        stock_snapshot.start()
+
+    # Queue scans on disk while Grocy is unreachable, they are replayed in order
+    journal = None
+    if os.getenv("JOURNAL_PATH") or os.getenv("AM_I_IN_A_DOCKER_CONTAINER"):
+        journal = Journal(JOURNAL_PATH)
+        JournalReplayer(
+            journal, api_client=api_client, stock_cache=stock_cache, logger=logger
+        ).start()
+
+    deduplicator = ScanDeduplicator() if DEDUP_WINDOW > 0 else None
+
+    # Know the products up front, so bad codes are rejected without a request,
+    # a restored product list is only fetched again if Grocy changed since
+    if product_index is not None:
+        try:
+            product_index.refresh()
+        except APIException as e:
+            logger.warning(f"Could not load the product list, will retry: {e}")
+        if change_watcher is None:
+            product_index.start()
+
+    if change_watcher is not None:
+        for component in (stock_cache, stock_snapshot, product_index):
+            if component is not None:
+                change_watcher.subscribe(component.on_change)
+        change_watcher.start()
+
+    for prefix, component in (
+        ("grocy_client_api_circuit", api_client.circuit_breaker),
+        ("grocy_client_stock_cache", stock_cache),
+        ("grocy_client_journal", journal),
+        ("grocy_client_dedup", deduplicator),
+        ("grocy_client_product_index", product_index),
+        ("grocy_client_stock_snapshot", stock_snapshot),
+        ("grocy_client_barcode_cache", barcode_resolver),
+        ("grocy_client_warm_state", warm_state),
+        ("grocy_client_change_watcher", change_watcher),
+    ):
+        if component is not None:
+            REGISTRY.register_stats(prefix, component.stats)
+
+    return ScanPipeline(
+        api_client=api_client,
+        stock_cache=stock_cache,
+        journal=journal,
+        deduplicator=deduplicator,
+        product_index=product_index,
+        barcode_resolver=barcode_resolver,
+    )
+
 
-    # Get the barcode scanner device
+@contextmanager
+def log_scan_errors(logger: logging.Logger):
+    """
+    Log the errors of processing one scan, so the next scan can be handled
+    """
+    try:
+        yield
+    except DuplicateScanException as e:
+        logger.debug(str(e))
+    except (
+        InvalidGrocyCodeException,
+        NoStockEntriesException,
+        ProductNotExistsException,
+        ScanQueuedException,
+        UnknownCodeTypeException,
+    ) as e:
+        logger.warning(str(e))
+    except APIException as e:
+        logger.debug("Stacktrace", exc_info=True)
+        logger.exception(str(e))
+
+
+def log_scan_results(results: list[ScanResult], logger: logging.Logger) -> None:
+    for result in results:
+        if result.status == "ignored":
+            logger.debug(result.message)
+        elif result.status in ("queued", "failed"):
+            logger.warning(f"{result.code}: {result.message}")
+
+
+def run(group: ScannerGroup, pipeline: ScanPipeline, logger: logging.Logger) -> None:
+    """
+    Process the scanned codes one after the other
+    """
+    vid_pids = os.getenv("VID_PID", "")
+    aggregator = None
+    if AGGREGATE_WINDOW > 0:
+        aggregator = ScanAggregator(pipeline, logger=logger)
+        REGISTRY.register_stats("grocy_client_aggregate", aggregator.stats)
+    next_sync = time.monotonic() + HOTPLUG_INTERVAL
+    while True:
+        for scanner, code in group.read_codes():
+            logger.debug(scan_log_message(code, scanner.location_id))
+            if aggregator is not None:
+                log_scan_results(
+                    aggregator.add(code, location_id=scanner.location_id), logger
+                )
+                continue
+            with log_scan_errors(logger):
+                pipeline.process(code, location_id=scanner.location_id)
+        if aggregator is not None:
+            # Reads time out, so a group is sent soon after its window ended
+            log_scan_results(aggregator.flush_expired(), logger)
+        if time.monotonic() >= next_sync:
+            sync_scanners(group, vid_pids, logger)
+            next_sync = time.monotonic() + HOTPLUG_INTERVAL
+
+
+def run_batch(
+    group: ScannerGroup, pipeline: ScanPipeline, logger: logging.Logger
+) -> None:
+    """
+    Process bursts of scans concurrently and report each burst once it is done
+    """
+    vid_pids = os.getenv("VID_PID", "")
+    batch = BatchProcessor(pipeline, logger=logger)
+    next_sync = time.monotonic() + HOTPLUG_INTERVAL
+    last_scan = None
     try:
-        device = find_serial_device(os.getenv("VID_PID", ""))
+        while True:
+            codes = group.read_codes()
+            for scanner, code in codes:
+                logger.debug(scan_log_message(code, scanner.location_id))
+                batch.submit(code, location_id=scanner.location_id)
+            if codes:
+                last_scan = time.monotonic()
+            elif last_scan is not None and time.monotonic() - last_scan >= BATCH_IDLE:
+                summary = batch.flush()
+                # One notification for the whole batch, only when something failed
+                level = logging.WARNING if summary.failures else logging.INFO
+                logger.log(level, str(summary))
+                last_scan = None
+            if time.monotonic() >= next_sync:
+                sync_scanners(group, vid_pids, logger)
+                next_sync = time.monotonic() + HOTPLUG_INTERVAL
+    finally:
+        batch.close()
+
+
+async def run_async(
+    group: ScannerGroup, pipeline: ScanPipeline, logger: logging.Logger
+) -> None:
+    """
+    Process the scanned codes concurrently, repeated scans of a code stay in order
+    """
+    import asyncio
+
+    vid_pids = os.getenv("VID_PID", "")
+    pending: dict[str, asyncio.Task] = {}
+
+    async def handle(
+        code: str, location_id: int | None, previous: asyncio.Task | None
+    ) -> None:
+        if previous:
+            await previous
+        with log_scan_errors(logger):
+            await pipeline.process_async(
+                code, location_id=location_id, deduplicate=False
+            )
+
+    def forget(code: str, task: asyncio.Task) -> None:
+        if pending.get(code) is task:
+            del pending[code]
+
+    async def watch_devices() -> None:
+        while True:
+            await asyncio.sleep(HOTPLUG_INTERVAL)
+            sync_scanners(group, vid_pids, logger)
+
+    watcher = asyncio.create_task(watch_devices())
+    try:
+        async for scanner, code in group.async_codes():
+            logger.debug(scan_log_message(code, scanner.location_id))
+            # A repeat is judged on arrival, not after the scans it waits for
+            if pipeline.is_duplicate(code):
+                logger.debug(f"Ignored repeated scan of {code}")
+                continue
+            task = asyncio.create_task(
+                handle(code, scanner.location_id, pending.get(code))
+            )
+            task.add_done_callback(functools.partial(forget, code))
+            pending[code] = task
+    finally:
+        watcher.cancel()
+
+
+def main():
+    """
+    Main function
+    """
+    logger = configure_logger()
+
+    # Get the barcode scanners, more can be plugged in later
+    group = ScannerGroup(logger=logger)
+    try:
+        sync_scanners(group, os.getenv("VID_PID", ""), logger)
     except Exception as e:
         logger.exception(str(e))
         raise e
+    if not group.scanners:
+        logger.warning("No scanner found yet, waiting for one to be plugged in")
 
-    with serial.Serial(device, 19200, timeout=0) as ser:
-        logger.info("App started, watiting for barcode input")
-        while True:
-            barcode = ser.readline()
-            barcode = barcode.strip()
-            if len(barcode) > 0:
-                try:
-                    grocycode = GrocyCode(barcode.decode())
-                    product: Product = grocycode.get_product()
-                    product.open_or_consume()
-                except (
-                    InvalidGrocyCodeException,
-                    NoStockEntriesException,
-                    ProductNotExistsException,
-                ) as e:
-                    logger.warning(str(e))
-                except APIException as e:
-                    logger.debug("Stacktrace", exc_info=True)
-                    logger.exception(str(e))
+    pipeline = create_pipeline(logger)
+
+    if METRICS_PORT:
+        MetricsServer().start()
+        logger.info(f"Serving metrics on port {METRICS_PORT}")
+
+    # Accept scans forwarded by other hosts, they share this pipeline. The
+    # servers are only imported when a port is set
+    if int(os.getenv("GATEWAY_HTTP_PORT", "0")) or int(
+        os.getenv("GATEWAY_TCP_PORT", "0")
+    ):
+        from src.gateway import GATEWAY_HTTP_PORT, GATEWAY_TCP_PORT, Gateway
+
+        gateway = Gateway(
+            pipeline,
+            http_port=GATEWAY_HTTP_PORT or None,
+            tcp_port=GATEWAY_TCP_PORT or None,
+            logger=logger,
+        ).start()
+        REGISTRY.register_stats("grocy_client_gateway", gateway.stats)
+        logger.info(
+            f"Gateway accepting scans on HTTP port {GATEWAY_HTTP_PORT or '-'}"
+            f" and TCP port {GATEWAY_TCP_PORT or '-'}"
+        )
+
+    logger.info("App started, watiting for barcode input")
+    try:
+        if os.getenv("BATCH_MODE", default=False):
+            run_batch(group, pipeline, logger)
+        elif os.getenv("ASYNC_MODE", default=False):
+            import asyncio
+
+            asyncio.run(run_async(group, pipeline, logger))
+        else:
+            run(group, pipeline, logger)
+    finally:
+        group.close()
 
 
 if __name__ == "__main__":
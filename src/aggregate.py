@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+from typing import Hashable
+
+from src.grocycode import (
+    CodeType,
+    InvalidGrocyCodeException,
+    UnknownCodeTypeException,
+    parse,
+)
+from src.pipeline import ScanPipeline, ScanResult
+
+# Repeat scans of a product this close to each other, in seconds, are sent to
+# Grocy as one transaction of the summed amount, 0 sends every scan on its own
+AGGREGATE_WINDOW = float(os.getenv("AGGREGATE_WINDOW", "0"))
+
+# Only stock actions take an amount, other codes are processed right away
+AGGREGATED_TYPES = (CodeType.PRODUCT, CodeType.BARCODE)
+
+
+class ScanAggregator:
+    """
+    Merges consecutive scans of the same product into one amount-N scan
+
+    Scanning six cans in a row then costs one decision and one consume instead
+    of six, or an open of the first can and a consume of the other five when
+    none was opened yet. A group is sent when no matching scan came within the
+    window, or as soon as another code is scanned, so scans are still processed
+    in their order.
+    """
+
+    def __init__(
+        self,
+        pipeline: ScanPipeline,
+        window: float = AGGREGATE_WINDOW,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.window = window
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.scans = 0
+        self.transactions = 0
+        self._key: tuple[Hashable, int | None] | None = None
+        self._code = ""
+        self._location_id: int | None = None
+        self._amount = 0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, code: str, location_id: int | None = None) -> list[ScanResult]:
+        """
+        Add a scan, return the outcome of the scans it caused to be processed
+        """
+        try:
+            grocycode = parse(code)
+        except (InvalidGrocyCodeException, UnknownCodeTypeException):
+            grocycode = None
+        with self._lock:
+            if grocycode is None or grocycode.type not in AGGREGATED_TYPES:
+                # Keep the order, the pending group goes first
+                results = self._flush()
+                results.append(self.pipeline.try_process(code, location_id))
+                return results
+            deduplicator = self.pipeline.deduplicator
+            if deduplicator is not None and deduplicator.is_duplicate(grocycode.key):
+                return [ScanResult(code, "ignored", f"Ignored repeated scan of {code}")]
+            key = (grocycode.key, location_id)
+            now = time.monotonic()
+            results = []
+            if key != self._key or now - self._last >= self.window:
+                results = self._flush()
+                self._key, self._code, self._location_id = key, code, location_id
+            self._amount += 1
+            self._last = now
+            self.scans += 1
+            return results
+
+    def flush_expired(self) -> list[ScanResult]:
+        """
+        Process the pending group if no matching scan came within the window
+        """
+        with self._lock:
+            if self._key is None or time.monotonic() - self._last < self.window:
+                return []
+            return self._flush()
+
+    def flush(self) -> list[ScanResult]:
+        with self._lock:
+            return self._flush()
+
+    def _flush(self) -> list[ScanResult]:
+        if self._key is None:
+            return []
+        code, location_id, amount = self._code, self._location_id, self._amount
+        self._key, self._amount = None, 0
+        self.transactions += 1
+        if amount > 1:
+            self.logger.debug(f"Merged {amount} scans of {code}")
+        # Repeats were dropped when they were added
+        return [self.pipeline.try_process(code, location_id, amount, deduplicate=False)]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "scans": self.scans,
+                "transactions": self.transactions,
+                "pending": self._amount,
+            }
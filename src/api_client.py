@@ -1,46 +1,471 @@
 import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from src.metrics import Counter, Gauge, Histogram
+
+POOL_SIZE = int(os.getenv("API_POOL_SIZE", "4"))
+CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "10"))
+# Connections idle for longer than this are dropped and re-established, reverse
+# proxies tend to silently close idle keep-alive connections
+IDLE_TIMEOUT = float(os.getenv("API_IDLE_TIMEOUT", "60"))
+# Requests that may safely be sent again are retried with jittered exponential
+# backoff, as long as the whole request stays within the deadline
+RETRIES = int(os.getenv("API_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.2"))
+RETRY_MAX_BACKOFF = float(os.getenv("API_RETRY_MAX_BACKOFF", "2"))
+DEADLINE = float(os.getenv("API_DEADLINE", "15"))
+# After this many failures in a row, requests fail fast for the reset timeout
+CIRCUIT_THRESHOLD = int(os.getenv("API_CIRCUIT_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("API_CIRCUIT_RESET_TIMEOUT", "30"))
+
+
+API_LATENCY = Histogram(
+    "grocy_client_api_request_seconds",
+    "Latency of Grocy API requests",
+    ("method", "endpoint"),
+)
+API_IN_FLIGHT = Gauge(
+    "grocy_client_api_requests_in_flight", "Grocy API requests waiting for a response"
+)
+API_ERRORS = Counter(
+    "grocy_client_api_errors_total", "Failed Grocy API requests", ("type",)
+)
+# Failures that are dealt with, e.g. logged and retried later, rather than raised
+SUPPRESSED_ERRORS = Counter(
+    "grocy_client_suppressed_errors_total",
+    "Errors handled without being raised, by component and exception",
+    ("component", "type"),
+)
+API_RETRIES = Counter(
+    "grocy_client_api_retries_total", "Grocy API requests sent again", ("endpoint",)
+)
+
+# Ids and barcodes are replaced so that endpoints can be used as metric labels
+ENDPOINT_PATTERNS = (
+    (re.compile(r"/by-barcode/[^/]+"), "/by-barcode/{barcode}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{id}"),
+)
+
+
+def endpoint_of(path: str) -> str:
+    endpoint = path.split("?")[0]
+    for pattern, replacement in ENDPOINT_PATTERNS:
+        endpoint = pattern.sub(replacement, endpoint)
+    return endpoint
 
 
 class APIException(Exception):
-    def __init__(self, message: str, status_code: int | None = None) -> None:
+    # Whether sending the same request later may succeed
+    retryable = False
+
+    def __init__(
+        self,
+        message: str,
+        status_code: int | None = None,
+        payload: object = None,
+    ) -> None:
         self.message = message
         self.status_code = status_code
+        self.payload = payload
+        # Method of the request that failed, None when no request was sent
+        self.method: str | None = None
+        # Items an action of several requests booked before this one failed
+        self.booked = 0
 
     def __str__(self) -> str:
         return self.message
 
 
+class UnavailableError(APIException):
+    """
+    Grocy could not be reached or failed to handle the request
+    """
+
+    retryable = True
+
+
+class CircuitOpenError(UnavailableError):
+    """
+    The request was not sent, Grocy kept failing
+    """
+
+
+class ProductNotFoundError(APIException):
+    pass
+
+
+class NotEnoughStockError(APIException):
+    """
+    There is nothing (left) to open or consume
+    """
+
+    pass
+
+
+def never_sent(e: APIException) -> bool:
+    """
+    Whether the failed request certainly never left this process
+
+    Only then can a write be sent again without risking Grocy applying it
+    twice. A connection that broke after the request was written, like a
+    pooled keep-alive connection the server dropped, raises a ConnectionError
+    too, so the cause of a ConnectionError has to be a failed connect.
+    """
+    if isinstance(e, CircuitOpenError):
+        return True
+    cause = e.__cause__
+    if isinstance(cause, requests.ConnectTimeout):
+        return True
+    if not isinstance(cause, requests.ConnectionError) or not cause.args:
+        return False
+    reason = cause.args[0]
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
+
+
+class ErrorRule(NamedTuple):
+    status_codes: range | tuple[int, ...]
+    message: re.Pattern | None
+    exception: type[APIException]
+
+
+# The first rule matching the status and the error message applies
+ERROR_RULES = (
+    ErrorRule(
+        range(400, 500),
+        re.compile(r"^(Product does not exist or is inactive|No product with barcode)"),
+        ProductNotFoundError,
+    ),
+    ErrorRule(
+        range(400, 500),
+        re.compile(
+            r"^(No transaction was found by the given transaction id"
+            r"|Amount to be consumed cannot be > current stock amount)"
+        ),
+        NotEnoughStockError,
+    ),
+    ErrorRule((408, 429), None, UnavailableError),
+    ErrorRule(range(500, 600), None, UnavailableError),
+)
+
+
+def classify_error(
+    message: str, status_code: int | None = None, payload: object = None
+) -> APIException:
+    """
+    Return the typed exception for an error answered by Grocy
+    """
+    if status_code is None:
+        return UnavailableError(message, payload=payload)
+    for rule in ERROR_RULES:
+        if status_code in rule.status_codes and (
+            rule.message is None or rule.message.match(message)
+        ):
+            return rule.exception(message, status_code=status_code, payload=payload)
+    return APIException(message, status_code=status_code, payload=payload)
+
+
+def _parse_error(response: requests.Response) -> APIException:
+    """
+    Turn an error response into a typed APIException, whatever its body
+
+    Grocy answers with a JSON error message, but a reverse proxy in front of it
+    may answer with an HTML page.
+    """
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = response.text
+    if isinstance(payload, dict) and payload.get("error_message"):
+        message = str(payload["error_message"])
+    else:
+        message = f"HTTP {response.status_code} {response.reason or ''}".strip()
+    return classify_error(message, status_code=response.status_code, payload=payload)
+
+
+class CircuitBreaker:
+    """
+    Fails requests fast while Grocy keeps failing
+
+    Opens after threshold failures in a row. Once the reset timeout has passed,
+    a single request is let through to find out whether Grocy is back.
+    """
+
+    def __init__(
+        self,
+        threshold: int = CIRCUIT_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                not self._trial
+                and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self._trial = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError("Grocy is unavailable, requests are paused")
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if success:
+                self.failures = 0
+                self._opened_at = None
+                return
+            self.failures += 1
+            if self._opened_at is not None or self.failures >= self.threshold:
+                if self._opened_at is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "open": int(self._opened_at is not None),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class SessionPool:
+    """
+    Keep-alive HTTP session with a bounded connection pool, shared by all clients
+    """
+
+    def __init__(
+        self, pool_size: int = POOL_SIZE, idle_timeout: float = IDLE_TIMEOUT
+    ) -> None:
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._session: requests.Session | None = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_session(self) -> requests.Session:
+        with self._lock:
+            now = time.monotonic()
+            if self._session and now - self._last_used > self.idle_timeout:
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = self._create_session()
+            self._last_used = now
+            return self._session
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session:
+                self._session.close()
+                self._session = None
+
+
+_session_pool: SessionPool | None = None
+_session_pool_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_session_pool() -> SessionPool:
+    """
+    Return the process-wide session pool, creating it on first use
+    """
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool()
+        return _session_pool
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the process-wide executor running requests for async callers
+
+    It has as many workers as the session pool has connections.
+    """
+    global _executor
+    with _session_pool_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=POOL_SIZE, thread_name_prefix="api"
+            )
+        return _executor
+
+
 class ApiClient:
-    def __init__(self, api_url: str | None = None, api_key: str | None = None) -> None:
+    def __init__(
+        self,
+        api_url: str | None = None,
+        api_key: str | None = None,
+        session_pool: SessionPool | None = None,
+        timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        retries: int = RETRIES,
+        deadline: float = DEADLINE,
+        circuit_breaker: CircuitBreaker | None = None,
+    ) -> None:
         self.api_url: str = api_url if api_url else os.getenv("API_URL")  # type: ignore
         self.api_key: str = api_key if api_key else os.getenv("API_KEY")  # type: ignore
         if not self.api_key or not self.api_url:
             raise ValueError("API_URL and/or API_KEY is not set")
+        self.session_pool = session_pool if session_pool else get_session_pool()
+        self.timeout = timeout
+        self.retries = retries
+        self.deadline = deadline
+        self.circuit_breaker = circuit_breaker if circuit_breaker else CircuitBreaker()
 
-    def get(self, path: str) -> dict:
-        response = requests.get(
-            url=f"{self.api_url}{path}", headers={"GROCY-API-KEY": self.api_key}
-        )
-        if response.status_code != 200:
+    def _send(
+        self, method: str, path: str, deadline: float, raw: bool = False, **kwargs
+    ) -> dict:
+        endpoint = endpoint_of(path)
+        remaining = max(deadline - time.monotonic(), 0.01)
+        timeout = (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+        with API_IN_FLIGHT.track_inprogress(), API_LATENCY.time(
+            method=method.upper(), endpoint=endpoint
+        ):
+            try:
+                response = getattr(self.session_pool.get_session(), method)(
+                    url=f"{self.api_url}{path}",
+                    headers={"GROCY-API-KEY": self.api_key},
+                    timeout=timeout,
+                    **kwargs,
+                )
+            except requests.RequestException as e:
+                API_ERRORS.inc(type=type(e).__name__)
+                raise UnavailableError(f"Grocy is unreachable: {e}") from e
+        if not 200 <= response.status_code < 300:
+            API_ERRORS.inc(type=f"HTTP {response.status_code}")
+            raise _parse_error(response)
+        if raw:
+            return response.content
+        if response.status_code == 204:
+            return {}
+        try:
+            return response.json()
+        except ValueError as e:
+            API_ERRORS.inc(type="InvalidResponse")
             raise APIException(
-                message=response.json()["error_message"],
-                status_code=response.status_code,
-            )
+                f"Invalid response from Grocy: {e}", status_code=response.status_code
+            ) from e
+
+    def _retry_delay(
+        self, method: str, e: APIException, attempt: int, deadline: float
+    ) -> float | None:
+        """
+        How long to wait before sending the request again, None to give up
+        """
+        if attempt >= self.retries:
+            return None
+        # An open or consume that may have reached Grocy must not be repeated
+        if method != "get" and not never_sent(e):
+            return None
+        if not e.retryable:
+            return None
+        delay = random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2**attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _request(self, method: str, path: str, raw: bool = False, **kwargs) -> dict:
+        self.circuit_breaker.before_request()
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                result = self._send(method, path, deadline, raw, **kwargs)
+            except APIException as e:
+                e.method = method
+                delay = self._retry_delay(method, e, attempt, deadline)
+                if delay is None:
+                    self.circuit_breaker.record(success=not e.retryable)
+                    raise
+                API_RETRIES.inc(endpoint=endpoint_of(path))
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.circuit_breaker.record(success=True)
+            return result
+
+    def get(self, path: str) -> dict:
+        return self._request("get", path)
 
-        return response.json()
+    def get_raw(self, path: str) -> bytes:
+        """
+        Get the undecoded body, for callers that parse it themselves
+        """
+        return self._request("get", path, raw=True)  # type: ignore
 
     def post(self, path: str, data: dict) -> dict:
-        response = requests.post(
-            url=f"{self.api_url}{path}",
-            json=data,
-            headers={"GROCY-API-KEY": self.api_key},
-        )
-        if response.status_code != 200:
-            raise APIException(
-                message=response.json()["error_message"],
-                status_code=response.status_code,
-            )
+        return self._request("post", path, json=data)
+
 
-        return response.json()
+class AsyncApiClient:
+    """
+    Awaitable interface to an ApiClient
+
+    Requests run on a shared executor sized to the connection pool, so async and
+    sync callers share the same keep-alive connections.
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient | None = None,
+        executor: ThreadPoolExecutor | None = None,
+    ) -> None:
+        self.api_client = api_client if api_client else ApiClient()
+        self.executor = executor if executor else get_executor()
+
+    async def get(self, path: str) -> dict:
+        # asyncio is slow to import and only needed in async mode
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.api_client.get, path)
+
+    async def get_raw(self, path: str) -> bytes:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.api_client.get_raw, path)
+
+    async def post(self, path: str, data: dict) -> dict:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.api_client.post, path, data
+        )
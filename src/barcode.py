@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import OrderedDict
+
+from src.api_client import ApiClient, AsyncApiClient
+
+# Number of barcodes whose product is remembered, so repeat scans skip Grocy
+BARCODE_CACHE_SIZE = int(os.getenv("BARCODE_CACHE_SIZE", "1024"))
+
+
+class BarcodeResolver:
+    """
+    Finds the product of a plain EAN/UPC barcode
+
+    Grocy is asked once per barcode, the answer is kept for the most recently
+    scanned barcodes.
+    """
+
+    def __init__(
+        self, api_client: ApiClient | None = None, max_size: int = BARCODE_CACHE_SIZE
+    ) -> None:
+        self.api_client = api_client if api_client else ApiClient()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._products: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, barcode: str) -> str:
+        return f"/api/stock/products/by-barcode/{barcode}"
+
+    def _cached(self, barcode: str) -> int | None:
+        with self._lock:
+            product_id = self._products.get(barcode)
+            if product_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._products.move_to_end(barcode)
+            return product_id
+
+    def peek(self, barcode: str) -> int | None:
+        """
+        The remembered product of the barcode, None when Grocy has to be asked
+        """
+        with self._lock:
+            return self._products.get(barcode)
+
+    def _remember(self, barcode: str, details: dict) -> int:
+        product_id = int(details["product"]["id"])
+        with self._lock:
+            self._products[barcode] = product_id
+            if len(self._products) > self.max_size:
+                self._products.popitem(last=False)
+        return product_id
+
+    def resolve(self, barcode: str) -> int:
+        """
+        Return the id of the product with the barcode
+
+        Raises ProductNotFoundError when Grocy has no product with it.
+        """
+        product_id = self._cached(barcode)
+        if product_id is None:
+            product_id = self._remember(
+                barcode, self.api_client.get(path=self._path(barcode))
+            )
+        return product_id
+
+    async def resolve_async(self, barcode: str) -> int:
+        product_id = self._cached(barcode)
+        if product_id is None:
+            product_id = self._remember(
+                barcode,
+                await AsyncApiClient(self.api_client).get(path=self._path(barcode)),
+            )
+        return product_id
+
+    def dump(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._products)
+
+    def restore(self, products: dict[str, int]) -> None:
+        with self._lock:
+            for barcode, product_id in products.items():
+                self._products.setdefault(barcode, product_id)
+            while len(self._products) > self.max_size:
+                self._products.popitem(last=False)
+
+    def invalidate(self, barcode: str) -> None:
+        with self._lock:
+            self._products.pop(barcode, None)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._products),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
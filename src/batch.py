@@ -0,0 +1,125 @@
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+
+from src.pipeline import ScanPipeline, ScanQueuedException, product_key
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# A batch ends when no code was scanned for this long, in seconds
+BATCH_IDLE = float(os.getenv("BATCH_IDLE", "5"))
+
+_STOP = object()
+
+
+@dataclass
+class BatchSummary:
+    done: int = 0
+    queued: int = 0
+    ignored: int = 0
+    failures: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.done + self.queued + self.ignored + len(self.failures)
+
+    def __str__(self) -> str:
+        lines = [
+            f"Batch of {self.total} scans: {self.done} done, {self.queued} queued,"
+            f" {len(self.failures)} failed"
+        ]
+        lines.extend(f"{code}: {error}" for code, error in self.failures)
+        return "\n".join(lines)
+
+
+class BatchProcessor:
+    """
+    Processes bursts of scans concurrently over a fixed number of workers
+
+    Scans are routed to a worker by product, so scans of the same product are
+    processed in order while different products are sent to Grocy in parallel.
+    The outcome of every scan is collected in one summary per batch.
+    """
+
+    def __init__(
+        self,
+        pipeline: ScanPipeline,
+        workers: int = BATCH_WORKERS,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self._summary = BatchSummary()
+        self._outstanding = 0
+        self._condition = threading.Condition()
+        self._queues: list[queue.Queue] = [queue.Queue() for _ in range(workers)]
+        self._threads = [
+            threading.Thread(
+                target=self._run, args=(work,), name=f"batch-{index}", daemon=True
+            )
+            for index, work in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _route(self, code: str) -> int:
+        key = product_key(code, self.pipeline.barcode_resolver)
+        return hash(key) % len(self._queues)
+
+    def submit(self, code: str, location_id: int | None = None) -> None:
+        # A repeat is judged on arrival, its product may be busy for a while
+        if self.pipeline.is_duplicate(code):
+            with self._condition:
+                self._summary.ignored += 1
+            return
+        work = self._queues[self._route(code)]
+        with self._condition:
+            self._outstanding += 1
+        work.put((code, location_id))
+
+    def pending(self) -> int:
+        with self._condition:
+            return self._outstanding
+
+    def flush(self, timeout: float | None = None) -> BatchSummary:
+        """
+        Wait for the submitted scans and return their summary, starting a new batch
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._outstanding == 0, timeout)
+            summary, self._summary = self._summary, BatchSummary()
+        return summary
+
+    def _process(self, code: str, location_id: int | None) -> None:
+        try:
+            self.pipeline.process(code, location_id=location_id, deduplicate=False)
+        except ScanQueuedException:
+            outcome = "queued"
+        except Exception as e:
+            self.logger.info(f"{code}: {e}")
+            with self._condition:
+                self._summary.failures.append((code, str(e)))
+            return
+        else:
+            outcome = "done"
+        with self._condition:
+            setattr(self._summary, outcome, getattr(self._summary, outcome) + 1)
+
+    def _run(self, work: queue.Queue) -> None:
+        while True:
+            item = work.get()
+            if item is _STOP:
+                return
+            try:
+                self._process(*item)
+            finally:
+                with self._condition:
+                    self._outstanding -= 1
+                    self._condition.notify_all()
+
+    def close(self, timeout: float | None = None) -> None:
+        for work in self._queues:
+            work.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, NamedTuple
+
+from src.api_client import SUPPRESSED_ERRORS, APIException, ApiClient
+
+# How often to ask Grocy whether its database changed, in seconds, 0 disables
+# the watcher and the stock and products are refreshed on their own timers
+CHANGE_WATCH_INTERVAL = float(os.getenv("CHANGE_WATCH_INTERVAL", "10"))
+
+
+class ChangeEvent(NamedTuple):
+    changed_time: str
+    # Whether Grocy changed since the previous poll
+    changed: bool
+    # Monotonic time of the previous poll, any change happened after it
+    since: float
+
+
+class ChangeWatcher:
+    """
+    Polls Grocy's database change time and tells subscribers about changes
+
+    The change time is a tiny request, so cached data can be kept until Grocy
+    actually changed instead of being fetched again on a timer. Subscribers are
+    called from the watcher thread after every poll but the first one, which
+    only records where Grocy stands.
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient | None = None,
+        interval: float = CHANGE_WATCH_INTERVAL,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.api_client = api_client if api_client else ApiClient()
+        self.interval = interval
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.polls = 0
+        self.changes = 0
+        self.changed_time: str | None = None
+        self._polled = 0.0
+        self._subscribers: list[Callable[[ChangeEvent], None]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="change-watcher", daemon=True
+        )
+
+    def subscribe(self, callback: Callable[[ChangeEvent], None]) -> None:
+        self._subscribers.append(callback)
+
+    def poll(self) -> bool:
+        """
+        Ask Grocy for its change time and publish it, return whether it changed
+        """
+        polled = time.monotonic()
+        changed_time = self.api_client.get(path="/api/system/db-changed-time")[
+            "changed_time"
+        ]
+        previous, since = self.changed_time, self._polled
+        self.changed_time, self._polled = changed_time, polled
+        self.polls += 1
+        if previous is None:
+            return False
+        event = ChangeEvent(changed_time, changed_time != previous, since)
+        if event.changed:
+            self.changes += 1
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except APIException as e:
+                SUPPRESSED_ERRORS.inc(component="change_watcher", type=type(e).__name__)
+                self.logger.debug(f"Could not refresh after a change in Grocy: {e}")
+        return event.changed
+
+    def stats(self) -> dict[str, int]:
+        return {"polls": self.polls, "changes": self.changes}
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except APIException as e:
+                SUPPRESSED_ERRORS.inc(component="change_watcher", type=type(e).__name__)
+                self.logger.debug(f"Could not get the change time of Grocy: {e}")
+            if self._stop.wait(self.interval):
+                return
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+# Scanners tend to send the same code several times within a few hundred ms
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "0.5"))
+DEDUP_SIZE = 128
+
+
+class ScanDeduplicator:
+    """
+    Suppresses repeats of a scan within a time window
+
+    Only the scans of the last window are remembered, and never more than
+    max_size of them, so memory stays bounded.
+    """
+
+    def __init__(self, window: float = DEDUP_WINDOW, max_size: int = DEDUP_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self.suppressed = 0
+        self._seen: OrderedDict[Hashable, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, key: Hashable) -> bool:
+        """
+        Whether the key was already seen within the window, remember it otherwise
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Oldest scans come first, drop the ones outside of the window
+            while self._seen and now - next(iter(self._seen.values())) >= self.window:
+                self._seen.popitem(last=False)
+            if key in self._seen:
+                self.suppressed += 1
+                return True
+            self._seen[key] = now
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return False
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"suppressed": self.suppressed, "size": len(self._seen)}
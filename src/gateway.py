@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from src.api_client import APIException
+from src.grocycode import InvalidGrocyCodeException, UnknownCodeTypeException
+from src.pipeline import ScanPipeline, ScanResult, product_key
+from src.product import NoStockEntriesException, ProductNotExistsException
+
+GATEWAY_HOST = os.getenv("GATEWAY_HOST", "0.0.0.0")
+# Ports of the HTTP and the line based TCP ingest servers, 0 disables them
+GATEWAY_HTTP_PORT = int(os.getenv("GATEWAY_HTTP_PORT", "0"))
+GATEWAY_TCP_PORT = int(os.getenv("GATEWAY_TCP_PORT", "0"))
+# Scans of the same product are processed one at a time, over this many locks
+GATEWAY_LOCKS = 64
+MAX_BODY_SIZE = 4096
+
+
+# HTTP status acknowledging each outcome, by exception for failed scans
+HTTP_STATUS = {"done": 200, "ignored": 200, "queued": 202}
+HTTP_ERROR_STATUS = (
+    ((InvalidGrocyCodeException, UnknownCodeTypeException), 400),
+    ((ProductNotExistsException,), 404),
+    ((NoStockEntriesException,), 409),
+    ((APIException,), 502),
+)
+
+
+def http_status(result: ScanResult) -> int:
+    if result.error is None:
+        return HTTP_STATUS[result.status]
+    for exceptions, status in HTTP_ERROR_STATUS:
+        if isinstance(result.error, exceptions):
+            return status
+    return 500
+
+
+class Gateway:
+    """
+    Ingest servers for scans forwarded by other hosts
+
+    Several scanner hosts then share this process' connection pool, caches
+    and journal instead of each talking to Grocy on its own. Codes are accepted
+    over HTTP, as POST /scan, and over TCP, one code per line, and each scan is
+    answered with its outcome once it was processed.
+    """
+
+    def __init__(
+        self,
+        pipeline: ScanPipeline,
+        host: str = GATEWAY_HOST,
+        http_port: int | None = None,
+        tcp_port: int | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.results = {"done": 0, "queued": 0, "ignored": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(GATEWAY_LOCKS)]
+        self._servers: list[socketserver.BaseServer] = []
+        if http_port is not None:
+            self._http_server = ThreadingHTTPServer(
+                (host, http_port), self._http_handler_class()
+            )
+            self._http_server.daemon_threads = True
+            self._servers.append(self._http_server)
+        if tcp_port is not None:
+            self._tcp_server = socketserver.ThreadingTCPServer(
+                (host, tcp_port), self._tcp_handler_class(), bind_and_activate=False
+            )
+            self._tcp_server.allow_reuse_address = True
+            self._tcp_server.daemon_threads = True
+            self._tcp_server.server_bind()
+            self._tcp_server.server_activate()
+            self._servers.append(self._tcp_server)
+        # A short poll interval, so that stopping the gateway doesn't wait
+        self._threads = [
+            threading.Thread(
+                target=server.serve_forever, args=(0.05,), name="gateway", daemon=True
+            )
+            for server in self._servers
+        ]
+
+    @property
+    def http_port(self) -> int:
+        return self._http_server.server_address[1]
+
+    @property
+    def tcp_port(self) -> int:
+        return self._tcp_server.server_address[1]
+
+    def start(self) -> "Gateway":
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+    def _lock(self, code: str) -> threading.Lock:
+        key = product_key(code, self.pipeline.barcode_resolver)
+        return self._locks[hash(key) % len(self._locks)]
+
+    def process(self, code: str, location_id: int | None = None) -> ScanResult:
+        """
+        Process one forwarded scan and return its outcome
+        """
+        if self.pipeline.is_duplicate(code):
+            # Judged on arrival, not once the product's earlier scans are done
+            result = ScanResult(code, "ignored", f"Ignored repeated scan of {code}")
+        else:
+            with self._lock(code):
+                result = self.pipeline.try_process(
+                    code, location_id=location_id, deduplicate=False
+                )
+        if result.status in ("queued", "failed"):
+            self.logger.warning(f"{code}: {result.message}")
+        with self._stats_lock:
+            self.results[result.status] += 1
+        return result
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self.results)
+
+    def _http_handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                if url.path != "/scan":
+                    self._respond(404, {"error": "Not found"})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                if length > MAX_BODY_SIZE:
+                    # The body is left unread, the connection can't be reused
+                    self.close_connection = True
+                    self._respond(413, {"error": "Request too large"})
+                    return
+                body = self.rfile.read(length).decode(errors="replace")
+                query = parse_qs(url.query)
+                try:
+                    if self.headers.get_content_type() == "application/json":
+                        data = json.loads(body)
+                        code = str(data["code"])
+                        location_id = data.get("location_id")
+                    else:
+                        code = body.strip()
+                        location_id = query.get("location_id", [None])[0]
+                    location_id = int(location_id) if location_id else None
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    self._respond(400, {"error": "Expected a code"})
+                    return
+                result = gateway.process(code, location_id)
+                self._respond(
+                    http_status(result),
+                    {
+                        "code": result.code,
+                        "status": result.status,
+                        "message": result.message,
+                    },
+                )
+
+            def _respond(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _tcp_handler_class(self):
+        gateway = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            """
+            One scan per line, a code optionally followed by a tab and the id
+            of its location, answered by a line with the outcome
+            """
+
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                for line in self.rfile:
+                    code, _, location = (
+                        line.decode(errors="replace").strip().partition("\t")
+                    )
+                    if not code:
+                        continue
+                    try:
+                        location_id = int(location) if location else None
+                    except ValueError:
+                        self.wfile.write(b"failed Invalid location\n")
+                        continue
+                    result = gateway.process(code, location_id)
+                    self.wfile.write(f"{result}\n".encode())
+
+        return Handler
@@ -1,11 +1,21 @@
+import functools
+import os
 import re
 from enum import Enum
 
+from src.api_client import ApiClient
+from src.metrics import Histogram
 from src.product import Product
+from src.stock_cache import StockCache
 
 
 class CodeType(Enum):
     PRODUCT = "p"
+    BATTERY = "b"
+    CHORE = "c"
+    RECIPE = "r"
+    # Not a grocycode letter, plain EAN/UPC barcodes of a product
+    BARCODE = "barcode"
 
 
 class InvalidGrocyCodeException(Exception):
@@ -20,34 +30,83 @@ class NotAProductException(Exception):
     pass
 
 
-PATTERN = re.compile(r"^grcy:([a-zA-Z]):(\d+)(?::(\w+))?$")
+# Grocycodes and EAN-8, UPC-A, EAN-13 and GTIN-14 barcodes, in a single match
+PATTERN = re.compile(
+    r"^(?:grcy:(?P<type>[a-zA-Z]):(?P<id>\d+)(?::(?P<detail>\w+))?"
+    r"|(?P<barcode>\d{8}|\d{12,14}))$"
+)
+
+# Number of distinct codes whose parsed GrocyCode is kept for repeat scans
+CODE_CACHE_SIZE = int(os.getenv("CODE_CACHE_SIZE", "1024"))
+
+PARSE_LATENCY = Histogram(
+    "grocy_client_code_parse_seconds", "Time spent parsing scanned codes"
+)
 
 
 class GrocyCode:
+    __slots__ = ("type", "id", "detail", "code")
+
     def __init__(self, code: str) -> None:
-        self._parse_code(code)
+        with PARSE_LATENCY.time():
+            self._parse_code(code)
 
     def __str__(self) -> str:
         return self.code
 
+    @property
+    def key(self) -> tuple:
+        """
+        Identifies what the code refers to, whatever its exact spelling
+        """
+        if self.type == CodeType.BARCODE:
+            return (self.type, self.code, None)
+        return (self.type, self.id, self.detail)
+
     def _parse_code(self, code: str) -> None:
         matches = PATTERN.match(code)
         if not matches:
             raise InvalidGrocyCodeException(f"Invalid code: {code}")
+        self.code = code
 
+        if matches["barcode"]:
+            # The product is only known once Grocy resolved the barcode
+            self.type = CodeType.BARCODE
+            self.id = None
+            self.detail = None
+            return
         try:
-            self.type = CodeType(matches[1])
+            self.type = CodeType(matches["type"])
         except ValueError:
             raise UnknownCodeTypeException(
-                f"Unknown code type: '{matches[1]}'"
+                f"Unknown code type: '{matches['type']}'"
             ) from None
-        self.id = int(matches[2])
-        self.detail = matches[3] if len(matches.groups()) == 3 else None
-        self.code = code
-
-    def get_product(self) -> Product:
+        self.id = int(matches["id"])
+        self.detail = matches["detail"]
+
+    def get_product(
+        self,
+        api_client: ApiClient | None = None,
+        stock_cache: StockCache | None = None,
+        location_id: int | None = None,
+    ) -> Product:
         if self.type == CodeType.PRODUCT:
-            return Product(id=self.id, stock_id=self.detail, grocycode=self.code)
+            return Product(
+                id=self.id,
+                stock_id=self.detail,
+                grocycode=self.code,
+                api_client=api_client,
+                stock_cache=stock_cache,
+                location_id=location_id,
+            )
         raise NotAProductException(
             f"Not a product code: '{self.code}', but a {self.type}"
         )
+
+
+@functools.lru_cache(maxsize=CODE_CACHE_SIZE)
+def parse(code: str) -> GrocyCode:
+    """
+    Parse a code, repeated scans of the same code share one GrocyCode
+    """
+    return GrocyCode(code)
@@ -0,0 +1,262 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+from src.api_client import SUPPRESSED_ERRORS, APIException, ApiClient, never_sent
+from src.product import NoStockEntriesException, Product, ProductNotExistsException
+from src.stock_cache import StockCache
+
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "/var/log/grocy_client/journal.sqlite3")
+REPLAY_BACKOFF = float(os.getenv("JOURNAL_REPLAY_BACKOFF", "1"))
+REPLAY_MAX_BACKOFF = float(os.getenv("JOURNAL_REPLAY_MAX_BACKOFF", "300"))
+
+
+class Operation(NamedTuple):
+    id: int
+    action: str
+    product_id: int
+    stock_id: str | None
+    grocycode: str | None
+    amount: float
+    location_id: int | None
+
+
+def is_transient(e: APIException) -> bool:
+    """
+    Whether the error is worth retrying later, i.e. Grocy is down or unreachable
+    """
+    return e.retryable
+
+
+def never_applied(e: APIException) -> bool:
+    """
+    Whether Grocy certainly did not apply the failed request
+
+    Reads can always be sent again. A write that timed out, lost its connection
+    or failed with a server error may have been applied already, sending it
+    again would book the open or consume twice.
+    """
+    return e.method == "get" or never_sent(e)
+
+
+def can_queue(e: APIException) -> bool:
+    """
+    Whether the operation can be journaled and sent once Grocy is back
+    """
+    return is_transient(e) and never_applied(e)
+
+
+class Journal:
+    """
+    Durable, append-only queue of product actions that could not be sent
+
+    Backed by SQLite with synchronous writes, so queued operations survive a
+    crash or a container restart.
+    """
+
+    ACTIONS = ("open", "consume", "open_or_consume")
+
+    def __init__(self, path: str = JOURNAL_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._appended = threading.Event()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS operations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                action TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                stock_id TEXT,
+                grocycode TEXT,
+                amount REAL NOT NULL,
+                created REAL NOT NULL
+            )
+            """)
+        # Journals written before scanners had locations lack the column
+        columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(operations)")
+        ]
+        if "location_id" not in columns:
+            self._connection.execute(
+                "ALTER TABLE operations ADD COLUMN location_id INTEGER"
+            )
+        # Counted in memory, every scan asks and it must not wait on the disk
+        self._pending = self._connection.execute(
+            "SELECT COUNT(*) FROM operations"
+        ).fetchone()[0]
+
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self) -> dict[str, int]:
+        return {"pending": self.pending()}
+
+    def append(self, action: str, product: Product, amount: float = 1) -> int:
+        if action not in self.ACTIONS:
+            raise ValueError(f"Unknown action: '{action}'")
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO operations"
+                " (action, product_id, stock_id, grocycode, amount, created, location_id)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    action,
+                    product.id,
+                    product.stock_id,
+                    product.grocycode,
+                    amount,
+                    time.time(),
+                    product.location_id,
+                ),
+            )
+            self._pending += 1
+        self.wake()
+        return cursor.lastrowid  # type: ignore
+
+    def peek(self) -> Operation | None:
+        """
+        Return the oldest pending operation
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, action, product_id, stock_id, grocycode, amount, location_id"
+                " FROM operations ORDER BY id LIMIT 1"
+            ).fetchone()
+        return Operation(*row) if row else None
+
+    def remove(self, operation_id: int) -> None:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM operations WHERE id = ?", (operation_id,)
+            )
+            self._pending -= cursor.rowcount
+
+    def set_amount(self, operation_id: int, amount: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE operations SET amount = ? WHERE id = ?", (amount, operation_id)
+            )
+
+    def compact(self) -> None:
+        """
+        Reclaim the space of replayed operations
+        """
+        with self._lock:
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._connection.execute("VACUUM")
+
+    def wake(self) -> None:
+        """
+        Wake up whoever waits for new operations
+        """
+        self._appended.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until an operation is appended
+        """
+        appended = self._appended.wait(timeout)
+        self._appended.clear()
+        return appended
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class JournalReplayer:
+    """
+    Background worker sending the journaled operations to Grocy, in order
+
+    The oldest operation is retried with exponential backoff while Grocy is
+    unavailable. Operations Grocy rejects for good are logged and dropped.
+    """
+
+    def __init__(
+        self,
+        journal: Journal,
+        api_client: ApiClient | None = None,
+        stock_cache: StockCache | None = None,
+        logger: logging.Logger | None = None,
+        backoff: float = REPLAY_BACKOFF,
+        max_backoff: float = REPLAY_MAX_BACKOFF,
+    ) -> None:
+        self.journal = journal
+        self.api_client = api_client if api_client else ApiClient()
+        self.stock_cache = stock_cache
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self.journal.wake()
+        self._thread.join(timeout)
+
+    def replay_one(self) -> bool:
+        """
+        Send the oldest operation, return False when it has to be retried later
+        """
+        operation = self.journal.peek()
+        if operation is None:
+            return True
+        product = Product(
+            id=operation.product_id,
+            stock_id=operation.stock_id,
+            grocycode=operation.grocycode,
+            location_id=operation.location_id,
+            api_client=self.api_client,
+            stock_cache=self.stock_cache,
+        )
+        try:
+            if operation.action == "open_or_consume":
+                product.open_or_consume(amount=operation.amount)
+            else:
+                getattr(product, operation.action)(amount=operation.amount)
+        except (APIException, NoStockEntriesException, ProductNotExistsException) as e:
+            SUPPRESSED_ERRORS.inc(component="journal", type=type(e).__name__)
+            if isinstance(e, APIException) and can_queue(e):
+                self.logger.debug(f"Could not replay {operation.action}: {e}")
+                if e.booked:
+                    # Only the rest is sent again
+                    self.journal.set_amount(operation.id, operation.amount - e.booked)
+                return False
+            if isinstance(e, APIException) and is_transient(e):
+                self.logger.warning(
+                    f"Dropped queued {operation.action}, Grocy may have applied it: {e}"
+                )
+            else:
+                self.logger.warning(f"Dropped queued {operation.action}: {e}")
+        self.journal.remove(operation.id)
+        return True
+
+    def _run(self) -> None:
+        replayed = False
+        failures = 0
+        while not self._stop.is_set():
+            if self.journal.peek() is None:
+                if replayed:
+                    self.journal.compact()
+                    self.logger.info("Queued operations were sent to Grocy")
+                    replayed = False
+                self.journal.wait()
+                continue
+            if self.replay_one():
+                replayed = True
+                failures = 0
+                continue
+            delay = min(self.backoff * 2**failures, self.max_backoff)
+            failures += 1
+            self._stop.wait(delay)
@@ -0,0 +1,156 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+LOG_DIR = os.getenv("LOG_DIR", "/var/log/grocy_client")
+# "text" or "json", one JSON object per line is cheaper to ship and parse
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# The log file is rotated when it reaches this size, in bytes, 0 disables it
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+# And at this interval, as understood by TimedRotatingFileHandler
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+# Number of rotated files kept, 0 keeps all of them
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") not in ("", "0", "false")
+# Records waiting to be written, once full new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+def _gzip_namer(name: str) -> str:
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class RotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Writes to a file that is rotated by size and by time
+
+    Rotated files are named after the time of their rotation, compressed if
+    asked to, and only the most recent backup_count of them are kept.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = LOG_MAX_BYTES,
+        when: str = LOG_ROTATE_WHEN,
+        backup_count: int = LOG_BACKUP_COUNT,
+        compress: bool = LOG_COMPRESS,
+    ) -> None:
+        super().__init__(
+            filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self.max_bytes = max_bytes
+        if compress:
+            self.namer = _gzip_namer
+            self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 > self.max_bytes
+
+    def _rotated(self) -> list[str]:
+        # Timestamped names sort in the order they were rotated
+        return sorted(glob.glob(f"{glob.escape(self.baseFilename)}.*"))
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None  # type: ignore
+        now = time.time()
+        name = f"{self.baseFilename}.{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(now))}"
+        dest = self.rotation_filename(name)
+        # Several size rotations may happen within the same second, the suffix
+        # keeps their names sorted
+        index = 0
+        while os.path.exists(dest):
+            index += 1
+            dest = self.rotation_filename(f"{name}_{index:03d}")
+        if os.path.exists(self.baseFilename):
+            self.rotate(self.baseFilename, dest)
+        if self.backupCount > 0:
+            for old in self._rotated()[: -self.backupCount]:
+                os.remove(old)
+        self.rolloverAt = self.computeRollover(int(now))
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room, the queue may be full of records still to be written
+        self.queue.put(self._sentinel)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records over to a thread that writes them to the given handlers
+
+    Logging then never waits on the disk or stdout. The queue is bounded, when
+    the writing thread can't keep up, records are dropped and counted.
+    """
+
+    def __init__(self, *handlers: logging.Handler, queue_size: int = LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self.listener = _Listener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records stay in this process, formatting is left to the writing thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}  # type: ignore
+
+    def close(self) -> None:
+        # Write out what is still queued before the process exits
+        with self._lock:
+            stop, self._stopped = not self._stopped, True
+        if stop:
+            self.listener.stop()
+        super().close()
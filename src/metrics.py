@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """
+    Base of the metrics, values are kept per combination of label values
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: "Registry | None" = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        (registry if registry else REGISTRY).register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: dict[str, str] | None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return (
+            "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+        )
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [
+                f"{self.name}{self._format_labels(key)} {value}"
+                for key, value in self._values.items()
+            ]
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount  # type: ignore
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)  # type: ignore
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount  # type: ignore
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)  # type: ignore
+
+    @contextmanager
+    def track_inprogress(self, **labels: str):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: "Registry | None" = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))  # type: ignore
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))  # type: ignore
+            return sum(counts)
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():  # type: ignore
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    labels = self._format_labels(key, {"le": str(bound)})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = self._format_labels(key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self._collectors: dict[str, Callable[[], dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def register_stats(self, prefix: str, stats: Callable[[], dict[str, int]]) -> None:
+        """
+        Expose the counts of a stats() method as gauges named prefix_<key>
+        """
+        with self._lock:
+            self._collectors[prefix] = stats
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, stats in collectors:
+            for key, value in stats().items():
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer:
+    """
+    Serves the registry in the Prometheus text format on /metrics
+    """
+
+    def __init__(
+        self,
+        host: str = METRICS_HOST,
+        port: int = METRICS_PORT,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,11 +1,32 @@
 import logging
 import os
+import queue
+import threading
+import time
 
 import requests
 
+from src.api_client import SUPPRESSED_ERRORS
+from src.metrics import Histogram
+
+TIMEOUT = float(os.getenv("NTFY_TIMEOUT", "5"))
+QUEUE_SIZE = int(os.getenv("NTFY_QUEUE_SIZE", "100"))
+# Messages arriving within this window are sent as a single notification
+BATCH_WINDOW = float(os.getenv("NTFY_BATCH_WINDOW", "2"))
+MAX_BATCH_SIZE = 20
+CLOSE_TIMEOUT = 10
+
+_STOP = object()
+
+SEND_LATENCY = Histogram(
+    "grocy_client_ntfy_send_seconds", "Time spent sending ntfy notifications"
+)
+
 
 class NtfyClient:
-    def __init__(self, server: str | None = None, topic: str | None = None) -> None:
+    def __init__(
+        self, server: str | None = None, topic: str | None = None, timeout=TIMEOUT
+    ) -> None:
         self.server = server if server else os.getenv("NTFY_SERVER")
         self.topic = topic if topic else os.getenv("NTFY_TOPIC")
         if not self.server:
@@ -16,20 +37,111 @@ class NtfyClient:
         if not self.server.startswith("http"):
             self.server = f"http://{self.server}"
 
-    def send_message(self, message: str) -> None:
-        response = requests.post(url=f"{self.server}/{self.topic}", data=message)
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send_message(self, message: str) -> bool:
+        response = self.session.post(
+            url=f"{self.server}/{self.topic}", data=message, timeout=self.timeout
+        )
         if response.status_code != 200:
-            logging.error(response.json())
+            logging.error(response.text)
+            return False
+        return True
 
 
 class NtfyHandler(logging.StreamHandler):
-    def __init__(self, server=None, topic=None):
+    """
+    Logging handler that sends records to ntfy from a background thread
+
+    Records are queued so logging never waits on the network. Bursts are
+    coalesced into one notification, and records are dropped when the queue
+    is full.
+    """
+
+    def __init__(
+        self,
+        server=None,
+        topic=None,
+        queue_size: int = QUEUE_SIZE,
+        batch_window: float = BATCH_WINDOW,
+    ):
         logging.StreamHandler.__init__(self)
         self.server = server
         self.topic = topic
+        self.batch_window = batch_window
 
         self.ntfy_client = NtfyClient(server=server, topic=topic)
 
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self._stats_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._run, name="ntfy", daemon=True)
+        self._worker.start()
+
     def emit(self, record):
-        msg = self.format(record)
-        self.ntfy_client.send_message(msg)
+        try:
+            msg = self.format(record)
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            self._count(dropped=1)
+        except Exception:
+            self.handleError(record)
+        else:
+            self._count(queued=1)
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {"queued": self.queued, "sent": self.sent, "dropped": self.dropped}
+
+    def _count(self, queued: int = 0, sent: int = 0, dropped: int = 0) -> None:
+        with self._stats_lock:
+            self.queued += queued
+            self.sent += sent
+            self.dropped += dropped
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            msg = self._queue.get()
+            if msg is _STOP:
+                break
+            batch = [msg]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    msg = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if msg is _STOP:
+                    stopping = True
+                    break
+                batch.append(msg)
+            self._send(batch)
+
+    def _send(self, batch: list[str]) -> None:
+        try:
+            with SEND_LATENCY.time():
+                sent = self.ntfy_client.send_message("\n".join(batch))
+        except Exception as e:
+            # Logging the failure could need a notification of its own
+            SUPPRESSED_ERRORS.inc(component="ntfy", type=type(e).__name__)
+            sent = False
+        if sent:
+            self._count(sent=len(batch))
+        else:
+            self._count(dropped=len(batch))
+
+    def close(self):
+        """
+        Send the remaining messages, then stop the worker
+        """
+        if self._worker.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=CLOSE_TIMEOUT)
+            except queue.Full:
+                pass
+            self._worker.join(timeout=CLOSE_TIMEOUT)
+        logging.StreamHandler.close(self)
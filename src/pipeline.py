@@ -0,0 +1,403 @@
+import functools
+import re
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Hashable, NamedTuple
+
+from src.api_client import APIException, ApiClient, ProductNotFoundError, get_executor
+from src.barcode import BarcodeResolver
+from src.dedup import ScanDeduplicator
+from src.grocycode import (
+    CODE_CACHE_SIZE,
+    CodeType,
+    GrocyCode,
+    InvalidGrocyCodeException,
+    UnknownCodeTypeException,
+    parse,
+)
+from src.journal import Journal, can_queue
+from src.metrics import Counter, Gauge, Histogram
+from src.product import NoStockEntriesException, Product, ProductNotExistsException
+from src.product_index import ProductIndex, ProductInfo
+from src.stock_cache import StockCache
+from src.tracking import Battery, Chore, Recipe, Trackable
+
+SCAN_LATENCY = Histogram(
+    "grocy_client_scan_seconds", "Time from a scan to Grocy acknowledging it"
+)
+SCANS_IN_FLIGHT = Gauge("grocy_client_scans_in_flight", "Scans being processed")
+SCAN_ERRORS = Counter(
+    "grocy_client_scan_errors_total", "Scans that failed, by exception", ("type",)
+)
+
+# Matches the line main() logs for every scan
+LOG_PATTERN = re.compile(
+    r"Scanned (?P<code>\S+)(?: at location (?P<location_id>\d+))?$"
+)
+
+TRACKABLES: dict[CodeType, type[Trackable]] = {
+    CodeType.BATTERY: Battery,
+    CodeType.CHORE: Chore,
+    CodeType.RECIPE: Recipe,
+}
+
+
+class Handler(NamedTuple):
+    """
+    What a scan does, in sync and async mode, given its code, location and the
+    number of items it stands for
+    """
+
+    process: Callable[[GrocyCode, int | None, int], None]
+    process_async: Callable[[GrocyCode, int | None, int], Awaitable[None]]
+
+
+def scan_log_message(code: str, location_id: int | None = None) -> str:
+    """
+    The message logged for a scan, in the form read back by LOG_PATTERN
+    """
+    if location_id is None:
+        return f"Scanned {code}"
+    return f"Scanned {code} at location {location_id}"
+
+
+class ScanQueuedException(Exception):
+    pass
+
+
+async def _in_executor(function: Callable, *args) -> object:
+    """
+    Run a blocking call without blocking the event loop
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), function, *args)
+
+
+class DuplicateScanException(Exception):
+    pass
+
+
+# Errors that fail a single scan, the next scans can still be processed
+SCAN_FAILURES = (
+    InvalidGrocyCodeException,
+    UnknownCodeTypeException,
+    NoStockEntriesException,
+    ProductNotExistsException,
+    APIException,
+)
+
+
+class ScanResult(NamedTuple):
+    code: str
+    # "done", "queued", "ignored" or "failed"
+    status: str
+    message: str = ""
+    error: Exception | None = None
+
+    def __str__(self) -> str:
+        return f"{self.status} {self.message}".strip()
+
+
+def product_key(code: str, barcode_resolver: BarcodeResolver | None = None) -> Hashable:
+    """
+    What the scans that have to stay in order share, whatever the stock entry
+
+    A barcode is keyed by its product once the resolver knows it, so it stays
+    in order with the product's grocycodes and other barcodes. Until then, and
+    for codes that can't be parsed, scans of the same code share a key.
+    """
+    try:
+        grocycode = parse(code)
+    except (InvalidGrocyCodeException, UnknownCodeTypeException):
+        return code
+    if grocycode.type == CodeType.BARCODE and barcode_resolver is not None:
+        product_id = barcode_resolver.peek(grocycode.code)
+        if product_id is not None:
+            return (CodeType.PRODUCT, product_id)
+    return grocycode.key[:2]
+
+
+class ScanPipeline:
+    """
+    Turns a scanned code into the matching Grocy action
+
+    Kept apart from the input loop so that any source of codes can feed it.
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient | None = None,
+        stock_cache: StockCache | None = None,
+        journal: Journal | None = None,
+        deduplicator: ScanDeduplicator | None = None,
+        product_index: ProductIndex | None = None,
+        barcode_resolver: BarcodeResolver | None = None,
+    ) -> None:
+        self.api_client = api_client if api_client else ApiClient()
+        self.stock_cache = stock_cache
+        self.journal = journal
+        self.deduplicator = deduplicator
+        self.product_index = product_index
+        self.barcode_resolver = (
+            barcode_resolver if barcode_resolver else BarcodeResolver(self.api_client)
+        )
+        # Products hold no state of their own, repeat scans reuse them
+        self._product = functools.lru_cache(maxsize=CODE_CACHE_SIZE)(self._new_product)
+        # What a scan does, by the type of the scanned code
+        self.handlers: dict[CodeType, Handler] = {
+            CodeType.PRODUCT: Handler(
+                self._process_product, self._process_product_async
+            ),
+            CodeType.BARCODE: Handler(
+                self._process_barcode, self._process_barcode_async
+            ),
+            CodeType.BATTERY: Handler(self._track, self._track_async),
+            CodeType.CHORE: Handler(self._track, self._track_async),
+            CodeType.RECIPE: Handler(self._track, self._track_async),
+        }
+
+    def _new_product(
+        self, code: str, location_id: int | None, product_id: int | None = None
+    ) -> Product:
+        if product_id is not None:
+            # A barcode, the product is the one Grocy resolved it to
+            return Product(
+                id=product_id,
+                api_client=self.api_client,
+                stock_cache=self.stock_cache,
+                location_id=location_id,
+            )
+        return parse(code).get_product(
+            api_client=self.api_client,
+            stock_cache=self.stock_cache,
+            location_id=location_id,
+        )
+
+    def _parse(self, code: str, deduplicate: bool = True) -> GrocyCode:
+        grocycode = parse(code)
+        # Drop repeated scans before doing any request
+        if (
+            deduplicate
+            and self.deduplicator is not None
+            and self.deduplicator.is_duplicate(grocycode.key)
+        ):
+            raise DuplicateScanException(f"Ignored repeated scan of {code}")
+        return grocycode
+
+    def is_duplicate(self, code: str) -> bool:
+        """
+        Whether a scan repeats a recent one, asked as soon as it arrives
+
+        Callers that process scans later or concurrently check here and pass
+        deduplicate=False, so repeats are judged by when they were scanned
+        rather than by when they got their turn.
+        """
+        if self.deduplicator is None:
+            return False
+        try:
+            grocycode = parse(code)
+        except (InvalidGrocyCodeException, UnknownCodeTypeException):
+            # Fails when it is processed, with the reason
+            return False
+        return self.deduplicator.is_duplicate(grocycode.key)
+
+    def _named_product(
+        self,
+        grocycode: GrocyCode,
+        location_id: int | None,
+        product_id: int | None,
+        info: ProductInfo | None,
+    ) -> Product:
+        product = self._product(grocycode.code, location_id, product_id)
+        if info is not None:
+            product.name = info.name
+        return product
+
+    def _queue_behind_pending(
+        self, product: Product, grocycode: GrocyCode, amount: int
+    ) -> None:
+        self.journal.append("open_or_consume", product, amount=amount)  # type: ignore
+        raise ScanQueuedException(f"Grocy is unavailable, queued {grocycode}")
+
+    def _get_product(
+        self,
+        grocycode: GrocyCode,
+        location_id: int | None,
+        amount: int = 1,
+        product_id: int | None = None,
+    ) -> Product:
+        # Unknown and inactive products are rejected without any request
+        info = (
+            self.product_index.check(product_id or grocycode.id)  # type: ignore
+            if self.product_index is not None
+            else None
+        )
+        product = self._named_product(grocycode, location_id, product_id, info)
+        # Keep the order of scans while older ones are still waiting in the journal
+        if self.journal is not None and self.journal.pending():
+            self._queue_behind_pending(product, grocycode, amount)
+        return product
+
+    async def _get_product_async(
+        self,
+        grocycode: GrocyCode,
+        location_id: int | None,
+        amount: int = 1,
+        product_id: int | None = None,
+    ) -> Product:
+        info = (
+            await self.product_index.check_async(
+                product_id or grocycode.id  # type: ignore
+            )
+            if self.product_index is not None
+            else None
+        )
+        product = self._named_product(grocycode, location_id, product_id, info)
+        if self.journal is not None and self.journal.pending():
+            await _in_executor(self._queue_behind_pending, product, grocycode, amount)
+        return product
+
+    def _queue_on_outage(
+        self, e: APIException, product: Product, code: str, amount: int = 1
+    ) -> None:
+        # A write that may have reached Grocy is not sent again, it would be
+        # booked twice
+        if self.journal is not None and can_queue(e):
+            # Only what is left, an item may have been opened before it failed
+            self.journal.append("open_or_consume", product, amount=amount - e.booked)
+            raise ScanQueuedException(f"{e}, queued {code}") from e
+
+    @contextmanager
+    def _instrument(self):
+        with SCANS_IN_FLIGHT.track_inprogress():
+            start = time.perf_counter()
+            try:
+                yield
+            except Exception as e:
+                SCAN_ERRORS.inc(type=type(e).__name__)
+                raise
+            SCAN_LATENCY.observe(time.perf_counter() - start)
+
+    def _process_product(
+        self,
+        grocycode: GrocyCode,
+        location_id: int | None,
+        amount: int = 1,
+        product_id: int | None = None,
+    ) -> None:
+        product = self._get_product(grocycode, location_id, amount, product_id)
+        try:
+            product.open_or_consume(amount=amount)
+        except APIException as e:
+            self._queue_on_outage(e, product, grocycode.code, amount)
+            raise
+
+    async def _process_product_async(
+        self,
+        grocycode: GrocyCode,
+        location_id: int | None,
+        amount: int = 1,
+        product_id: int | None = None,
+    ) -> None:
+        product = await self._get_product_async(
+            grocycode, location_id, amount, product_id
+        )
+        try:
+            await product.open_or_consume_async(amount=amount)
+        except APIException as e:
+            # The journal writes synchronously to disk
+            await _in_executor(
+                self._queue_on_outage, e, product, grocycode.code, amount
+            )
+            raise
+
+    @contextmanager
+    def _unknown_barcode(self, barcode: str):
+        try:
+            yield
+        except ProductNotFoundError as e:
+            raise ProductNotExistsException(f"No product with barcode {barcode}") from e
+
+    def _process_barcode(
+        self, grocycode: GrocyCode, location_id: int | None, amount: int = 1
+    ) -> None:
+        with self._unknown_barcode(grocycode.code):
+            product_id = self.barcode_resolver.resolve(grocycode.code)
+        self._process_product(grocycode, location_id, amount, product_id=product_id)
+
+    async def _process_barcode_async(
+        self, grocycode: GrocyCode, location_id: int | None, amount: int = 1
+    ) -> None:
+        with self._unknown_barcode(grocycode.code):
+            product_id = await self.barcode_resolver.resolve_async(grocycode.code)
+        await self._process_product_async(
+            grocycode, location_id, amount, product_id=product_id
+        )
+
+    def _trackable(self, grocycode: GrocyCode) -> Trackable:
+        return TRACKABLES[grocycode.type](grocycode.id, api_client=self.api_client)
+
+    def _track(
+        self, grocycode: GrocyCode, location_id: int | None, amount: int = 1
+    ) -> None:
+        trackable = self._trackable(grocycode)
+        for _ in range(amount):
+            trackable.track()
+
+    async def _track_async(
+        self, grocycode: GrocyCode, location_id: int | None, amount: int = 1
+    ) -> None:
+        trackable = self._trackable(grocycode)
+        for _ in range(amount):
+            await trackable.track_async()
+
+    def process(
+        self,
+        code: str,
+        location_id: int | None = None,
+        amount: int = 1,
+        deduplicate: bool = True,
+    ) -> None:
+        """
+        Process a scan standing for amount items
+
+        deduplicate=False is for callers that dropped repeated scans already.
+        """
+        with self._instrument():
+            grocycode = self._parse(code, deduplicate)
+            self.handlers[grocycode.type].process(grocycode, location_id, amount)
+
+    def try_process(
+        self,
+        code: str,
+        location_id: int | None = None,
+        amount: int = 1,
+        deduplicate: bool = True,
+    ) -> ScanResult:
+        """
+        Process a scan and return its outcome, rather than raising when it failed
+        """
+        try:
+            self.process(code, location_id, amount, deduplicate)
+        except DuplicateScanException as e:
+            return ScanResult(code, "ignored", str(e))
+        except ScanQueuedException as e:
+            return ScanResult(code, "queued", str(e))
+        except SCAN_FAILURES as e:
+            return ScanResult(code, "failed", str(e), e)
+        return ScanResult(code, "done")
+
+    async def process_async(
+        self,
+        code: str,
+        location_id: int | None = None,
+        amount: int = 1,
+        deduplicate: bool = True,
+    ) -> None:
+        with self._instrument():
+            grocycode = self._parse(code, deduplicate)
+            await self.handlers[grocycode.type].process_async(
+                grocycode, location_id, amount
+            )
@@ -1,5 +1,28 @@
-from pydantic import BaseModel
-from src.api_client import APIException, ApiClient
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from src.api_client import (
+    APIException,
+    ApiClient,
+    AsyncApiClient,
+    NotEnoughStockError,
+    ProductNotFoundError,
+)
+from src.metrics import Histogram
+from src.stock_cache import StockCache
+from src.stock_entry import StockEntry, iter_entries, load_entries
+
+DECISION_LATENCY = Histogram(
+    "grocy_client_open_or_consume_decision_seconds",
+    "Time needed to decide between opening and consuming a product",
+)
+
+
+def _stream_entries(data: bytes) -> Iterator[StockEntry]:
+    try:
+        yield from iter_entries(data)
+    except ValueError as e:
+        raise APIException(f"Invalid response from Grocy: {e}") from e
 
 
 class NoStockEntriesException(Exception):
@@ -10,64 +33,257 @@ class ProductNotExistsException(Exception):
     pass
 
 
-class Product(BaseModel):
-    id: int
-    stock_id: str | None = None
-    grocycode: str | None = None
+class Product:
+    """
+    A product to open or consume
+
+    A plain class rather than a validated model: it is created for every scan
+    from values that are already typed, by GrocyCode or the journal.
+    """
+
+    __slots__ = (
+        "id",
+        "stock_id",
+        "grocycode",
+        "location_id",
+        "name",
+        "_api_client",
+        "_stock_cache",
+        "_async_api_client",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        stock_id: str | None = None,
+        grocycode: str | None = None,
+        location_id: int | None = None,
+        api_client: ApiClient | None = None,
+        stock_cache: StockCache | None = None,
+        name: str | None = None,
+    ) -> None:
+        self.id = id
+        self.stock_id = stock_id
+        self.grocycode = grocycode
+        self.location_id = location_id
+        self.name = name
+        self._api_client = api_client
+        self._stock_cache = stock_cache
+        self._async_api_client: AsyncApiClient | None = None
 
-    def open(self, amount: int = 1):
-        api_client = ApiClient()
-        data = {"amount": amount}
+    def __repr__(self) -> str:
+        return (
+            f"Product(id={self.id!r}, stock_id={self.stock_id!r},"
+            f" grocycode={self.grocycode!r}, location_id={self.location_id!r})"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Product):
+            return NotImplemented
+        return (self.id, self.stock_id, self.grocycode, self.location_id) == (
+            other.id,
+            other.stock_id,
+            other.grocycode,
+            other.location_id,
+        )
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.id})" if self.name else str(self.id)
+
+    @property
+    def api_client(self) -> ApiClient:
+        if self._api_client is None:
+            self._api_client = ApiClient()
+        return self._api_client
+
+    @property
+    def async_api_client(self) -> AsyncApiClient:
+        if self._async_api_client is None:
+            self._async_api_client = AsyncApiClient(self.api_client)
+        return self._async_api_client
+
+    def _action_path(self, action: str) -> str:
         if self.grocycode:
-            path = f"/api/stock/products/by-barcode/{self.grocycode}/open"
-        else:
-            path = f"/api/stock/products/{self.id}/open"
+            return f"/api/stock/products/by-barcode/{self.grocycode}/{action}"
+        return f"/api/stock/products/{self.id}/{action}"
+
+    def _handle_api_exception(self, e: APIException) -> None:
+        if self._stock_cache is not None:
+            self._stock_cache.invalidate(self.id)
+        if isinstance(e, NotEnoughStockError):
+            raise NoStockEntriesException(
+                f"No stock entries found for product {self}, stock_id {self.stock_id}"
+            ) from e
+        if isinstance(e, ProductNotFoundError):
+            raise ProductNotExistsException(
+                f"Product {self} does not exist or is inactive"
+            ) from e
+
+    def _opened(self, amount: int, stock_entry_id: str | None) -> None:
+        if self._stock_cache is not None:
+            self._stock_cache.record_open(
+                self.id, stock_entry_id or self.stock_id, amount, self.location_id
+            )
+
+    def _consumed(self, amount: int) -> None:
+        if self._stock_cache is not None:
+            self._stock_cache.record_consume(
+                self.id, self.stock_id, amount, self.location_id
+            )
+
+    def _open_data(self, amount: int, stock_entry_id: str | None) -> dict:
+        data: dict = {"amount": amount}
+        # Grocy's open takes no location, the entry to open is named instead
+        if stock_entry_id is not None:
+            data["stock_entry_id"] = stock_entry_id
+        return data
+
+    def open(self, amount: int = 1, stock_entry_id: str | None = None):
+        data = self._open_data(amount, stock_entry_id)
         try:
-            api_client.post(path=path, data=data)
+            self.api_client.post(path=self._action_path("open"), data=data)
         except APIException as e:
-            if str(e) == "No transaction was found by the given transaction id":
-                raise NoStockEntriesException(
-                    f"No stock entries found for product {self.id}, stock_id {self.stock_id}"
-                )
-            if str(e) == "Product does not exist or is inactive":
-                raise ProductNotExistsException(
-                    f"Product {self.id} does not exist or is inactive"
-                )
+            self._handle_api_exception(e)
+            raise
+        self._opened(amount, stock_entry_id)
 
-    def consume(self, amount: int = 1, spoiled: bool = False):
-        api_client = ApiClient()
+    async def open_async(self, amount: int = 1, stock_entry_id: str | None = None):
+        data = self._open_data(amount, stock_entry_id)
+        try:
+            await self.async_api_client.post(path=self._action_path("open"), data=data)
+        except APIException as e:
+            self._handle_api_exception(e)
+            raise
+        self._opened(amount, stock_entry_id)
+
+    def _consume_data(self, amount: int, spoiled: bool) -> dict:
         data = {"amount": amount, "transaction_type": "consume", "spoiled": spoiled}
-        if self.grocycode:
-            path = f"/api/stock/products/by-barcode/{self.grocycode}/consume"
-        else:
-            path = f"/api/stock/products/{self.id}/consume"
+        if self.location_id is not None:
+            data["location_id"] = self.location_id
+        return data
+
+    def consume(self, amount: int = 1, spoiled: bool = False):
+        data = self._consume_data(amount, spoiled)
         try:
-            api_client.post(path=path, data=data)
+            self.api_client.post(path=self._action_path("consume"), data=data)
         except APIException as e:
-            if (
-                str(e)
-                == "Amount to be consumed cannot be > current stock amount (if supplied, at the desired location)"
-            ):
-                raise NoStockEntriesException(
-                    f"No stock entries found for product {self.id}, stock_id {self.stock_id}"
-                )
-            if str(e) == "Product does not exist or is inactive":
-                raise ProductNotExistsException(
-                    f"Product {self.id} does not exist or is inactive"
+            self._handle_api_exception(e)
+            raise
+        self._consumed(amount)
+
+    async def consume_async(self, amount: int = 1, spoiled: bool = False):
+        data = self._consume_data(amount, spoiled)
+        try:
+            await self.async_api_client.post(
+                path=self._action_path("consume"), data=data
+            )
+        except APIException as e:
+            self._handle_api_exception(e)
+            raise
+        self._consumed(amount)
+
+    def _cached_stock_entries(self) -> list[StockEntry] | None:
+        if self._stock_cache is not None:
+            return self._stock_cache.get(self.id)
+        return None
+
+    def _cache_stock_entries(self, entries: list[StockEntry]) -> None:
+        if self._stock_cache is not None:
+            self._stock_cache.put(self.id, entries)
+
+    def _parse_stock_entries(self, data: bytes) -> Iterable[StockEntry]:
+        if self._stock_cache is None:
+            # Nothing keeps the entries, the decision only parses the ones it reads
+            return _stream_entries(data)
+        try:
+            entries = load_entries(data)
+        except ValueError as e:
+            raise APIException(f"Invalid response from Grocy: {e}") from e
+        self._cache_stock_entries(entries)
+        return entries
+
+    def get_stock_entries(self) -> Iterable[StockEntry]:
+        entries = self._cached_stock_entries()
+        if entries is None:
+            return self._parse_stock_entries(
+                self.api_client.get_raw(path=f"/api/stock/products/{self.id}/entries")
+            )
+        return entries
+
+    async def get_stock_entries_async(self) -> Iterable[StockEntry]:
+        entries = self._cached_stock_entries()
+        if entries is None:
+            return self._parse_stock_entries(
+                await self.async_api_client.get_raw(
+                    path=f"/api/stock/products/{self.id}/entries"
                 )
+            )
+        return entries
 
-    def open_or_consume(self):
-        api_client = ApiClient()
-        path = f"/api/stock/products/{self.id}/entries"
-        entries = api_client.get(path=path)
-        if self.stock_id and entries:
-            entries = [entry for entry in entries if entry["stock_id"] == self.stock_id]
-        if not entries:
+    def _entry_to_open(self, entries: Iterable[StockEntry]) -> StockEntry | None:
+        """
+        The first unopened matching entry, None when a matching entry is opened
+        """
+        to_open = None
+        for entry in entries:
+            if self.stock_id and entry.stock_id != self.stock_id:
+                continue
+            if self.location_id is not None and entry.location_id != self.location_id:
+                continue
+            if entry.open:
+                return None
+            if to_open is None:
+                to_open = entry
+        if to_open is None:
+            if self._stock_cache is not None:
+                self._stock_cache.invalidate(self.id)
             raise NoStockEntriesException(
-                f"No stock entries found for product {self.id}, stock_id {self.stock_id}"
+                f"No stock entries found for product {self}, stock_id {self.stock_id}"
             )
-        opened = any([int(entry["open"]) > 0 for entry in entries])
-        if opened:
-            self.consume()
-        else:
-            self.open()
+        return to_open
+
+    def _is_opened(self, entries: Iterable[StockEntry]) -> bool:
+        return self._entry_to_open(entries) is None
+
+    def _stock_entry_id(self, entry: StockEntry) -> str | None:
+        # Left to Grocy unless the scanner's location restricted the decision
+        return entry.stock_id if self.location_id is not None else None
+
+    @contextmanager
+    def _after_open(self):
+        """
+        Tell the error of consuming the rest that one item was opened already
+        """
+        try:
+            yield
+        except APIException as e:
+            e.booked = 1
+            raise
+
+    def open_or_consume(self, amount: int = 1):
+        """
+        Open an item when no matching entry is opened, consume it otherwise
+
+        Of several items, like merged scans, only the first is opened when no
+        entry is opened yet and the rest are consumed.
+        """
+        with DECISION_LATENCY.time():
+            entry = self._entry_to_open(self.get_stock_entries())
+        if entry is None:
+            self.consume(amount=amount)
+            return
+        self.open(stock_entry_id=self._stock_entry_id(entry))
+        if amount > 1:
+            with self._after_open():
+                self.consume(amount=amount - 1)
+
+    async def open_or_consume_async(self, amount: int = 1):
+        with DECISION_LATENCY.time():
+            entry = self._entry_to_open(await self.get_stock_entries_async())
+        if entry is None:
+            await self.consume_async(amount=amount)
+            return
+        await self.open_async(stock_entry_id=self._stock_entry_id(entry))
+        if amount > 1:
+            with self._after_open():
+                await self.consume_async(amount=amount - 1)
@@ -0,0 +1,211 @@
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+from src.api_client import SUPPRESSED_ERRORS, APIException, ApiClient, get_executor
+from src.change_watcher import ChangeEvent
+from src.product import ProductNotExistsException
+
+# How often to check Grocy for product changes, in seconds, 0 disables the index
+PRODUCT_INDEX_REFRESH = float(os.getenv("PRODUCT_INDEX_REFRESH", "300"))
+
+
+class ProductInfo(NamedTuple):
+    id: int
+    name: str
+    active: bool
+    qu_id: int | None = None
+
+    @classmethod
+    def from_json(cls, product: dict) -> "ProductInfo":
+        qu_id = product.get("qu_id_stock")
+        return cls(
+            id=int(product["id"]),
+            name=product["name"],
+            active=int(product.get("active", 1)) > 0,
+            qu_id=int(qu_id) if qu_id else None,
+        )
+
+
+class ProductIndex:
+    """
+    Local copy of the Grocy product list, to validate scans without a request
+
+    The list is fetched once and fetched again in the background only when
+    Grocy reports a database change. A product missing from the list is looked
+    up on its own, in case it was created since the last refresh.
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient | None = None,
+        refresh_interval: float = PRODUCT_INDEX_REFRESH,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.api_client = api_client if api_client else ApiClient()
+        self.refresh_interval = refresh_interval
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.loaded = False
+        self.refreshes = 0
+        self.rejected = 0
+        self._products: dict[int, ProductInfo] = {}
+        self._missing: set[int] = set()
+        self._changed_time: str | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="product-index", daemon=True
+        )
+
+    def _db_changed_time(self) -> str | None:
+        return self.api_client.get(path="/api/system/db-changed-time").get(
+            "changed_time"
+        )
+
+    def load(self, changed_time: str | None = None) -> None:
+        """
+        Fetch the whole product list, as of the given Grocy change time
+        """
+        if changed_time is None:
+            changed_time = self._db_changed_time()
+        products = {
+            info.id: info
+            for info in map(
+                ProductInfo.from_json, self.api_client.get(path="/api/objects/products")
+            )
+        }
+        with self._lock:
+            self._products = products
+            self._missing = set()
+            self._changed_time = changed_time
+            self._loaded_at = time.monotonic()
+            self.loaded = True
+            self.refreshes += 1
+
+    def dump(self) -> tuple[str | None, list[ProductInfo]]:
+        """
+        Return the products and the Grocy change time they were fetched at
+        """
+        with self._lock:
+            return self._changed_time, list(self._products.values())
+
+    def restore(self, changed_time: str | None, products: list[ProductInfo]) -> None:
+        """
+        Take over products dumped earlier, the next refresh fetches them again
+        only if Grocy changed since
+        """
+        with self._lock:
+            self._products = {info.id: info for info in products}
+            self._missing = set()
+            self._changed_time = changed_time
+            self.loaded = True
+
+    def refresh(self) -> bool:
+        """
+        Fetch the product list again if Grocy changed since, return whether it did
+        """
+        if self.loaded and self._db_changed_time() == self._changed_time:
+            return False
+        self.load()
+        return True
+
+    def on_change(self, event: ChangeEvent) -> None:
+        # The change time covers every table and changes with every scan, so
+        # the list is fetched at most once per refresh interval
+        if (
+            event.changed_time != self._changed_time
+            and time.monotonic() - self._loaded_at >= self.refresh_interval
+        ):
+            self.load(event.changed_time)
+
+    def get(self, product_id: int) -> ProductInfo | None:
+        return self._products.get(product_id)
+
+    def _reject(self, product: int | ProductInfo) -> None:
+        with self._lock:
+            self.rejected += 1
+        if isinstance(product, ProductInfo):
+            product = f"{product.name} ({product.id})"  # type: ignore
+        raise ProductNotExistsException(
+            f"Product {product} does not exist or is inactive"
+        )
+
+    def check(self, product_id: int) -> ProductInfo | None:
+        """
+        Raise ProductNotExistsException when Grocy has no such active product
+
+        Returns the product, or None when it can't be told without Grocy.
+        """
+        if not self.loaded:
+            return None
+        info = self._products.get(product_id)
+        if info is None:
+            if product_id in self._missing:
+                self._reject(product_id)
+            info = self._fetch(product_id)
+            if info is None:
+                return None
+        if not info.active:
+            self._reject(info)
+        return info
+
+    async def check_async(self, product_id: int) -> ProductInfo | None:
+        """
+        check() for the event loop, a product missing from the list is looked up
+        on the request executor instead of blocking the loop
+        """
+        if (
+            not self.loaded
+            or product_id in self._products
+            or product_id in self._missing
+        ):
+            return self.check(product_id)
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), self.check, product_id)
+
+    def _fetch(self, product_id: int) -> ProductInfo | None:
+        try:
+            product = self.api_client.get(path=f"/api/objects/products/{product_id}")
+        except APIException as e:
+            if e.retryable:
+                SUPPRESSED_ERRORS.inc(component="product_index", type=type(e).__name__)
+                return None
+            product = None
+        if not product:
+            with self._lock:
+                self._missing.add(product_id)
+            self._reject(product_id)
+        info = ProductInfo.from_json(product)  # type: ignore
+        with self._lock:
+            self._products[info.id] = info
+        return info
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._products),
+            "refreshes": self.refreshes,
+            "rejected": self.rejected,
+        }
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                if self.refresh():
+                    self.logger.debug(
+                        f"Product list refreshed, {len(self._products)} products"
+                    )
+            except APIException as e:
+                SUPPRESSED_ERRORS.inc(component="product_index", type=type(e).__name__)
+                self.logger.debug(f"Could not refresh the product list: {e}")
@@ -0,0 +1,276 @@
+import argparse
+import gzip
+import json
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import IO, Iterable, Iterator, NamedTuple, TextIO
+
+from src.api_client import ApiClient
+from src.grocycode import InvalidGrocyCodeException, UnknownCodeTypeException, parse
+from src.pipeline import LOG_PATTERN, ScanPipeline, ScanResult, product_key
+from src.stock_cache import StockCache
+
+LOG_LINE = re.compile(r"^\d{4}-\d{2}-\d{2} ")
+FORMATS = ("auto", "plain", "jsonl", "log")
+# Scans read ahead per worker, reading blocks beyond so memory stays constant
+QUEUE_SIZE = 64
+# Durations kept to estimate percentiles, whatever the number of scans
+SAMPLE_SIZE = 10000
+
+_STOP = object()
+
+
+class Scan(NamedTuple):
+    code: str
+    location_id: int | None = None
+
+
+def open_input(path: str) -> TextIO:
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        # Rotated log files are compressed
+        return gzip.open(path, "rt")  # type: ignore
+    return open(path, "r")
+
+
+def _from_plain(line: str) -> Scan | None:
+    code, _, location = line.strip().partition("\t")
+    if not code:
+        return None
+    return Scan(code, int(location) if location else None)
+
+
+def _from_log(line: str) -> Scan | None:
+    matches = LOG_PATTERN.search(line.rstrip())
+    if not matches:
+        return None
+    location = matches["location_id"]
+    return Scan(matches["code"], int(location) if location else None)
+
+
+def _from_json(line: str) -> Scan | None:
+    if not line.strip():
+        return None
+    record = json.loads(line)
+    if "code" in record:
+        location = record.get("location_id")
+        return Scan(str(record["code"]), int(location) if location else None)
+    # Log files written with LOG_FORMAT=json
+    return _from_log(record.get("message", ""))
+
+
+PARSERS = {"plain": _from_plain, "jsonl": _from_json, "log": _from_log}
+
+
+def _detect(line: str) -> str:
+    if line.lstrip().startswith("{"):
+        return "jsonl"
+    if LOG_LINE.match(line):
+        return "log"
+    return "plain"
+
+
+def read_scans(lines: Iterable[str], format: str = "auto") -> Iterator[Scan]:
+    """
+    Yield the scans recorded in lines, one line at a time
+
+    Lines that record something else, like other log messages, are skipped.
+    With the auto format, the format is told from the first non-empty line.
+    """
+    parser = None if format == "auto" else PARSERS[format]
+    for line in lines:
+        if parser is None:
+            if not line.strip():
+                continue
+            parser = PARSERS[_detect(line)]
+        try:
+            scan = parser(line)
+        except (ValueError, AttributeError):
+            continue
+        if scan is not None:
+            yield scan
+
+
+@dataclass
+class ReplaySummary:
+    counts: dict[str, int] = field(default_factory=dict)
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    samples: list[float] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, status: str, seconds: float) -> None:
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        # Reservoir sampling, every duration has the same chance to be kept
+        if len(self.samples) < SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            index = random.randrange(self.total)
+            if index < SAMPLE_SIZE:
+                self.samples[index] = seconds
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def __str__(self) -> str:
+        counts = ", ".join(f"{count} {status}" for status, count in self.counts.items())
+        mean = self.total_seconds / self.total if self.total else 0.0
+        return (
+            f"Replayed {self.total} scans: {counts or 'none'}\n"
+            f"mean {mean * 1000:.1f} ms, p50 {self.percentile(50) * 1000:.1f} ms,"
+            f" p95 {self.percentile(95) * 1000:.1f} ms,"
+            f" max {self.max_seconds * 1000:.1f} ms"
+        )
+
+
+class Replayer:
+    """
+    Streams recorded scans through the scan pipeline
+
+    Scans are routed to a worker by product, like in batch mode, so scans of
+    the same product are replayed in their recorded order. Each outcome is
+    written to output as soon as it is known.
+    """
+
+    def __init__(
+        self,
+        pipeline: ScanPipeline | None = None,
+        concurrency: int = 1,
+        rate: float = 0.0,
+        dry_run: bool = False,
+        output: IO[str] | None = None,
+    ) -> None:
+        if pipeline is None and not dry_run:
+            raise ValueError("A pipeline is needed unless it is a dry run")
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.rate = rate
+        self.dry_run = dry_run
+        self.output = output
+        self.summary = ReplaySummary()
+        self._lock = threading.Lock()
+
+    def _route(self, code: str) -> int:
+        resolver = self.pipeline.barcode_resolver if self.pipeline else None
+        return hash(product_key(code, resolver)) % self.concurrency
+
+    def _process(self, scan: Scan) -> ScanResult:
+        if self.dry_run:
+            try:
+                parse(scan.code)
+            except (InvalidGrocyCodeException, UnknownCodeTypeException) as e:
+                return ScanResult(scan.code, "failed", str(e), e)
+            return ScanResult(scan.code, "valid")
+        return self.pipeline.try_process(  # type: ignore
+            scan.code, location_id=scan.location_id
+        )
+
+    def _replay(self, scan: Scan) -> None:
+        start = time.perf_counter()
+        try:
+            result = self._process(scan)
+        except Exception as e:
+            # Keep replaying, a worker that stops would block the reader
+            result = ScanResult(scan.code, "failed", repr(e), e)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.summary.add(result.status, seconds)
+            if self.output is not None:
+                self.output.write(
+                    f"{scan.code}\t{result.status}\t{seconds * 1000:.1f} ms"
+                    f"\t{result.message}\n"
+                )
+
+    def _work(self, work: queue.Queue) -> None:
+        while True:
+            scan = work.get()
+            if scan is _STOP:
+                return
+            self._replay(scan)
+
+    def run(self, scans: Iterable[Scan]) -> ReplaySummary:
+        queues: list[queue.Queue] = [
+            queue.Queue(maxsize=QUEUE_SIZE) for _ in range(self.concurrency)
+        ]
+        threads = [
+            threading.Thread(target=self._work, args=(work,), daemon=True)
+            for work in queues
+        ]
+        for thread in threads:
+            thread.start()
+        start = time.monotonic()
+        try:
+            for index, scan in enumerate(scans):
+                if self.rate:
+                    delay = start + index / self.rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                queues[self._route(scan.code)].put(scan)
+        finally:
+            for work in queues:
+                work.put(_STOP)
+            for thread in threads:
+                thread.join()
+        return self.summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded scans through the scan pipeline"
+    )
+    parser.add_argument(
+        "files", nargs="+", help="files of recorded scans, - reads stdin"
+    )
+    parser.add_argument("--format", choices=FORMATS, default="auto")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="scans per second, 0 is unlimited"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only parse the codes, send nothing"
+    )
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    parser.add_argument("--api-url")
+    parser.add_argument("--api-key")
+    args = parser.parse_args(argv)
+
+    pipeline = None
+    if not args.dry_run:
+        pipeline = ScanPipeline(
+            api_client=ApiClient(api_url=args.api_url, api_key=args.api_key),
+            stock_cache=StockCache(),
+        )
+    replayer = Replayer(
+        pipeline,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        dry_run=args.dry_run,
+        output=None if args.quiet else sys.stdout,
+    )
+
+    def scans() -> Iterator[Scan]:
+        for path in args.files:
+            with open_input(path) as f:
+                yield from read_scans(f, args.format)
+
+    summary = replayer.run(scans())
+    print(summary, file=sys.stderr)
+    return 1 if summary.counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
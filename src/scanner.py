@@ -0,0 +1,237 @@
+import logging
+import os
+import selectors
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
+
+from src.metrics import Histogram
+
+if TYPE_CHECKING:
+    import asyncio
+
+READ_TIMEOUT = float(os.getenv("SCANNER_READ_TIMEOUT", "1"))
+CHUNK_SIZE = 4096
+# A barcode frame is terminated by CR and/or LF, depending on the scanner setup
+TERMINATORS = b"\r\n"
+MAX_FRAME_SIZE = 4096
+
+SERIAL_READ_LATENCY = Histogram(
+    "grocy_client_serial_read_seconds", "Time spent reading from the scanners"
+)
+
+
+class ScannerDisconnectedException(Exception):
+    pass
+
+
+class Scanner:
+    """
+    Reads barcodes from a serial port, or any object with fileno() and read()
+
+    The port is waited on with a selector instead of being polled, so an idle
+    scanner does not use any CPU. Partial reads are buffered until a terminator
+    completes the frame.
+    """
+
+    def __init__(
+        self,
+        port,
+        timeout: float | None = READ_TIMEOUT,
+        name: str | None = None,
+        location_id: int | None = None,
+    ) -> None:
+        self.port = port
+        self.timeout = timeout
+        self.name = name if name else str(getattr(port, "name", port))
+        self.location_id = location_id
+        self._buffer = bytearray()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(port, selectors.EVENT_READ)
+
+    def fileno(self) -> int:
+        return self.port.fileno()
+
+    def feed(self, data: bytes) -> list[str]:
+        """
+        Add raw bytes to the buffer and return the completed codes
+        """
+        self._buffer.extend(data)
+        codes = []
+        start = 0
+        for index, byte in enumerate(self._buffer):
+            if byte in TERMINATORS:
+                frame = self._buffer[start:index].strip()
+                if frame:
+                    codes.append(frame.decode(errors="replace"))
+                start = index + 1
+        del self._buffer[:start]
+        # Drop garbage that never gets terminated instead of growing forever
+        if len(self._buffer) > MAX_FRAME_SIZE:
+            self._buffer.clear()
+        return codes
+
+    def read_available(self) -> list[str]:
+        """
+        Read what the port has buffered, without waiting
+        """
+        try:
+            with SERIAL_READ_LATENCY.time():
+                data = self.port.read(CHUNK_SIZE)
+        except OSError as e:
+            raise ScannerDisconnectedException(str(e)) from e
+        if not data:
+            raise ScannerDisconnectedException("Scanner returned no data")
+        return self.feed(data)
+
+    def read_codes(self) -> list[str]:
+        """
+        Wait up to the timeout for input and return the completed codes
+        """
+        if not self._selector.select(self.timeout):
+            return []
+        return self.read_available()
+
+    def codes(self) -> Iterator[str]:
+        """
+        Yield scanned codes forever
+        """
+        while True:
+            yield from self.read_codes()
+
+    async def async_codes(self) -> AsyncIterator[str]:
+        """
+        Yield scanned codes as the event loop reports the port readable
+        """
+        # asyncio is slow to import and only needed in async mode
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def on_readable() -> None:
+            try:
+                codes = self.read_available()
+            except ScannerDisconnectedException as e:
+                loop.remove_reader(self.fileno())
+                queue.put_nowait(e)
+                return
+            for code in codes:
+                queue.put_nowait(code)
+
+        loop.add_reader(self.fileno(), on_readable)
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            loop.remove_reader(self.fileno())
+
+    def close(self) -> None:
+        self._selector.close()
+        self.port.close()
+
+
+def report_scanner_problem(
+    group: "ScannerGroup", device: str, message: str, logger: logging.Logger
+) -> None:
+    """
+    Warn about a scanner once, repeats are logged at debug level
+
+    Warnings are sent as notifications, and a device that keeps failing would
+    send one on every hot-plug pass.
+    """
+    level = logging.DEBUG if device in group.reported else logging.WARNING
+    group.reported.add(device)
+    logger.log(level, message)
+
+
+class ScannerGroup:
+    """
+    Multiplexes any number of scanners on a single selector or event loop
+
+    Scanners can be added and removed at any time, a scanner that disconnects
+    is removed and closed.
+    """
+
+    def __init__(
+        self,
+        timeout: float | None = READ_TIMEOUT,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.timeout = timeout
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.scanners: dict[str, Scanner] = {}
+        # Devices whose last problem was reported, until they work again
+        self.reported: set[str] = set()
+        self._selector = selectors.DefaultSelector()
+        self._loop: "asyncio.AbstractEventLoop | None" = None
+        self._queue: "asyncio.Queue | None" = None
+
+    def add(self, scanner: Scanner) -> None:
+        self.scanners[scanner.name] = scanner
+        self._selector.register(scanner.port, selectors.EVENT_READ, scanner)
+        if self._loop:
+            self._loop.add_reader(scanner.fileno(), self._on_readable, scanner)
+
+    def remove(self, scanner: Scanner) -> None:
+        if self.scanners.pop(scanner.name, None) is None:
+            return
+        if self._loop:
+            self._loop.remove_reader(scanner.fileno())
+        self._selector.unregister(scanner.port)
+        scanner.close()
+
+    def _read(self, scanner: Scanner) -> list[str]:
+        try:
+            return scanner.read_available()
+        except ScannerDisconnectedException:
+            self.remove(scanner)
+            report_scanner_problem(
+                self,
+                scanner.name,
+                f"Scanner {scanner.name} was disconnected",
+                self.logger,
+            )
+            return []
+
+    def read_codes(self) -> list[tuple[Scanner, str]]:
+        """
+        Wait up to the timeout for input on any scanner and return the codes
+        """
+        codes = []
+        for key, _ in self._selector.select(self.timeout):
+            codes.extend((key.data, code) for code in self._read(key.data))
+        return codes
+
+    def codes(self) -> Iterator[tuple[Scanner, str]]:
+        while True:
+            yield from self.read_codes()
+
+    def _on_readable(self, scanner: Scanner) -> None:
+        for code in self._read(scanner):
+            self._queue.put_nowait((scanner, code))  # type: ignore
+
+    async def async_codes(self) -> AsyncIterator[tuple[Scanner, str]]:
+        """
+        Yield the codes of all scanners as the event loop reports them readable
+        """
+        import asyncio
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        for scanner in self.scanners.values():
+            self._loop.add_reader(scanner.fileno(), self._on_readable, scanner)
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            for scanner in self.scanners.values():
+                self._loop.remove_reader(scanner.fileno())
+            self._loop = None
+            self._queue = None
+
+    def close(self) -> None:
+        for scanner in list(self.scanners.values()):
+            self.remove(scanner)
+        self._selector.close()
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.change_watcher import ChangeEvent
+from src.stock_entry import StockEntry
+
+STOCK_CACHE_TTL = float(os.getenv("STOCK_CACHE_TTL", "60"))
+STOCK_CACHE_SIZE = int(os.getenv("STOCK_CACHE_SIZE", "256"))
+
+
+def _matches(entry: StockEntry, stock_id: str | None, location_id: int | None) -> bool:
+    if stock_id and entry.stock_id != stock_id:
+        return False
+    return location_id is None or entry.location_id == location_id
+
+
+class StockCache:
+    """
+    In-process cache of stock entries per product, with TTL and LRU eviction
+
+    Entries are kept as immutable StockEntry tuples and are updated
+    optimistically from our own open/consume calls, so a repeat scan can
+    decide between open and consume without a round trip.
+    """
+
+    def __init__(
+        self, ttl: float = STOCK_CACHE_TTL, max_size: int = STOCK_CACHE_SIZE
+    ) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._products: OrderedDict[int, tuple[float, list[StockEntry]]] = OrderedDict()
+        # Products of the last snapshot, they all fit on top of max_size
+        self._snapshot_size = 0
+        # When we last changed a product, so that older snapshots don't undo it
+        self._changed: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, product_id: int) -> list[StockEntry] | None:
+        with self._lock:
+            cached = self._products.get(product_id)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self._products.move_to_end(product_id)
+                self.hits += 1
+                return list(cached[1])
+            if cached:
+                del self._products[product_id]
+            self.misses += 1
+            return None
+
+    def put(self, product_id: int, entries: list[StockEntry]) -> None:
+        with self._lock:
+            self._products[product_id] = (time.monotonic(), list(entries))
+            self._products.move_to_end(product_id)
+            while len(self._products) > self.max_size + self._snapshot_size:
+                self._products.popitem(last=False)
+
+    def replace(self, products: dict[int, list[StockEntry]], fetched: float) -> None:
+        """
+        Replace the cache with a snapshot of the whole stock
+
+        Products changed by our own calls after the snapshot was fetched, at
+        monotonic time fetched, keep their cached entries.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._changed = {
+                product_id: changed
+                for product_id, changed in self._changed.items()
+                if changed > fetched
+            }
+            recent = {
+                product_id: self._products[product_id]
+                for product_id in self._changed
+                if product_id in self._products
+            }
+            self._products = OrderedDict(
+                (product_id, (now, list(entries)))
+                for product_id, entries in products.items()
+                if product_id not in self._changed
+            )
+            self._products.update(recent)
+            # The whole stock is kept, trimming it would bring back the
+            # per-product requests the snapshot saves
+            self._snapshot_size = len(products)
+
+    def dump(self) -> dict[int, list[StockEntry]]:
+        """
+        Return the entries of every product that is still fresh
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                product_id: list(entries)
+                for product_id, (cached, entries) in self._products.items()
+                if now - cached < self.ttl
+            }
+
+    def invalidate(self, product_id: int | None = None) -> None:
+        """
+        Forget one product, or everything when no product is given
+        """
+        with self._lock:
+            if product_id is None:
+                self._products.clear()
+            else:
+                self._changed[product_id] = time.monotonic()
+                self._products.pop(product_id, None)
+
+    def on_change(self, event: ChangeEvent) -> None:
+        """
+        Keep the entries while Grocy is unchanged, forget them once it changed
+
+        Products we changed ourselves since the previous poll keep their
+        entries, the change is most likely ours.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not event.changed:
+                for product_id, (_, entries) in self._products.items():
+                    self._products[product_id] = (now, entries)
+                return
+            for product_id in list(self._products):
+                if self._changed.get(product_id, 0.0) <= event.since:
+                    del self._products[product_id]
+
+    def record_open(
+        self,
+        product_id: int,
+        stock_id: str | None,
+        amount: float,
+        location_id: int | None = None,
+    ) -> None:
+        with self._lock:
+            self._changed[product_id] = time.monotonic()
+            entries = self._cached_entries(product_id)
+            if entries is None:
+                return
+            for index, entry in enumerate(entries):
+                if entry.open or not _matches(entry, stock_id, location_id):
+                    continue
+                if entry.amount > amount:
+                    # Grocy splits the entry, the opened part becomes its own row
+                    entries[index] = entry._replace(amount=entry.amount - amount)
+                    entries.insert(index, entry._replace(amount=amount, open=True))
+                else:
+                    entries[index] = entry._replace(open=True)
+                return
+            # Nothing left to open, we don't know what Grocy did
+            del self._products[product_id]
+
+    def record_consume(
+        self,
+        product_id: int,
+        stock_id: str | None,
+        amount: float,
+        location_id: int | None = None,
+    ) -> None:
+        with self._lock:
+            self._changed[product_id] = time.monotonic()
+            entries = self._cached_entries(product_id)
+            if entries is None:
+                return
+            # Opened entries are the ones we consume
+            matching = sorted(
+                (
+                    index
+                    for index, entry in enumerate(entries)
+                    if _matches(entry, stock_id, location_id)
+                ),
+                key=lambda index: not entries[index].open,
+            )
+            consumed_entries = set()
+            for index in matching:
+                if amount <= 0:
+                    break
+                entry = entries[index]
+                consumed = min(entry.amount, amount)
+                amount -= consumed
+                if entry.amount - consumed > 0:
+                    entries[index] = entry._replace(amount=entry.amount - consumed)
+                else:
+                    consumed_entries.add(index)
+            entries[:] = [
+                entry
+                for index, entry in enumerate(entries)
+                if index not in consumed_entries
+            ]
+            if amount > 0:
+                del self._products[product_id]
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._products),
+            }
+
+    def _cached_entries(self, product_id: int) -> list[StockEntry] | None:
+        cached = self._products.get(product_id)
+        return cached[1] if cached else None
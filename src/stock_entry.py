@@ -0,0 +1,82 @@
+import json
+import re
+from typing import Iterator, NamedTuple
+
+try:
+    # Faster than json at parsing whole responses, optional
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class StockEntry(NamedTuple):
+    """
+    The fields of a Grocy stock entry needed to open or consume a product
+
+    Immutable, so cached entries can be shared instead of copied.
+    """
+
+    stock_id: str
+    amount: float
+    open: bool
+    location_id: int | None = None
+
+    @classmethod
+    def from_json(cls, entry: dict) -> "StockEntry":
+        location_id = entry.get("location_id")
+        return cls(
+            stock_id=entry["stock_id"],
+            amount=float(entry["amount"]),
+            open=int(entry["open"]) > 0,
+            location_id=int(location_id) if location_id is not None else None,
+        )
+
+
+def parse_entries(entries: list[dict]) -> list[StockEntry]:
+    """
+    Parse the response of /api/stock/products/{id}/entries
+    """
+    return [StockEntry.from_json(entry) for entry in entries]
+
+
+def load_entries(data: bytes) -> list[StockEntry]:
+    """
+    Parse the raw response of /api/stock/products/{id}/entries at once
+    """
+    try:
+        return parse_entries(loads(data))
+    except (AttributeError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid stock entry: {e!r}") from e
+
+
+def iter_entries(data: bytes | str) -> Iterator[StockEntry]:
+    """
+    Parse the raw response of /api/stock/products/{id}/entries one entry at a time
+
+    Only the entries read so far are decoded, so a caller that stops early
+    skips the rest of the response and never holds more than one entry.
+    """
+    text = data.decode() if isinstance(data, bytes) else data
+    index = _WHITESPACE.match(text).end()
+    if text[index : index + 1] != "[":
+        raise ValueError("Expected a list of stock entries")
+    index = _WHITESPACE.match(text, index + 1).end()
+    if text[index : index + 1] == "]":
+        return
+    while True:
+        entry, index = _DECODER.raw_decode(text, index)
+        try:
+            entry = StockEntry.from_json(entry)
+        except (AttributeError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid stock entry: {e!r}") from e
+        yield entry
+        index = _WHITESPACE.match(text, index).end()
+        separator = text[index : index + 1]
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected , or ] at position {index}")
+        index = _WHITESPACE.match(text, index + 1).end()
@@ -0,0 +1,78 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from src.api_client import SUPPRESSED_ERRORS, APIException, ApiClient
+from src.change_watcher import ChangeEvent
+from src.stock_cache import StockCache
+from src.stock_entry import StockEntry
+
+# How often to fetch the whole stock, in seconds, 0 disables the snapshot.
+# With the change watcher, the stock is only fetched again when Grocy changed
+STOCK_SNAPSHOT_INTERVAL = float(os.getenv("STOCK_SNAPSHOT_INTERVAL", "30"))
+
+
+class StockSnapshot:
+    """
+    Keeps the stock cache filled with the whole stock, fetched in one request
+
+    Scans then decide between open and consume without a request of their own.
+    Between two snapshots, the cache is kept current by our own open and
+    consume calls, like for entries fetched per product.
+    """
+
+    def __init__(
+        self,
+        stock_cache: StockCache,
+        api_client: ApiClient | None = None,
+        interval: float = STOCK_SNAPSHOT_INTERVAL,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.stock_cache = stock_cache
+        self.api_client = api_client if api_client else ApiClient()
+        self.interval = interval
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.refreshes = 0
+        self.entries = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stock-snapshot", daemon=True
+        )
+
+    def refresh(self) -> None:
+        fetched = time.monotonic()
+        products: dict[int, list[StockEntry]] = defaultdict(list)
+        rows = self.api_client.get(path="/api/objects/stock")
+        for row in rows:
+            products[int(row["product_id"])].append(StockEntry.from_json(row))
+        self.stock_cache.replace(products, fetched)
+        self.refreshes += 1
+        self.entries = len(rows)
+
+    def on_change(self, event: ChangeEvent) -> None:
+        # Also when the first refresh failed, Grocy may not change for a while
+        if event.changed or not self.refreshes:
+            self.refresh()
+
+    def stats(self) -> dict[str, int]:
+        return {"refreshes": self.refreshes, "entries": self.entries}
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except APIException as e:
+                SUPPRESSED_ERRORS.inc(component="stock_snapshot", type=type(e).__name__)
+                self.logger.debug(f"Could not fetch the stock: {e}")
+            # Without an interval, later refreshes are left to the change watcher
+            if self.interval <= 0 or self._stop.wait(self.interval):
+                return
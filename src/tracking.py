@@ -0,0 +1,55 @@
+from src.api_client import ApiClient, AsyncApiClient
+
+
+class Trackable:
+    """
+    A Grocy object that a scan tracks with a single request
+
+    Batteries are charged, chores executed and recipes consumed, there is no
+    stock to look at before.
+    """
+
+    __slots__ = ("id", "_api_client")
+
+    path = ""
+
+    def __init__(self, id: int, api_client: ApiClient | None = None) -> None:
+        self.id = id
+        self._api_client = api_client
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self.id!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.id == other.id  # type: ignore
+
+    @property
+    def api_client(self) -> ApiClient:
+        if self._api_client is None:
+            self._api_client = ApiClient()
+        return self._api_client
+
+    def track(self) -> None:
+        self.api_client.post(path=self.path.format(id=self.id), data={})
+
+    async def track_async(self) -> None:
+        await AsyncApiClient(self.api_client).post(
+            path=self.path.format(id=self.id), data={}
+        )
+
+
+class Battery(Trackable):
+    __slots__ = ()
+    path = "/api/batteries/{id}/charge"
+
+
+class Chore(Trackable):
+    __slots__ = ()
+    path = "/api/chores/{id}/execute"
+
+
+class Recipe(Trackable):
+    __slots__ = ()
+    path = "/api/recipes/{id}/consume"
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from src.api_client import SUPPRESSED_ERRORS, APIException, ApiClient
+from src.barcode import BarcodeResolver
+from src.product_index import ProductIndex, ProductInfo
+from src.stock_cache import StockCache
+from src.stock_entry import StockEntry
+
+STATE_PATH = os.getenv("STATE_PATH", "/var/log/grocy_client/state.json")
+# How often the state is written to disk, in seconds, 0 disables the state file
+STATE_INTERVAL = float(os.getenv("STATE_INTERVAL", "60"))
+# Bumped whenever the layout of the file changes, older files are ignored
+STATE_VERSION = 1
+
+
+class WarmState:
+    """
+    What the client learned from Grocy, kept on disk across restarts
+
+    The product list, the stock cache and the barcode lookups are written
+    atomically every interval and loaded at startup, so the first scans after
+    a restart don't need more requests than later ones. The stock is only
+    trusted when Grocy didn't change since it was written. Pending scans are
+    not part of the state, the journal already keeps them on disk.
+    """
+
+    def __init__(
+        self,
+        path: str = STATE_PATH,
+        api_client: ApiClient | None = None,
+        stock_cache: StockCache | None = None,
+        product_index: ProductIndex | None = None,
+        barcode_resolver: BarcodeResolver | None = None,
+        interval: float = STATE_INTERVAL,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.path = path
+        self.api_client = api_client if api_client else ApiClient()
+        self.stock_cache = stock_cache
+        self.product_index = product_index
+        self.barcode_resolver = barcode_resolver
+        self.interval = interval
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.saves = 0
+        self.restored = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="warm-state", daemon=True
+        )
+
+    def _db_changed_time(self) -> str | None:
+        try:
+            return self.api_client.get(path="/api/system/db-changed-time").get(
+                "changed_time"
+            )
+        except APIException as e:
+            SUPPRESSED_ERRORS.inc(component="warm_state", type=type(e).__name__)
+            return None
+
+    def save(self) -> None:
+        # Taken before the stock, a change in between only makes the stock
+        # look outdated on the next start
+        state: dict = {
+            "version": STATE_VERSION,
+            "changed_time": self._db_changed_time(),
+        }
+        if self.product_index is not None and self.product_index.loaded:
+            state["products_changed_time"], state["products"] = (
+                self.product_index.dump()
+            )
+        if self.stock_cache is not None:
+            state["stock"] = {
+                str(product_id): entries
+                for product_id, entries in self.stock_cache.dump().items()
+            }
+        if self.barcode_resolver is not None:
+            state["barcodes"] = self.barcode_resolver.dump()
+
+        # Written next to the target and renamed, a crash never leaves half a file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".state-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.saves += 1
+
+    def _read(self) -> dict | None:
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable state file {self.path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            self.logger.info(f"Ignoring state file {self.path} of another version")
+            return None
+        return state
+
+    def restore(self) -> bool:
+        """
+        Load the state written by an earlier run, return whether there was one
+        """
+        state = self._read()
+        if state is None:
+            return False
+        try:
+            if self.barcode_resolver is not None and "barcodes" in state:
+                self.barcode_resolver.restore(
+                    {barcode: int(id) for barcode, id in state["barcodes"].items()}
+                )
+            if self.product_index is not None and "products" in state:
+                self.product_index.restore(
+                    state.get("products_changed_time"),
+                    [ProductInfo(*product) for product in state["products"]],
+                )
+            changed_time = state.get("changed_time")
+            if (
+                self.stock_cache is not None
+                and "stock" in state
+                and changed_time is not None
+                and changed_time == self._db_changed_time()
+            ):
+                self.stock_cache.replace(
+                    {
+                        int(product_id): [StockEntry(*entry) for entry in entries]
+                        for product_id, entries in state["stock"].items()
+                    },
+                    time.monotonic(),
+                )
+        except (TypeError, ValueError, AttributeError) as e:
+            self.logger.warning(f"Ignoring invalid state file {self.path}: {e}")
+            return False
+        self.restored += 1
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"saves": self.saves, "restored": self.restored}
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            stopped = self._stop.wait(self.interval)
+            try:
+                self.save()
+            except OSError as e:
+                self.logger.warning(f"Could not write the state file: {e}")
+            if stopped:
+                return
@@ -0,0 +1,281 @@
+import argparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENTRIES_PATH = re.compile(r"^/api/stock/products/(\d+)/entries$")
+ACTION_PATH = re.compile(r"^/api/stock/products/(\d+)/(open|consume)$")
+PRODUCTS_PATH = "/api/objects/products"
+PRODUCT_PATH = re.compile(r"^/api/objects/products/(\d+)$")
+DB_CHANGED_TIME_PATH = "/api/system/db-changed-time"
+STOCK_PATH = "/api/objects/stock"
+BARCODE_ACTION_PATH = re.compile(
+    r"^/api/stock/products/by-barcode/grcy:p:(\d+)(?::(\w+))?/(open|consume)$"
+)
+BARCODE_PATH = re.compile(r"^/api/stock/products/by-barcode/(\d+)$")
+TRACK_PATH = re.compile(
+    r"^/api/(batteries/\d+/charge|chores/\d+/execute|recipes/\d+/consume)$"
+)
+
+
+class MockGrocy:
+    """
+    Minimal stand-in for the Grocy API, served on localhost
+
+    Stock entries are kept in memory and updated by open/consume calls the way
+    Grocy does. Latency, random errors and a complete outage can be simulated.
+    """
+
+    def __init__(
+        self,
+        entries: dict[int, list[dict]] | None = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        port: int = 0,
+        products: dict[int, dict] | None = None,
+        barcodes: dict[str, int] | None = None,
+    ) -> None:
+        self.entries = copy.deepcopy(entries) if entries else {}
+        self.barcodes = dict(barcodes) if barcodes else {}
+        self.products = (
+            copy.deepcopy(products)
+            if products is not None
+            else {
+                product_id: {
+                    "id": str(product_id),
+                    "name": f"Product {product_id}",
+                    "active": "1",
+                    "qu_id_stock": "1",
+                }
+                for product_id in self.entries
+            }
+        )
+        # Changes on every write, like Grocy's database change time
+        self.changes = 0
+        self.latency = latency
+        self.error_rate = error_rate
+        self.available = True
+        self.requests: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGrocy":
+        # A short poll interval so that stopping the server doesn't slow tests down
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.01,), daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockGrocy":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def count(self, method: str | None = None, suffix: str = "") -> int:
+        with self._lock:
+            return sum(
+                1
+                for request_method, path in self.requests
+                if (method is None or request_method == method)
+                and path.endswith(suffix)
+            )
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "requests": self.count(),
+            "get": self.count("GET"),
+            "post": self.count("POST"),
+        }
+
+    def handle(self, method: str, path: str, body: dict) -> tuple[int, object]:
+        if path == "/mock/stats":
+            return 200, self.stats()
+        with self._lock:
+            self.requests.append((method, path))
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.available or random.random() < self.error_rate:
+            return 503, {"error_message": "Service unavailable"}
+
+        with self._lock:
+            if method == "GET" and (matches := ENTRIES_PATH.match(path)):
+                return 200, self.entries.get(int(matches[1]), [])
+            if method == "GET" and path == STOCK_PATH:
+                return 200, [
+                    dict(entry, product_id=str(product_id))
+                    for product_id, entries in self.entries.items()
+                    for entry in entries
+                ]
+            if method == "GET" and path == PRODUCTS_PATH:
+                return 200, list(self.products.values())
+            if method == "GET" and (matches := PRODUCT_PATH.match(path)):
+                if int(matches[1]) not in self.products:
+                    return 404, {"error_message": "Object not found"}
+                return 200, self.products[int(matches[1])]
+            if method == "GET" and (matches := BARCODE_PATH.match(path)):
+                if matches[1] not in self.barcodes:
+                    return 400, {
+                        "error_message": f"No product with barcode {matches[1]} found"
+                    }
+                product_id = self.barcodes[matches[1]]
+                return 200, {
+                    "product": self.products.get(product_id, {"id": product_id})
+                }
+            if method == "GET" and path == DB_CHANGED_TIME_PATH:
+                return 200, {"changed_time": f"2022-04-10 11:00:{self.changes:02d}"}
+            if method == "POST" and TRACK_PATH.match(path):
+                self.changes += 1
+                return 200, {}
+            if method == "POST":
+                if matches := ACTION_PATH.match(path):
+                    product_id, stock_id, action = int(matches[1]), None, matches[2]
+                elif matches := BARCODE_ACTION_PATH.match(path):
+                    product_id, stock_id, action = (
+                        int(matches[1]),
+                        matches[2],
+                        matches[3],
+                    )
+                else:
+                    return 404, {"error_message": "Not found"}
+                if product_id not in self.entries:
+                    return 400, {
+                        "error_message": "Product does not exist or is inactive"
+                    }
+                amount = float(body.get("amount", 1))
+                self.changes += 1
+                if action == "open":
+                    stock_id = stock_id or body.get("stock_entry_id")
+                    return self._open(product_id, stock_id, amount)
+                return self._consume(product_id, stock_id, amount)
+        return 404, {"error_message": "Not found"}
+
+    def _matching(self, product_id: int, stock_id: str | None) -> list[dict]:
+        return [
+            entry
+            for entry in self.entries[product_id]
+            if not stock_id or entry["stock_id"] == stock_id
+        ]
+
+    def _open(
+        self, product_id: int, stock_id: str | None, amount: float
+    ) -> tuple[int, object]:
+        for entry in self._matching(product_id, stock_id):
+            if int(entry["open"]) == 0:
+                if float(entry["amount"]) > amount:
+                    # Grocy splits the entry, the opened part becomes its own row
+                    entry["amount"] = str(float(entry["amount"]) - amount)
+                    entry = dict(entry, amount=str(amount))
+                    self.entries[product_id].insert(0, entry)
+                entry["open"] = "1"
+                return 200, [entry]
+        return 400, {
+            "error_message": "No transaction was found by the given transaction id"
+        }
+
+    def _consume(
+        self, product_id: int, stock_id: str | None, amount: float
+    ) -> tuple[int, object]:
+        matching = self._matching(product_id, stock_id)
+        if sum(float(entry["amount"]) for entry in matching) < amount:
+            return 400, {
+                "error_message": "Amount to be consumed cannot be > current stock amount (if supplied, at the desired location)"
+            }
+        matching.sort(key=lambda entry: int(entry["open"]) == 0)
+        for entry in matching:
+            consumed = min(float(entry["amount"]), amount)
+            amount -= consumed
+            entry["amount"] = str(float(entry["amount"]) - consumed)
+            if float(entry["amount"]) <= 0:
+                self.entries[product_id].remove(entry)
+            if amount <= 0:
+                break
+        return 200, []
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._respond(*mock.handle("GET", self.path, {}))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                self._respond(*mock.handle("POST", self.path, body))
+
+            def _respond(self, status: int, payload: object) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def fixture_entries(path: str, products: int, amount: float) -> dict[int, list[dict]]:
+    """
+    Stock entries for products 1..products, copied from a response fixture
+    """
+    with open(path, "r") as f:
+        entries = json.load(f)
+    return {
+        product_id: [
+            dict(entry, product_id=str(product_id), amount=str(amount))
+            for entry in entries
+        ]
+        for product_id in range(1, products + 1)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a mock Grocy API")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--fixture", default="tests/responses/product_stock_entries_not_open.json"
+    )
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--amount", type=float, default=1000)
+    args = parser.parse_args()
+
+    grocy = MockGrocy(
+        entries=fixture_entries(args.fixture, args.products, args.amount),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        port=args.port,
+    )
+    print(grocy.url, flush=True)
+    try:
+        grocy._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
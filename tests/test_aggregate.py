@@ -0,0 +1,101 @@
+import time
+import unittest
+
+from src.aggregate import ScanAggregator
+from src.api_client import ApiClient
+from src.dedup import ScanDeduplicator
+from src.pipeline import ScanPipeline
+from tests.mock_grocy import MockGrocy
+
+ENTRIES = {
+    1: [{"stock_id": "abc", "amount": "6", "open": "1"}],
+    2: [{"stock_id": "def", "amount": "6", "open": "1"}],
+    3: [{"stock_id": "ghi", "amount": "8", "open": "0"}],
+}
+
+
+class TestScanAggregator(unittest.TestCase):
+    def setUp(self):
+        self.grocy = MockGrocy(
+            entries={k: [dict(e) for e in v] for k, v in ENTRIES.items()}
+        ).start()
+        self.pipeline = ScanPipeline(ApiClient(api_url=self.grocy.url, api_key="key"))
+
+    def tearDown(self):
+        self.grocy.stop()
+
+    def test_repeat_scans_are_one_transaction(self):
+        aggregator = ScanAggregator(self.pipeline, window=10)
+        for _ in range(4):
+            self.assertEqual(aggregator.add("grcy:p:1:abc"), [])
+        self.assertEqual(self.grocy.count("POST"), 0)
+        results = aggregator.flush()
+        self.assertEqual([result.status for result in results], ["done"])
+        self.assertEqual(self.grocy.count("POST", "/consume"), 1)
+        self.assertEqual(self.grocy.entries[1][0]["amount"], "2.0")
+        self.assertEqual(
+            aggregator.stats(), {"scans": 4, "transactions": 1, "pending": 0}
+        )
+
+    def test_unopened_product_opens_one(self):
+        aggregator = ScanAggregator(self.pipeline, window=10)
+        for _ in range(6):
+            aggregator.add("grcy:p:3")
+        aggregator.flush()
+        actions = [
+            path.rsplit("/", 1)[1]
+            for method, path in self.grocy.requests
+            if method == "POST"
+        ]
+        self.assertEqual(actions, ["open", "consume"])
+        # The opened item and four more are gone, the rest is still unopened
+        self.assertEqual(
+            self.grocy.entries[3], [{"stock_id": "ghi", "amount": "3.0", "open": "0"}]
+        )
+
+    def test_other_code_flushes(self):
+        aggregator = ScanAggregator(self.pipeline, window=10)
+        aggregator.add("grcy:p:1:abc")
+        aggregator.add("grcy:p:1:abc")
+        results = aggregator.add("grcy:p:2:def")
+        self.assertEqual([result.code for result in results], ["grcy:p:1:abc"])
+        self.assertEqual(self.grocy.entries[1][0]["amount"], "4.0")
+        aggregator.flush()
+        self.assertEqual(self.grocy.entries[2][0]["amount"], "5.0")
+
+    def test_other_location_flushes(self):
+        aggregator = ScanAggregator(self.pipeline, window=10)
+        aggregator.add("grcy:p:1:abc", location_id=1)
+        self.assertEqual(len(aggregator.add("grcy:p:1:abc", location_id=2)), 1)
+
+    def test_expired_group_is_flushed(self):
+        aggregator = ScanAggregator(self.pipeline, window=0.05)
+        aggregator.add("grcy:p:1:abc")
+        aggregator.add("grcy:p:1:abc")
+        self.assertEqual(aggregator.flush_expired(), [])
+        time.sleep(0.06)
+        self.assertEqual(len(aggregator.flush_expired()), 1)
+        self.assertEqual(self.grocy.entries[1][0]["amount"], "4.0")
+        self.assertEqual(aggregator.flush_expired(), [])
+
+    def test_other_code_types_keep_order(self):
+        aggregator = ScanAggregator(self.pipeline, window=10)
+        aggregator.add("grcy:p:1:abc")
+        results = aggregator.add("nonsense")
+        self.assertEqual(
+            [(result.code, result.status) for result in results],
+            [("grcy:p:1:abc", "done"), ("nonsense", "failed")],
+        )
+
+    def test_repeats_within_dedup_window_are_ignored(self):
+        self.pipeline.deduplicator = ScanDeduplicator(window=10)
+        aggregator = ScanAggregator(self.pipeline, window=10)
+        aggregator.add("grcy:p:1:abc")
+        results = aggregator.add("grcy:p:1:abc")
+        self.assertEqual([result.status for result in results], ["ignored"])
+        aggregator.flush()
+        self.assertEqual(self.grocy.entries[1][0]["amount"], "5.0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,30 @@
+import asyncio
 import json
 import unittest
 from unittest.mock import MagicMock, patch
 
-from src.api_client import APIException, ApiClient
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from src.api_client import (
+    APIException,
+    ApiClient,
+    AsyncApiClient,
+    CircuitBreaker,
+    NotEnoughStockError,
+    ProductNotFoundError,
+    UnavailableError,
+    classify_error,
+    SessionPool,
+    endpoint_of,
+    get_executor,
+    get_session_pool,
+)
 
 
 class TestApiClient(unittest.TestCase):
     @patch("src.api_client.os.getenv", return_value="something")
-    @patch("src.api_client.requests.get")
+    @patch("src.api_client.requests.Session.get")
     def test_get_raises_exception_on_http_error(self, mock_get, mock_getenv):
         mock_get.return_value = MagicMock(status_code=500)
         with self.assertRaises(APIException) as context:
@@ -15,14 +32,14 @@ class TestApiClient(unittest.TestCase):
         self.assertIsNotNone(context.exception.status_code)
 
     @patch("src.api_client.os.getenv", return_value="something")
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_post_raises_exception_on_http_error(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(status_code=500)
         with self.assertRaises(APIException) as context:
             ApiClient().post("/api/stock/products/by-barcode/12345", data={})
         self.assertIsNotNone(context.exception.status_code)
 
-    @patch("src.api_client.requests.get")
+    @patch("src.api_client.requests.Session.get")
     @patch("src.api_client.os.getenv")
     def test_correct_base_url_through_env(self, mock_getenv, mock_get):
         mock_get.return_value = MagicMock(status_code=200, response=json.dumps({}))
@@ -33,7 +50,7 @@ class TestApiClient(unittest.TestCase):
         self.assertIn(URL, mock_get.call_args.kwargs["url"])
 
     @patch("src.api_client.os.getenv", return_value="something")
-    @patch("src.api_client.requests.get")
+    @patch("src.api_client.requests.Session.get")
     def test_correct_base_url_through_param(self, mock_get, mock_getenv):
         mock_get.return_value = MagicMock(status_code=200, response=json.dumps({}))
         URL = "http://localhost:8080"
@@ -46,6 +63,252 @@ class TestApiClient(unittest.TestCase):
         with self.assertRaises(ValueError):
             ApiClient()
 
+    @patch("src.api_client.os.getenv", return_value="something")
+    @patch("src.api_client.requests.Session.get")
+    def test_timeout_is_passed(self, mock_get, mock_getenv):
+        mock_get.return_value = MagicMock(status_code=200)
+        ApiClient(timeout=(1, 2)).get("/api/stock")
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], (1, 2))
+
+    @patch("src.api_client.os.getenv", return_value="something")
+    def test_clients_share_session_pool(self, mock_getenv):
+        self.assertIs(ApiClient().session_pool, ApiClient().session_pool)
+        self.assertIs(ApiClient().session_pool, get_session_pool())
+
+    def test_endpoint_of(self):
+        self.assertEqual(
+            endpoint_of("/api/stock/products/235/entries"),
+            "/api/stock/products/{id}/entries",
+        )
+        self.assertEqual(
+            endpoint_of("/api/stock/products/by-barcode/grcy:p:1:x62/open"),
+            "/api/stock/products/by-barcode/{barcode}/open",
+        )
+
+
+def response(status_code: int, payload: object = None, reason: str = "") -> MagicMock:
+    mock = MagicMock(status_code=status_code, reason=reason, text=str(payload))
+    if isinstance(payload, str):
+        mock.json.side_effect = json.JSONDecodeError("Expecting value", payload, 0)
+    else:
+        mock.json.return_value = payload
+    return mock
+
+
+@patch("src.api_client.time.sleep")
+class TestApiClientResilience(unittest.TestCase):
+    def setUp(self):
+        self.api_client = ApiClient(api_url="http://grocy", api_key="key")
+
+    @patch("src.api_client.requests.Session.get")
+    def test_html_error_page(self, mock_get, mock_sleep):
+        mock_get.return_value = response(500, "<html>Oops</html>", "Internal Error")
+        with self.assertRaises(APIException) as error:
+            self.api_client.get("/api/stock")
+        self.assertEqual(str(error.exception), "HTTP 500 Internal Error")
+        self.assertEqual(error.exception.status_code, 500)
+        self.assertEqual(error.exception.payload, "<html>Oops</html>")
+
+    @patch("src.api_client.requests.Session.get")
+    def test_invalid_success_response(self, mock_get, mock_sleep):
+        mock_get.return_value = response(200, "<html></html>")
+        with self.assertRaises(APIException) as error:
+            self.api_client.get("/api/stock")
+        self.assertIn("Invalid response from Grocy", str(error.exception))
+
+    @patch("src.api_client.requests.Session.get")
+    def test_get_is_retried(self, mock_get, mock_sleep):
+        mock_get.side_effect = [
+            response(502, "<html>Bad Gateway</html>", "Bad Gateway"),
+            requests.ConnectionError("Connection refused"),
+            response(200, [{"id": 1}]),
+        ]
+        self.assertEqual(self.api_client.get("/api/stock"), [{"id": 1}])
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("src.api_client.requests.Session.get")
+    def test_retries_are_limited(self, mock_get, mock_sleep):
+        mock_get.return_value = response(503, {"error_message": "Unavailable"})
+        with self.assertRaises(APIException):
+            self.api_client.get("/api/stock")
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch("src.api_client.requests.Session.get")
+    def test_client_errors_are_not_retried(self, mock_get, mock_sleep):
+        mock_get.return_value = response(400, {"error_message": "Bad request"})
+        with self.assertRaises(APIException):
+            self.api_client.get("/api/stock")
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("src.api_client.requests.Session.get")
+    def test_retries_stop_at_the_deadline(self, mock_get, mock_sleep):
+        api_client = ApiClient(api_url="http://grocy", api_key="key", deadline=0)
+        mock_get.return_value = response(503, {"error_message": "Unavailable"})
+        with self.assertRaises(APIException):
+            api_client.get("/api/stock")
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("src.api_client.requests.Session.post")
+    def test_post_is_not_retried_once_sent(self, mock_post, mock_sleep):
+        mock_post.side_effect = requests.ReadTimeout("Read timed out")
+        with self.assertRaises(APIException):
+            self.api_client.post("/api/stock/products/1/open", {"amount": 1})
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch("src.api_client.requests.Session.post")
+    def test_post_is_retried_when_not_connected(self, mock_post, mock_sleep):
+        mock_post.side_effect = [
+            requests.ConnectTimeout("Connect timed out"),
+            response(200, {}),
+        ]
+        self.api_client.post("/api/stock/products/1/open", {"amount": 1})
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("src.api_client.requests.Session.post")
+    def test_post_is_retried_when_refused(self, mock_post, mock_sleep):
+        refused = NewConnectionError(None, "Connection refused")
+        mock_post.side_effect = [
+            requests.ConnectionError(MaxRetryError(None, "/", refused)),
+            response(200, {}),
+        ]
+        self.api_client.post("/api/stock/products/1/open", {"amount": 1})
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("src.api_client.requests.Session.post")
+    def test_post_is_not_retried_when_aborted(self, mock_post, mock_sleep):
+        aborted = ProtocolError("Connection aborted.")
+        mock_post.side_effect = requests.ConnectionError(aborted)
+        with self.assertRaises(APIException):
+            self.api_client.post("/api/stock/products/1/open", {"amount": 1})
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch("src.api_client.requests.Session.get")
+    def test_circuit_breaker_fails_fast(self, mock_get, mock_sleep):
+        api_client = ApiClient(
+            api_url="http://grocy",
+            api_key="key",
+            retries=0,
+            circuit_breaker=CircuitBreaker(threshold=2, reset_timeout=60),
+        )
+        mock_get.return_value = response(503, {"error_message": "Unavailable"})
+        for _ in range(3):
+            with self.assertRaises(APIException) as error:
+                api_client.get("/api/stock")
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertIsNone(error.exception.status_code)
+        self.assertEqual(
+            api_client.circuit_breaker.stats(), {"open": 1, "opened": 1, "rejected": 1}
+        )
+
+
+class TestClassifyError(unittest.TestCase):
+    def test_rules(self):
+        cases = [
+            ("Product does not exist or is inactive", 400, ProductNotFoundError),
+            (
+                "No transaction was found by the given transaction id",
+                400,
+                NotEnoughStockError,
+            ),
+            (
+                "Amount to be consumed cannot be > current stock amount"
+                " (if supplied, at the desired location)",
+                400,
+                NotEnoughStockError,
+            ),
+            ("Grocy is unreachable", None, UnavailableError),
+            ("Too many requests", 429, UnavailableError),
+            ("HTTP 502 Bad Gateway", 502, UnavailableError),
+            ("Product does not exist or is inactive", 500, UnavailableError),
+            ("Something else", 400, APIException),
+        ]
+        for message, status_code, exception in cases:
+            with self.subTest(message=message, status_code=status_code):
+                error = classify_error(message, status_code)
+                self.assertIs(type(error), exception)
+                self.assertEqual(error.status_code, status_code)
+
+    def test_retryable(self):
+        self.assertTrue(classify_error("Unavailable", 503).retryable)
+        self.assertFalse(classify_error("Bad request", 400).retryable)
+
+    @patch("src.api_client.requests.Session.post")
+    def test_client_raises_typed_errors(self, mock_post):
+        mock_post.return_value = response(
+            400, {"error_message": "Product does not exist or is inactive"}
+        )
+        with self.assertRaises(ProductNotFoundError):
+            ApiClient(api_url="http://grocy", api_key="key").post(
+                "/api/stock/products/1/open", {"amount": 1}
+            )
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_single_trial_after_reset_timeout(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.record(success=False)
+        self.assertTrue(breaker.is_open)
+        breaker.before_request()
+        with self.assertRaises(APIException):
+            breaker.before_request()
+        breaker.record(success=True)
+        self.assertFalse(breaker.is_open)
+        breaker.before_request()
+
+    def test_failed_trial_opens_again(self):
+        breaker = CircuitBreaker(threshold=3, reset_timeout=0)
+        for _ in range(3):
+            breaker.record(success=False)
+        breaker.before_request()
+        breaker.record(success=False)
+        self.assertTrue(breaker.is_open)
+        self.assertEqual(breaker.opened, 1)
+
+
+class TestSessionPool(unittest.TestCase):
+    def test_session_is_reused(self):
+        pool = SessionPool(pool_size=2)
+        self.assertIs(pool.get_session(), pool.get_session())
+
+    @patch("src.api_client.time.monotonic")
+    def test_idle_session_is_refreshed(self, mock_monotonic):
+        pool = SessionPool(pool_size=2, idle_timeout=60)
+        mock_monotonic.return_value = 0
+        session = pool.get_session()
+        mock_monotonic.return_value = 30
+        self.assertIs(pool.get_session(), session)
+        mock_monotonic.return_value = 100
+        self.assertIsNot(pool.get_session(), session)
+
+    def test_pool_size_is_applied(self):
+        pool = SessionPool(pool_size=7)
+        adapter = pool.get_session().get_adapter("https://localhost")
+        self.assertEqual(adapter._pool_maxsize, 7)  # type: ignore
+
+
+class TestAsyncApiClient(unittest.TestCase):
+    def test_get_awaits_sync_client(self):
+        api_client = MagicMock()
+        api_client.get.return_value = {"id": 1}
+        result = asyncio.run(AsyncApiClient(api_client).get("/api/stock"))
+        self.assertEqual(result, {"id": 1})
+        api_client.get.assert_called_with("/api/stock")
+
+    def test_post_awaits_sync_client(self):
+        api_client = MagicMock()
+        asyncio.run(AsyncApiClient(api_client).post("/api/stock", {"amount": 1}))
+        api_client.post.assert_called_with("/api/stock", {"amount": 1})
+
+    def test_errors_are_raised(self):
+        api_client = MagicMock()
+        api_client.get.side_effect = APIException("Not found", 404)
+        with self.assertRaises(APIException):
+            asyncio.run(AsyncApiClient(api_client).get("/api/stock"))
+
+    def test_clients_share_executor(self):
+        self.assertIs(AsyncApiClient(MagicMock()).executor, get_executor())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from src.api_client import ApiClient, ProductNotFoundError
+from src.barcode import BarcodeResolver
+from tests.mock_grocy import MockGrocy
+
+
+class TestBarcodeResolver(unittest.TestCase):
+    def test_resolves_barcode(self):
+        with MockGrocy(barcodes={"4006381333931": 5}) as grocy:
+            resolver = BarcodeResolver(ApiClient(api_url=grocy.url, api_key="key"))
+            self.assertEqual(resolver.resolve("4006381333931"), 5)
+
+    def test_unknown_barcode_raises(self):
+        with MockGrocy() as grocy:
+            resolver = BarcodeResolver(ApiClient(api_url=grocy.url, api_key="key"))
+            with self.assertRaises(ProductNotFoundError):
+                resolver.resolve("4006381333931")
+
+    def test_repeat_lookups_are_cached(self):
+        api_client = MagicMock()
+        api_client.get.return_value = {"product": {"id": "5"}}
+        resolver = BarcodeResolver(api_client)
+        resolver.resolve("4006381333931")
+        asyncio.run(resolver.resolve_async("4006381333931"))
+        api_client.get.assert_called_once()
+        self.assertEqual(resolver.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_cache_is_bounded(self):
+        api_client = MagicMock()
+        api_client.get.return_value = {"product": {"id": "5"}}
+        resolver = BarcodeResolver(api_client, max_size=2)
+        for barcode in ("11111111", "22222222", "11111111", "33333333"):
+            resolver.resolve(barcode)
+        resolver.resolve("11111111")
+        self.assertEqual(api_client.get.call_count, 3)
+        self.assertEqual(resolver.stats()["size"], 2)
+
+    def test_invalidate_forgets_barcode(self):
+        api_client = MagicMock()
+        api_client.get.return_value = {"product": {"id": "5"}}
+        resolver = BarcodeResolver(api_client)
+        resolver.resolve("11111111")
+        resolver.invalidate("11111111")
+        resolver.resolve("11111111")
+        self.assertEqual(api_client.get.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
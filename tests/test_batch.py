@@ -0,0 +1,132 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from src.api_client import ApiClient
+from src.barcode import BarcodeResolver
+from src.batch import BatchProcessor, BatchSummary
+from src.dedup import ScanDeduplicator
+from src.grocycode import InvalidGrocyCodeException, UnknownCodeTypeException
+from src.pipeline import ScanPipeline, ScanQueuedException
+from tests.mock_grocy import MockGrocy
+
+
+class TestBatchProcessor(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = MagicMock()
+        self.pipeline.is_duplicate.return_value = False
+        self.batch = BatchProcessor(self.pipeline, workers=4)
+
+    def tearDown(self):
+        self.batch.close()
+
+    def test_summary(self):
+        outcomes = {
+            "grcy:p:1": None,
+            "grcy:p:2": ScanQueuedException("queued"),
+            "123": InvalidGrocyCodeException("Invalid Grocycode"),
+        }
+
+        def process(code, location_id=None, deduplicate=True):
+            if outcomes[code]:
+                raise outcomes[code]
+
+        self.pipeline.process.side_effect = process
+        self.pipeline.is_duplicate.side_effect = lambda code: code == "grcy:p:3"
+        for code in [*outcomes, "grcy:p:3"]:
+            self.batch.submit(code)
+        summary = self.batch.flush(timeout=5)
+
+        self.assertEqual(summary.done, 1)
+        self.assertEqual(summary.queued, 1)
+        self.assertEqual(summary.ignored, 1)
+        self.assertEqual(summary.failures, [("123", "Invalid Grocycode")])
+        self.assertEqual(summary.total, 4)
+        self.assertEqual(self.batch.pending(), 0)
+        # The next batch starts empty
+        self.assertEqual(self.batch.flush(timeout=5).total, 0)
+
+    def test_unknown_code_type(self):
+        self.pipeline.process.side_effect = UnknownCodeTypeException("Unknown type")
+        self.batch.submit("grcy:x:1")
+        summary = self.batch.flush(timeout=5)
+        self.assertEqual(summary.failures, [("grcy:x:1", "Unknown type")])
+        self.assertEqual(self.batch.pending(), 0)
+
+    def test_same_product_in_order(self):
+        processed = []
+
+        def process(code, location_id=None, deduplicate=True):
+            # The first scan is the slowest, it must still be processed first
+            time.sleep(0.05 if code == "grcy:p:1:a" else 0)
+            processed.append(code)
+
+        self.pipeline.process.side_effect = process
+        for code in ("grcy:p:1:a", "grcy:p:1:b", "grcy:p:1"):
+            self.batch.submit(code)
+        self.batch.flush(timeout=5)
+
+        self.assertEqual(processed, ["grcy:p:1:a", "grcy:p:1:b", "grcy:p:1"])
+
+    def test_products_concurrently(self):
+        started = threading.Barrier(2, timeout=5)
+
+        def process(code, location_id=None, deduplicate=True):
+            # Only returns once both products are being processed at the same time
+            started.wait()
+
+        self.pipeline.process.side_effect = process
+        codes = [f"grcy:p:{product_id}" for product_id in range(1, 20)]
+        # Find two products handled by different workers
+        first = codes[0]
+        second = next(
+            c for c in codes if self.batch._route(c) != self.batch._route(first)
+        )
+        self.batch.submit(first, location_id=2)
+        self.batch.submit(second)
+        summary = self.batch.flush(timeout=5)
+
+        self.assertEqual(summary.done, 2)
+        self.pipeline.process.assert_any_call(first, location_id=2, deduplicate=False)
+
+    def test_resolved_barcode_goes_to_its_product(self):
+        self.pipeline.barcode_resolver = BarcodeResolver(MagicMock())
+        self.pipeline.barcode_resolver.restore({"4006381333931": 7})
+        self.assertEqual(
+            self.batch._route("4006381333931"), self.batch._route("grcy:p:7")
+        )
+
+
+class TestBatchDeduplication(unittest.TestCase):
+    def test_repeat_is_judged_on_arrival(self):
+        entries = {1: [{"stock_id": "abc", "amount": "2", "open": "1"}]}
+        # Each request takes longer than the window, the repeat is processed
+        # after the window ended but was scanned within it
+        with MockGrocy(entries=entries, latency=0.3) as grocy:
+            pipeline = ScanPipeline(
+                ApiClient(api_url=grocy.url, api_key="key"),
+                deduplicator=ScanDeduplicator(window=0.2),
+            )
+            batch = BatchProcessor(pipeline, workers=2)
+            try:
+                batch.submit("grcy:p:1")
+                batch.submit("grcy:p:1")
+                summary = batch.flush(timeout=5)
+            finally:
+                batch.close()
+            self.assertEqual((summary.done, summary.ignored), (1, 1))
+            self.assertEqual(grocy.count("POST"), 1)
+
+
+class TestBatchSummary(unittest.TestCase):
+    def test_str(self):
+        summary = BatchSummary(done=2, queued=1, failures=[("grcy:p:9", "Gone")])
+        self.assertEqual(
+            str(summary),
+            "Batch of 4 scans: 2 done, 1 queued, 1 failed\ngrcy:p:9: Gone",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import MagicMock
+
+from src.api_client import SUPPRESSED_ERRORS, ApiClient, UnavailableError
+from src.change_watcher import ChangeWatcher
+from src.stock_cache import StockCache
+from src.stock_snapshot import StockSnapshot
+from tests.mock_grocy import MockGrocy
+
+ENTRIES = {1: [{"stock_id": "abc", "amount": "2", "open": "0"}]}
+
+
+class TestChangeWatcher(unittest.TestCase):
+    def setUp(self):
+        self.grocy = MockGrocy(entries=ENTRIES).start()
+        self.api_client = ApiClient(api_url=self.grocy.url, api_key="key")
+        self.watcher = ChangeWatcher(self.api_client)
+
+    def tearDown(self):
+        self.grocy.stop()
+
+    def test_first_poll_is_only_a_baseline(self):
+        subscriber = MagicMock()
+        self.watcher.subscribe(subscriber)
+        self.assertFalse(self.watcher.poll())
+        subscriber.assert_not_called()
+
+    def test_publishes_changes(self):
+        subscriber = MagicMock()
+        self.watcher.subscribe(subscriber)
+        self.watcher.poll()
+        self.assertFalse(self.watcher.poll())
+        self.assertFalse(subscriber.call_args.args[0].changed)
+        self.grocy.changes += 1
+        self.assertTrue(self.watcher.poll())
+        event = subscriber.call_args.args[0]
+        self.assertTrue(event.changed)
+        self.assertEqual(event.changed_time, "2022-04-10 11:00:01")
+        self.assertEqual(self.watcher.stats(), {"polls": 3, "changes": 1})
+
+    def test_one_request_per_poll_while_unchanged(self):
+        cache = StockCache()
+        snapshot = StockSnapshot(cache, api_client=self.api_client)
+        snapshot.refresh()
+        for component in (cache, snapshot):
+            self.watcher.subscribe(component.on_change)
+        requests = self.grocy.count()
+        for _ in range(3):
+            self.watcher.poll()
+        self.assertEqual(self.grocy.count(), requests + 3)
+
+        self.grocy.entries[1][0]["open"] = "1"
+        self.grocy.changes += 1
+        self.watcher.poll()
+        self.assertTrue(cache.get(1)[0].open)  # type: ignore
+        self.assertEqual(self.grocy.count("GET", "/api/objects/stock"), 2)
+
+    def test_subscriber_errors_are_suppressed(self):
+        failing, other = MagicMock(), MagicMock()
+        failing.side_effect = UnavailableError("Grocy is unreachable")
+        self.watcher.subscribe(failing)
+        self.watcher.subscribe(other)
+        before = SUPPRESSED_ERRORS.value(
+            component="change_watcher", type="UnavailableError"
+        )
+        self.watcher.poll()
+        self.watcher.poll()
+        other.assert_called_once()
+        self.assertEqual(
+            SUPPRESSED_ERRORS.value(
+                component="change_watcher", type="UnavailableError"
+            ),
+            before + 1,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.dedup import ScanDeduplicator
+from src.grocycode import GrocyCode
+from src.pipeline import DuplicateScanException, ScanPipeline
+
+
+@patch("src.dedup.time.monotonic")
+class TestScanDeduplicator(unittest.TestCase):
+    def test_repeat_within_window_is_suppressed(self, mock_monotonic):
+        deduplicator = ScanDeduplicator(window=0.5)
+        mock_monotonic.return_value = 0
+        self.assertFalse(deduplicator.is_duplicate("a"))
+        mock_monotonic.return_value = 0.3
+        self.assertTrue(deduplicator.is_duplicate("a"))
+        self.assertFalse(deduplicator.is_duplicate("b"))
+        self.assertEqual(deduplicator.suppressed, 1)
+
+    def test_repeat_after_window_passes(self, mock_monotonic):
+        deduplicator = ScanDeduplicator(window=0.5)
+        mock_monotonic.return_value = 0
+        deduplicator.is_duplicate("a")
+        mock_monotonic.return_value = 0.6
+        self.assertFalse(deduplicator.is_duplicate("a"))
+
+    def test_memory_is_bounded(self, mock_monotonic):
+        deduplicator = ScanDeduplicator(window=10, max_size=3)
+        mock_monotonic.return_value = 0
+        for key in range(10):
+            deduplicator.is_duplicate(key)
+        self.assertEqual(len(deduplicator._seen), 3)
+
+    def test_keyed_on_parsed_code(self, mock_monotonic):
+        deduplicator = ScanDeduplicator(window=0.5)
+        mock_monotonic.return_value = 0
+        deduplicator.is_duplicate(GrocyCode("grcy:p:01:abc").key)
+        self.assertTrue(deduplicator.is_duplicate(GrocyCode("grcy:p:1:abc").key))
+        self.assertFalse(deduplicator.is_duplicate(GrocyCode("grcy:p:1:def").key))
+
+
+class TestPipelineDeduplication(unittest.TestCase):
+    @patch("src.grocycode.GrocyCode.get_product")
+    def test_duplicate_skips_requests(self, mock_get_product):
+        pipeline = ScanPipeline(
+            api_client=MagicMock(), deduplicator=ScanDeduplicator(window=60)
+        )
+        pipeline.process("grcy:p:1")
+        with self.assertRaises(DuplicateScanException):
+            pipeline.process("grcy:p:1")
+        mock_get_product.return_value.open_or_consume.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
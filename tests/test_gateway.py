@@ -0,0 +1,83 @@
+import json
+import socket
+import unittest
+import urllib.error
+import urllib.request
+
+from src.api_client import ApiClient
+from src.gateway import Gateway
+from src.pipeline import ScanPipeline
+from src.stock_cache import StockCache
+from tests.mock_grocy import MockGrocy
+
+ENTRIES = {
+    1: [{"stock_id": "abc", "amount": "3", "open": "0", "location_id": "2"}],
+}
+
+
+class TestGateway(unittest.TestCase):
+    def setUp(self):
+        self.grocy = MockGrocy(entries=ENTRIES).start()
+        pipeline = ScanPipeline(
+            ApiClient(api_url=self.grocy.url, api_key="key"), stock_cache=StockCache()
+        )
+        self.gateway = Gateway(pipeline, host="127.0.0.1", http_port=0, tcp_port=0)
+        self.gateway.start()
+
+    def tearDown(self):
+        self.gateway.stop()
+        self.grocy.stop()
+
+    def post(self, data: bytes, content_type: str, query: str = "") -> tuple[int, dict]:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{self.gateway.http_port}/scan{query}",
+            data=data,
+            headers={"Content-Type": content_type},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    def test_http_json_scan(self):
+        status, result = self.post(
+            json.dumps({"code": "grcy:p:1", "location_id": 2}).encode(),
+            "application/json",
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(result, {"code": "grcy:p:1", "status": "done", "message": ""})
+        self.assertEqual(self.grocy.count("POST", "/open"), 1)
+
+    def test_http_plain_scan(self):
+        status, result = self.post(b"grcy:p:1\n", "text/plain", "?location_id=2")
+        self.assertEqual((status, result["status"]), (200, "done"))
+
+    def test_http_failures(self):
+        for code, expected in (("grcy:p", 400), ("grcy:p:7", 409)):
+            with self.subTest(code=code):
+                status, result = self.post(code.encode(), "text/plain")
+                self.assertEqual((status, result["status"]), (expected, "failed"))
+        status, _ = self.post(b"{}", "application/json")
+        self.assertEqual(status, 400)
+
+    def test_tcp_scans_share_one_pipeline(self):
+        with socket.create_connection(("127.0.0.1", self.gateway.tcp_port)) as first:
+            with socket.create_connection(
+                ("127.0.0.1", self.gateway.tcp_port)
+            ) as second:
+                replies = []
+                for connection in (first, second):
+                    connection.sendall(b"grcy:p:1\t2\n")
+                    replies.append(connection.makefile().readline())
+                second.sendall(b"grcy:p:1\tx\n")
+                replies.append(second.makefile().readline())
+        self.assertEqual(replies, ["done\n", "done\n", "failed Invalid location\n"])
+        # The second scan is answered from the stock cache of the first
+        self.assertEqual(self.grocy.count("GET", "/api/stock/products/1/entries"), 1)
+        self.assertEqual(self.grocy.count("POST", "/consume"), 1)
+        self.assertEqual(self.gateway.stats()["done"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
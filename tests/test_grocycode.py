@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from src.grocycode import (
     CodeType,
@@ -7,6 +7,7 @@ from src.grocycode import (
     InvalidGrocyCodeException,
     NotAProductException,
     UnknownCodeTypeException,
+    parse,
 )
 from src.product import Product
 
@@ -39,6 +40,11 @@ class TestGrocycode(unittest.TestCase):
         self.assertEqual(product.id, 1)
         self.assertEqual(product.stock_id, "x624f2505ded59")
 
+    def test_code_passes_api_client_to_product(self):
+        api_client = MagicMock()
+        product = GrocyCode("grcy:p:1").get_product(api_client=api_client)
+        self.assertIs(product.api_client, api_client)
+
     def test_invalid_code_raises_exception(self):
         CODE = "123"
         with self.assertRaises(InvalidGrocyCodeException):
@@ -61,6 +67,40 @@ class TestGrocycode(unittest.TestCase):
 
         self.assertIn(f"Not a product code: '{CODE}'", str(error.exception))
 
+    def test_code_parsing_of_other_types(self):
+        for code, code_type in (
+            ("grcy:b:3", CodeType.BATTERY),
+            ("grcy:c:3", CodeType.CHORE),
+            ("grcy:r:3", CodeType.RECIPE),
+        ):
+            with self.subTest(code=code):
+                grocycode = GrocyCode(code)
+                self.assertEqual((grocycode.type, grocycode.id), (code_type, 3))
+
+    def test_code_parsing_of_barcodes(self):
+        for code in ("96385074", "036000291452", "4006381333931", "14006381333938"):
+            with self.subTest(code=code):
+                grocycode = GrocyCode(code)
+                self.assertEqual(grocycode.type, CodeType.BARCODE)
+                self.assertIsNone(grocycode.id)
+                self.assertEqual(grocycode.key, (CodeType.BARCODE, code, None))
+
+    def test_invalid_barcode_length_raises_exception(self):
+        with self.assertRaises(InvalidGrocyCodeException):
+            GrocyCode("1234567890")
+
+    def test_barcode_is_not_a_product(self):
+        with self.assertRaises(NotAProductException):
+            GrocyCode("4006381333931").get_product()
+
+    def test_parse_reuses_parsed_codes(self):
+        self.assertIs(parse("grcy:p:1:abc"), parse("grcy:p:1:abc"))
+        self.assertIsNot(parse("grcy:p:1:abc"), parse("grcy:p:1:def"))
+
+    def test_parse_raises_on_invalid_code(self):
+        with self.assertRaises(InvalidGrocyCodeException):
+            parse("123")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,281 @@
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from src.api_client import (
+    SUPPRESSED_ERRORS,
+    ApiClient,
+    ProductNotFoundError,
+    UnavailableError,
+)
+from src.journal import Journal, JournalReplayer, can_queue
+from src.pipeline import ScanPipeline, ScanQueuedException
+from src.product import ProductNotExistsException, Product
+from tests.mock_grocy import MockGrocy
+
+
+def unreachable() -> UnavailableError:
+    # What ApiClient raises when it could not connect to Grocy
+    error = UnavailableError("Grocy is unreachable")
+    error.method = "post"
+    error.__cause__ = requests.ConnectionError(
+        MaxRetryError(None, "/", NewConnectionError(None, "Connection refused"))  # type: ignore
+    )
+    return error
+
+
+class AbortingHandler(socketserver.StreamRequestHandler):
+    """
+    Reads a whole request and drops the connection without answering
+    """
+
+    def handle(self):
+        length = 0
+        for line in self.rfile:
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+            if line in (b"\r\n", b"\n"):
+                break
+        self.rfile.read(length)
+        self.server.received += 1  # type: ignore
+
+
+class TestCanQueue(unittest.TestCase):
+    def test_write_whose_connection_was_aborted_is_not_queued(self):
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), AbortingHandler)
+        server.received = 0  # type: ignore
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            api_client = ApiClient(
+                api_url=f"http://127.0.0.1:{server.server_address[1]}",
+                api_key="key",
+                retries=0,
+            )
+            with self.assertRaises(UnavailableError) as error:
+                api_client.post("/api/stock/products/1/open", data={"amount": 1})
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertEqual(server.received, 1)  # type: ignore
+        self.assertIsInstance(error.exception.__cause__, requests.ConnectionError)
+        self.assertFalse(can_queue(error.exception))
+
+    def test_write_that_could_not_connect_is_queued(self):
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+        api_client = ApiClient(
+            api_url=f"http://127.0.0.1:{port}", api_key="key", retries=0
+        )
+        with self.assertRaises(UnavailableError) as error:
+            api_client.post("/api/stock/products/1/open", data={"amount": 1})
+        self.assertTrue(can_queue(error.exception))
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "journal.sqlite3")
+        self.journal = Journal(self.path)
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+
+class TestJournal(JournalTestCase):
+    def test_operations_are_kept_in_order(self):
+        self.journal.append("open", Product(id=1))
+        self.journal.append("consume", Product(id=2, stock_id="abc"), amount=2)
+        first = self.journal.peek()
+        self.assertEqual((first.action, first.product_id), ("open", 1))  # type: ignore
+        self.journal.remove(first.id)  # type: ignore
+        second = self.journal.peek()
+        self.assertEqual(
+            (second.action, second.product_id, second.stock_id, second.amount),  # type: ignore
+            ("consume", 2, "abc", 2),
+        )
+        self.assertEqual(self.journal.pending(), 1)
+
+    def test_operations_survive_reopening(self):
+        self.journal.append("open_or_consume", Product(id=1, grocycode="grcy:p:1"))
+        self.journal.close()
+        self.journal = Journal(self.path)
+        self.assertEqual(self.journal.peek().grocycode, "grcy:p:1")  # type: ignore
+        self.assertEqual(self.journal.pending(), 1)
+        self.journal.remove(self.journal.peek().id)  # type: ignore
+        self.journal.remove(0)
+        self.assertEqual(self.journal.pending(), 0)
+
+    def test_unknown_action_raises(self):
+        with self.assertRaises(ValueError):
+            self.journal.append("delete", Product(id=1))
+
+    def test_compact_keeps_pending(self):
+        for product_id in range(10):
+            self.journal.append("open", Product(id=product_id))
+        for _ in range(9):
+            self.journal.remove(self.journal.peek().id)  # type: ignore
+        self.journal.compact()
+        self.assertEqual(self.journal.pending(), 1)
+
+
+class TestJournalReplayer(JournalTestCase):
+    def test_transient_error_keeps_operation(self):
+        api_client = MagicMock()
+        api_client.post.side_effect = unreachable()
+        self.journal.append("open", Product(id=1))
+        replayer = JournalReplayer(self.journal, api_client=api_client)
+        self.assertFalse(replayer.replay_one())
+        self.assertEqual(self.journal.pending(), 1)
+
+    def test_write_that_may_have_been_applied_is_dropped(self):
+        api_client = MagicMock()
+        error = UnavailableError("HTTP 502 Bad Gateway", 502)
+        error.method = "post"
+        api_client.post.side_effect = error
+        self.journal.append("open", Product(id=1))
+        replayer = JournalReplayer(self.journal, api_client=api_client)
+        with self.assertLogs(level="WARNING"):
+            self.assertTrue(replayer.replay_one())
+        self.assertEqual(self.journal.pending(), 0)
+
+    def test_transient_error_is_counted(self):
+        api_client = MagicMock()
+        api_client.post.side_effect = unreachable()
+        self.journal.append("open", Product(id=1))
+        before = SUPPRESSED_ERRORS.value(component="journal", type="UnavailableError")
+        JournalReplayer(self.journal, api_client=api_client).replay_one()
+        self.assertEqual(
+            SUPPRESSED_ERRORS.value(component="journal", type="UnavailableError"),
+            before + 1,
+        )
+
+    def test_permanent_error_drops_operation(self):
+        api_client = MagicMock()
+        api_client.post.side_effect = ProductNotFoundError(
+            "Product does not exist or is inactive", 400
+        )
+        self.journal.append("open", Product(id=1))
+        replayer = JournalReplayer(self.journal, api_client=api_client)
+        self.assertTrue(replayer.replay_one())
+        self.assertEqual(self.journal.pending(), 0)
+
+    def test_replays_in_order_once_grocy_is_back(self):
+        with open("tests/responses/product_stock_entries_not_open.json") as f:
+            entries = json.load(f)
+        with MockGrocy(entries={2: entries}) as grocy:
+            api_client = ApiClient(api_url=grocy.url, api_key="key")
+            pipeline = ScanPipeline(api_client=api_client, journal=self.journal)
+            replayer = JournalReplayer(
+                self.journal, api_client=api_client, backoff=0.01, max_backoff=0.05
+            )
+            replayer.start()
+
+            grocy.available = False
+            for _ in range(2):
+                with self.assertRaises(ScanQueuedException):
+                    pipeline.process("grcy:p:2")
+            grocy.available = True
+
+            deadline = time.monotonic() + 5
+            while self.journal.pending() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            replayer.stop(timeout=5)
+
+            self.assertEqual(self.journal.pending(), 0)
+            actions = [path for method, path in grocy.requests if method == "POST"]
+            self.assertRegex(actions[0], r".*/open$")
+            self.assertRegex(actions[1], r".*/consume$")
+
+    def test_pipeline_queues_write_that_could_not_connect(self):
+        with MockGrocy(
+            entries={1: [{"stock_id": "abc", "amount": "1", "open": "0"}]}
+        ) as grocy:
+            pipeline = ScanPipeline(
+                api_client=ApiClient(api_url=grocy.url, api_key="key", retries=0),
+                journal=self.journal,
+            )
+            with patch(
+                "src.api_client.requests.Session.post",
+                side_effect=requests.ConnectTimeout("Connect timed out"),
+            ), self.assertRaises(ScanQueuedException):
+                pipeline.process("grcy:p:1")
+        self.assertEqual(self.journal.pending(), 1)
+
+    def test_only_the_rest_is_queued_after_an_open(self):
+        with MockGrocy(
+            entries={1: [{"stock_id": "abc", "amount": "4", "open": "0"}]}
+        ) as grocy:
+            pipeline = ScanPipeline(
+                api_client=ApiClient(api_url=grocy.url, api_key="key", retries=0),
+                journal=self.journal,
+            )
+            post = requests.Session.post
+            responses = iter([None, requests.ConnectTimeout("Connect timed out")])
+
+            def open_then_fail(session, *args, **kwargs):
+                error = next(responses)
+                if error:
+                    raise error
+                return post(session, *args, **kwargs)
+
+            with patch(
+                "src.api_client.requests.Session.post", new=open_then_fail
+            ), self.assertRaises(ScanQueuedException):
+                pipeline.process("grcy:p:1", amount=3)
+        self.assertEqual(self.journal.peek().amount, 2)  # type: ignore
+
+    def test_replay_keeps_only_the_rest_after_an_open(self):
+        with open("tests/responses/product_stock_entries_not_open.json") as f:
+            data = f.read().encode()
+        api_client = MagicMock()
+        api_client.get_raw.return_value = data
+        api_client.post.side_effect = [None, unreachable()]
+        self.journal.append("open_or_consume", Product(id=2), amount=3)
+        replayer = JournalReplayer(self.journal, api_client=api_client)
+        self.assertFalse(replayer.replay_one())
+        self.assertEqual(self.journal.peek().amount, 2)  # type: ignore
+
+    def test_pipeline_does_not_queue_write_that_may_have_been_applied(self):
+        with MockGrocy(
+            entries={1: [{"stock_id": "abc", "amount": "1", "open": "0"}]}
+        ) as grocy:
+            pipeline = ScanPipeline(
+                api_client=ApiClient(api_url=grocy.url, api_key="key", retries=0),
+                journal=self.journal,
+            )
+            with patch(
+                "src.api_client.requests.Session.post",
+                side_effect=requests.ReadTimeout("Read timed out"),
+            ), self.assertRaises(UnavailableError):
+                pipeline.process("grcy:p:1")
+        self.assertEqual(self.journal.pending(), 0)
+
+    def test_pipeline_raises_permanent_errors(self):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = (
+            b'[{"stock_id": "abc", "amount": "1", "open": "0"}]'
+        )
+        api_client.post.side_effect = ProductNotFoundError(
+            "Product does not exist or is inactive", 400
+        )
+        pipeline = ScanPipeline(api_client=api_client, journal=self.journal)
+        with self.assertRaises(ProductNotExistsException):
+            pipeline.process("grcy:p:1")
+        self.assertEqual(self.journal.pending(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
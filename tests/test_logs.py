@@ -0,0 +1,125 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+from src.logs import BackgroundHandler, JsonFormatter, RotatingFileHandler
+
+
+def record(message: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 1, message, None, None)
+
+
+class TestRotatingFileHandler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "grocy_client.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def rotated(self) -> list[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.directory.name)
+            if name != "grocy_client.log"
+        )
+
+    def test_rotates_by_size_and_compresses(self):
+        handler = RotatingFileHandler(self.path, max_bytes=100, backup_count=0)
+        for index in range(10):
+            handler.emit(record(f"line {index:02d} " + "x" * 30))
+        handler.close()
+        rotated = self.rotated()
+        self.assertGreaterEqual(len(rotated), 3)
+        self.assertTrue(all(name.endswith(".gz") for name in rotated))
+        self.assertLessEqual(os.path.getsize(self.path), 100)
+        with gzip.open(os.path.join(self.directory.name, rotated[0]), "rt") as f:
+            self.assertIn("line 00", f.read())
+
+    def test_keeps_backup_count_files(self):
+        handler = RotatingFileHandler(self.path, max_bytes=50, backup_count=2)
+        for index in range(10):
+            handler.emit(record("x" * 40))
+        handler.close()
+        self.assertEqual(len(self.rotated()), 2)
+
+    def test_uncompressed(self):
+        handler = RotatingFileHandler(
+            self.path, max_bytes=50, backup_count=0, compress=False
+        )
+        for index in range(3):
+            handler.emit(record("x" * 40))
+        handler.close()
+        self.assertFalse(any(name.endswith(".gz") for name in self.rotated()))
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_formats_one_object_per_line(self):
+        line = JsonFormatter().format(record('Scanned "grcy:p:1"', logging.WARNING))
+        self.assertNotIn("\n", line)
+        data = json.loads(line)
+        self.assertEqual(data["level"], "WARNING")
+        self.assertEqual(data["message"], 'Scanned "grcy:p:1"')
+
+    def test_includes_exception(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            import sys
+
+            exc_record = logging.LogRecord(
+                "test", logging.ERROR, __file__, 1, "failed", None, sys.exc_info()
+            )
+        data = json.loads(JsonFormatter().format(exc_record))
+        self.assertIn("ValueError: boom", data["exception"])
+
+
+class BlockingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.messages: list[str] = []
+
+    def emit(self, record):
+        self.unblock.wait(5)
+        self.messages.append(record.getMessage())
+
+
+class TestBackgroundHandler(unittest.TestCase):
+    def test_writes_from_background_thread(self):
+        target = BlockingHandler()
+        handler = BackgroundHandler(target)
+        # The writing thread is stuck, logging still returns immediately
+        handler.handle(record("first %s", logging.INFO))
+        handler.handle(record("second", logging.INFO))
+        self.assertEqual(target.messages, [])
+        target.unblock.set()
+        handler.close()
+        self.assertEqual(target.messages, ["first %s", "second"])
+
+    def test_drops_records_when_queue_is_full(self):
+        target = BlockingHandler()
+        handler = BackgroundHandler(target, queue_size=1)
+        for index in range(5):
+            handler.handle(record(f"message {index}"))
+        self.assertGreaterEqual(handler.stats()["dropped"], 3)
+        target.unblock.set()
+        handler.close()
+
+    def test_respects_handler_level(self):
+        target = BlockingHandler()
+        target.setLevel(logging.WARNING)
+        target.unblock.set()
+        handler = BackgroundHandler(target)
+        handler.handle(record("debug", logging.DEBUG))
+        handler.handle(record("warning", logging.WARNING))
+        handler.close()
+        self.assertEqual(target.messages, ["warning"])
+
+
+if __name__ == "__main__":
+    unittest.main()
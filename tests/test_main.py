@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+import serial
+
+from main import (
+    SerialDeviceNotFoundException,
+    find_serial_device,
+    find_serial_devices,
+    run_async,
+    sync_scanners,
+)
+from src.api_client import ApiClient
+from src.dedup import ScanDeduplicator
+from src.pipeline import ScanPipeline
+from src.scanner import ScannerGroup
+from tests.mock_grocy import MockGrocy
+
+PORTS = [
+    MagicMock(device="/dev/ttyACM0", vid=0x0C2E, pid=0x0B61),
+    MagicMock(device="/dev/ttyACM1", vid=0x0C2E, pid=0x0B6A),
+    MagicMock(device="/dev/ttyUSB0", vid=0x05E0, pid=0x1200),
+]
+
+
+@patch("main.list_ports.comports", return_value=PORTS)
+class TestFindSerialDevices(unittest.TestCase):
+    def test_single_device(self, mock_comports):
+        self.assertEqual(find_serial_device("0c2e:0b61"), "/dev/ttyACM0")
+
+    def test_device_not_found(self, mock_comports):
+        with self.assertRaises(SerialDeviceNotFoundException):
+            find_serial_device("0c2e:ffff")
+
+    def test_list_with_locations(self, mock_comports):
+        devices = find_serial_devices("0c2e:0b61@1, 05e0:1200@2")
+        self.assertEqual(devices, {"/dev/ttyACM0": 1, "/dev/ttyUSB0": 2})
+
+    def test_wildcard(self, mock_comports):
+        devices = find_serial_devices("0c2e:*")
+        self.assertEqual(devices, {"/dev/ttyACM0": None, "/dev/ttyACM1": None})
+
+    def test_invalid_format(self, mock_comports):
+        for vid_pid in ("0c2e", "0c2e:0b61:1", "xyz:0b61", "0c2e:0b61@pantry"):
+            with self.assertRaises(ValueError):
+                find_serial_devices(vid_pid)
+
+
+@patch("main.serial.Serial")
+@patch("main.list_ports.comports")
+class TestSyncScanners(unittest.TestCase):
+    def test_hot_plug(self, mock_comports, mock_serial):
+        group = MagicMock(spec=ScannerGroup, scanners={}, reported=set())
+        group.add.side_effect = lambda scanner: group.scanners.update(
+            {scanner.name: scanner}
+        )
+        group.remove.side_effect = lambda scanner: group.scanners.pop(scanner.name)
+        logger = MagicMock()
+
+        mock_comports.return_value = PORTS[:1]
+        with patch("src.scanner.selectors.DefaultSelector"):
+            sync_scanners(group, "0c2e:*@3", logger)
+            self.assertEqual(group.scanners["/dev/ttyACM0"].location_id, 3)
+
+            mock_comports.return_value = PORTS[1:2]
+            sync_scanners(group, "0c2e:*@3", logger)
+        self.assertEqual(list(group.scanners), ["/dev/ttyACM1"])
+
+    def test_open_failure_is_reported_once(self, mock_comports, mock_serial):
+        group = MagicMock(spec=ScannerGroup, scanners={}, reported=set())
+        mock_comports.return_value = PORTS[:1]
+        mock_serial.side_effect = serial.SerialException("Permission denied")
+        logger = MagicMock()
+        for _ in range(3):
+            sync_scanners(group, "0c2e:*", logger)
+        levels = [call.args[0] for call in logger.log.call_args_list]
+        self.assertEqual(levels, [logging.WARNING, logging.DEBUG, logging.DEBUG])
+        group.add.assert_not_called()
+
+
+class TestRunAsync(unittest.TestCase):
+    def test_repeat_is_judged_on_arrival(self):
+        entries = {1: [{"stock_id": "abc", "amount": "2", "open": "1"}]}
+        scanner = MagicMock(location_id=None)
+
+        async def async_codes():
+            yield scanner, "grcy:p:1"
+            yield scanner, "grcy:p:1"
+            # The repeat waits for the first scan, which outlasts the window
+            await asyncio.sleep(1)
+
+        group = MagicMock(spec=ScannerGroup)
+        group.async_codes = async_codes
+        with MockGrocy(entries=entries, latency=0.3) as grocy:
+            pipeline = ScanPipeline(
+                ApiClient(api_url=grocy.url, api_key="key"),
+                deduplicator=ScanDeduplicator(window=0.2),
+            )
+            asyncio.run(run_async(group, pipeline, MagicMock()))
+            self.assertEqual(grocy.count("POST"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+from src.metrics import Counter, Gauge, Histogram, MetricsServer, Registry
+from src.pipeline import SCAN_ERRORS, SCAN_LATENCY, ScanPipeline
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = Counter("errors_total", "Errors", ("type",), registry=self.registry)
+        counter.inc(type="ValueError")
+        counter.inc(2, type="ValueError")
+        self.assertEqual(counter.value(type="ValueError"), 3)
+        self.assertIn('errors_total{type="ValueError"} 3', self.registry.render())
+
+    def test_labels_are_checked(self):
+        counter = Counter("errors_total", "Errors", ("type",), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.inc(kind="ValueError")
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("errors_total", "Errors", ("type",), registry=self.registry)
+        counter.inc(type='say "hi"')
+        self.assertIn('errors_total{type="say \\"hi\\""} 1', self.registry.render())
+
+    def test_gauge_tracks_in_progress(self):
+        gauge = Gauge("in_flight", "In flight", registry=self.registry)
+        with gauge.track_inprogress():
+            self.assertEqual(gauge.value(), 1)
+        self.assertEqual(gauge.value(), 0)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram(
+            "latency_seconds", "Latency", buckets=(0.1, 1.0), registry=self.registry
+        )
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        rendered = self.registry.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', rendered)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', rendered)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', rendered)
+        self.assertIn("latency_seconds_count 4", rendered)
+        self.assertIn("latency_seconds_sum 5.65", rendered)
+
+    def test_duplicate_name_raises(self):
+        Counter("errors_total", "Errors", registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter("errors_total", "Errors", registry=self.registry)
+
+    def test_stats_are_rendered(self):
+        self.registry.register_stats("cache", lambda: {"hits": 4})
+        self.assertIn("cache_hits 4", self.registry.render())
+
+    def test_server(self):
+        Counter("scans_total", "Scans", registry=self.registry).inc()
+        server = MetricsServer(host="127.0.0.1", port=0, registry=self.registry)
+        server.start()
+        try:
+            url = f"http://127.0.0.1:{server.port}"
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                self.assertIn("scans_total 1", response.read().decode())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/other")
+        finally:
+            server.stop()
+
+
+class TestPipelineMetrics(unittest.TestCase):
+    @patch("src.grocycode.GrocyCode.get_product")
+    def test_scan_latency_is_recorded(self, mock_get_product):
+        count = SCAN_LATENCY.count()
+        ScanPipeline(api_client=MagicMock()).process("grcy:p:1")
+        self.assertEqual(SCAN_LATENCY.count(), count + 1)
+
+    def test_scan_errors_are_counted(self):
+        errors = SCAN_ERRORS.value(type="InvalidGrocyCodeException")
+        with self.assertRaises(Exception):
+            ScanPipeline(api_client=MagicMock()).process("123")
+        self.assertEqual(
+            SCAN_ERRORS.value(type="InvalidGrocyCodeException"), errors + 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,14 @@
+import threading
+import time
 import unittest
-from logging import StreamHandler
+from logging import WARNING, LogRecord, StreamHandler
 from unittest.mock import MagicMock, patch
 
 from src.ntfy import NtfyClient, NtfyHandler
 
 SERVER: str = "localhost:8080"
 TOPIC: str = "test"
+RECORD = LogRecord("test", WARNING, __file__, 0, "warning", None, None)
 
 
 def mock_getenv(key: str) -> str:  # type: ignore
@@ -16,7 +19,7 @@ def mock_getenv(key: str) -> str:  # type: ignore
 
 
 class TestNtfy(unittest.TestCase):
-    @patch("src.ntfy.requests.post")
+    @patch("src.ntfy.requests.Session.post")
     @patch("src.ntfy.os.getenv", side_effect=mock_getenv)
     def test_correct_config_through_env(self, mock_getenv, mock_post):
 
@@ -28,17 +31,18 @@ class TestNtfy(unittest.TestCase):
         mock_post.assert_called
         self.assertEqual(mock_post.call_args.kwargs["url"], f"http://{SERVER}/{TOPIC}")
 
-    @patch("src.ntfy.requests.post")
+    @patch("src.ntfy.requests.Session.post")
     @patch("src.ntfy.os.getenv", side_effect=mock_getenv)
     def test_send_message(self, mock_getenv, mock_post):
         mock_post.return_value = MagicMock(status_code=200)
         message = "Hello World"
 
         ntfy = NtfyClient()
-        ntfy.send_message(message)
+        self.assertTrue(ntfy.send_message(message))
 
         mock_post.assert_called
         self.assertEqual(mock_post.call_args.kwargs["data"], message)
+        self.assertIsNotNone(mock_post.call_args.kwargs["timeout"])
 
     @patch("src.ntfy.os.getenv")
     def test_raises_on_missing_config(self, mock_getenv):
@@ -54,13 +58,13 @@ class TestNtfy(unittest.TestCase):
     def test_not_raises_with_params(self):
         NtfyClient(server=SERVER, topic=TOPIC)
 
-    @patch("src.ntfy.requests.post")
+    @patch("src.ntfy.requests.Session.post")
     @patch("src.ntfy.logging.error")
     def test_logs_on_error(self, mock_error, mock_post):
         mock_post.return_value = MagicMock(status_code=400)
 
         ntfy = NtfyClient(server=SERVER, topic=TOPIC)
-        ntfy.send_message("")
+        self.assertFalse(ntfy.send_message(""))
         mock_error.assert_called()
 
 
@@ -78,4 +82,47 @@ class TestNtfyHandler(unittest.TestCase):
         message = "Hello World"
         mock_format.return_value = message
         handler.emit(message)  # type: ignore
+        handler.close()
         mock_send_message.assert_called_with(message)
+
+    @patch("src.ntfy.NtfyClient.send_message")
+    def test_emit_does_not_block(self, mock_send_message):
+        release = threading.Event()
+        mock_send_message.side_effect = lambda message: release.wait(5)
+        handler = NtfyHandler(server=SERVER, topic=TOPIC, batch_window=0)
+        start = time.monotonic()
+        handler.emit(RECORD)
+        self.assertLess(time.monotonic() - start, 1)
+        release.set()
+        handler.close()
+
+    @patch("src.ntfy.NtfyClient.send_message", return_value=True)
+    def test_burst_is_batched(self, mock_send_message):
+        handler = NtfyHandler(server=SERVER, topic=TOPIC, batch_window=5)
+        for _ in range(3):
+            handler.emit(RECORD)
+        handler.close()
+        mock_send_message.assert_called_once_with("\n".join(["warning"] * 3))
+        self.assertEqual(handler.stats(), {"queued": 3, "sent": 3, "dropped": 0})
+
+    @patch("src.ntfy.NtfyClient.send_message", return_value=True)
+    def test_drops_on_overflow(self, mock_send_message):
+        release = threading.Event()
+        mock_send_message.side_effect = lambda message: release.wait(5)
+        handler = NtfyHandler(server=SERVER, topic=TOPIC, queue_size=1, batch_window=0)
+        handler.emit(RECORD)
+        # Wait for the worker to pick up the first record and block on sending
+        while handler._queue.qsize():
+            time.sleep(0.01)
+        handler.emit(RECORD)
+        handler.emit(RECORD)
+        self.assertEqual(handler.stats()["dropped"], 1)
+        release.set()
+        handler.close()
+
+    @patch("src.ntfy.NtfyClient.send_message", side_effect=ConnectionError)
+    def test_failed_send_is_counted(self, mock_send_message):
+        handler = NtfyHandler(server=SERVER, topic=TOPIC, batch_window=0)
+        handler.emit(RECORD)
+        handler.close()
+        self.assertEqual(handler.stats(), {"queued": 1, "sent": 0, "dropped": 1})
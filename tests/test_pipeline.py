@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.api_client import ApiClient
+from src.barcode import BarcodeResolver
+from src.grocycode import CodeType, InvalidGrocyCodeException
+from src.pipeline import ScanPipeline, product_key
+from src.product import ProductNotExistsException
+from tests.mock_grocy import MockGrocy
+
+ENTRIES = {5: [{"stock_id": "abc", "amount": "2", "open": "0"}]}
+
+
+class TestScanPipeline(unittest.TestCase):
+    @patch("src.grocycode.GrocyCode.get_product")
+    def test_process_uses_pipeline_client(self, mock_get_product):
+        api_client = MagicMock()
+        ScanPipeline(api_client=api_client).process("grcy:p:1")
+        mock_get_product.assert_called_with(
+            api_client=api_client, stock_cache=None, location_id=None
+        )
+        mock_get_product.return_value.open_or_consume.assert_called_once()
+
+    @patch("src.grocycode.GrocyCode.get_product")
+    def test_process_async(self, mock_get_product):
+        mock_get_product.return_value.open_or_consume_async = AsyncMock()
+        asyncio.run(ScanPipeline(api_client=MagicMock()).process_async("grcy:p:1"))
+        mock_get_product.return_value.open_or_consume_async.assert_awaited_once()
+
+    @patch("src.grocycode.GrocyCode.get_product")
+    def test_repeat_scans_reuse_product(self, mock_get_product):
+        pipeline = ScanPipeline(api_client=MagicMock())
+        pipeline.process("grcy:p:1")
+        pipeline.process("grcy:p:1")
+        pipeline.process("grcy:p:1", location_id=2)
+        self.assertEqual(mock_get_product.call_count, 2)
+
+    def test_process_raises_on_invalid_code(self):
+        with self.assertRaises(InvalidGrocyCodeException):
+            ScanPipeline(api_client=MagicMock()).process("123")
+
+
+class TestScanPipelineDispatch(unittest.TestCase):
+    def test_other_code_types_are_tracked(self):
+        with MockGrocy() as grocy:
+            pipeline = ScanPipeline(ApiClient(api_url=grocy.url, api_key="key"))
+            for code in ("grcy:b:1", "grcy:c:2", "grcy:r:3"):
+                pipeline.process(code)
+            self.assertEqual(
+                [path for method, path in grocy.requests if method == "POST"],
+                [
+                    "/api/batteries/1/charge",
+                    "/api/chores/2/execute",
+                    "/api/recipes/3/consume",
+                ],
+            )
+
+    def test_barcode_is_resolved_once(self):
+        with MockGrocy(entries=ENTRIES, barcodes={"4006381333931": 5}) as grocy:
+            pipeline = ScanPipeline(ApiClient(api_url=grocy.url, api_key="key"))
+            pipeline.process("4006381333931")
+            pipeline.process("4006381333931")
+            self.assertEqual(grocy.count("GET", "/by-barcode/4006381333931"), 1)
+            self.assertEqual(grocy.count("POST", "/api/stock/products/5/open"), 1)
+            self.assertEqual(grocy.count("POST", "/api/stock/products/5/consume"), 1)
+
+    def test_barcode_async(self):
+        with MockGrocy(entries=ENTRIES, barcodes={"4006381333931": 5}) as grocy:
+            pipeline = ScanPipeline(ApiClient(api_url=grocy.url, api_key="key"))
+            asyncio.run(pipeline.process_async("4006381333931"))
+            self.assertEqual(grocy.count("POST", "/api/stock/products/5/open"), 1)
+
+    def test_unknown_barcode_raises(self):
+        with MockGrocy() as grocy:
+            pipeline = ScanPipeline(ApiClient(api_url=grocy.url, api_key="key"))
+            with self.assertRaises(ProductNotExistsException) as error:
+                pipeline.process("4006381333931")
+        self.assertEqual(str(error.exception), "No product with barcode 4006381333931")
+
+    def test_handlers_can_be_replaced(self):
+        pipeline = ScanPipeline(api_client=MagicMock())
+        handler = MagicMock()
+        pipeline.handlers[CodeType.PRODUCT] = handler
+        pipeline.process("grcy:p:1", location_id=2)
+        self.assertEqual(handler.process.call_args.args[1], 2)
+
+
+class TestProductKey(unittest.TestCase):
+    def test_stock_entries_share_the_product(self):
+        self.assertEqual(product_key("grcy:p:1:abc"), product_key("grcy:p:1"))
+        self.assertNotEqual(product_key("grcy:p:1"), product_key("grcy:p:2"))
+
+    def test_resolved_barcode_shares_the_product(self):
+        resolver = BarcodeResolver(MagicMock())
+        self.assertEqual(product_key("4006381333931", resolver)[1], "4006381333931")
+        resolver.restore({"4006381333931": 1})
+        self.assertEqual(
+            product_key("4006381333931", resolver), product_key("grcy:p:1")
+        )
+        self.assertEqual(resolver.stats()["misses"], 0)
+
+    def test_invalid_code_is_its_own_key(self):
+        self.assertEqual(product_key("nonsense"), "nonsense")
+        self.assertEqual(product_key("grcy:x:1"), "grcy:x:1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
+import asyncio
 import json
 import unittest
 from unittest.mock import MagicMock, patch
 
+from src.api_client import APIException, ProductNotFoundError
 from src.grocycode import GrocyCode
 from src.product import NoStockEntriesException, Product, ProductNotExistsException
 
@@ -18,7 +20,7 @@ class TestProduct(unittest.TestCase):
             with open(f"tests/responses/{file}", "r") as f:
                 self.response_data[response] = json.load(f)
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_open_product(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(status_code=200)
         product = Product(id=235, stock_id="62505f88ea718")
@@ -28,7 +30,7 @@ class TestProduct(unittest.TestCase):
         self.assertIn("/open", mock_post.call_args.kwargs["url"])
         self.assertIn("235", mock_post.call_args.kwargs["url"])
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_open_product_by_barcode(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(status_code=200)
         CODE = "grcy:p:1:x624f2505ded59"
@@ -41,7 +43,7 @@ class TestProduct(unittest.TestCase):
         self.assertIn("by-barcode", mock_post.call_args.kwargs["url"])
         self.assertIn("x624f2505ded59", mock_post.call_args.kwargs["url"])
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_consume_product(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(status_code=200)
         product = Product(id=235, stock_id="62505f88ea718")
@@ -51,7 +53,7 @@ class TestProduct(unittest.TestCase):
         self.assertIn("/consume", mock_post.call_args.kwargs["url"])
         self.assertIn("235", mock_post.call_args.kwargs["url"])
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_consume_product_by_barcode(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(status_code=200)
         CODE = "grcy:p:1:x624f2505ded59"
@@ -64,12 +66,12 @@ class TestProduct(unittest.TestCase):
         self.assertIn("by-barcode", mock_post.call_args.kwargs["url"])
         self.assertIn("x624f2505ded59", mock_post.call_args.kwargs["url"])
 
-    @patch("src.api_client.requests.get")
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.get")
+    @patch("src.api_client.requests.Session.post")
     def test_opens_when_not_open(self, mock_post, mock_get, mock_getenv):
         mock_get.return_value = MagicMock(
             status_code=200,
-            json=lambda: self.response_data["stock_entries_not_open"],
+            content=json.dumps(self.response_data["stock_entries_not_open"]).encode(),
         )
         mock_post.return_value = MagicMock(status_code=200)
         product = Product(id=239, stock_id="62505f88ea718")
@@ -77,12 +79,12 @@ class TestProduct(unittest.TestCase):
         mock_post.assert_called()
         self.assertRegex(mock_post.call_args.kwargs["url"], r".*/open$")
 
-    @patch("src.api_client.requests.get")
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.get")
+    @patch("src.api_client.requests.Session.post")
     def test_consumes_when_open(self, mock_post, mock_get, mock_getenv):
         mock_get.return_value = MagicMock(
             status_code=200,
-            json=lambda: self.response_data["stock_entries_open"],
+            content=json.dumps(self.response_data["stock_entries_open"]).encode(),
         )
         mock_post.return_value = MagicMock(status_code=200)
         product = Product(id=235, stock_id="62505f88ea718")
@@ -90,18 +92,54 @@ class TestProduct(unittest.TestCase):
         mock_post.assert_called()
         self.assertRegex(mock_post.call_args.kwargs["url"], r".*/consume$")
 
-    @patch("src.api_client.requests.get")
+    @patch("src.api_client.requests.Session.get")
+    @patch("src.api_client.requests.Session.post")
+    def test_open_or_consume_sends_amount(self, mock_post, mock_get, mock_getenv):
+        mock_get.return_value = MagicMock(
+            status_code=200,
+            content=json.dumps(self.response_data["stock_entries_open"]).encode(),
+        )
+        mock_post.return_value = MagicMock(status_code=200)
+        product = Product(id=235, stock_id="62505f88ea718")
+        product.open_or_consume(amount=3)
+        self.assertEqual(mock_post.call_args.kwargs["json"]["amount"], 3)
+
+    def test_open_or_consume_opens_one_of_several(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_not_open"]
+        ).encode()
+        Product(id=2, api_client=api_client).open_or_consume(amount=3)
+        self.assertEqual(
+            [
+                (call.kwargs["path"].rsplit("/", 1)[1], call.kwargs["data"]["amount"])
+                for call in api_client.post.call_args_list
+            ],
+            [("open", 1), ("consume", 2)],
+        )
+
+    def test_open_or_consume_tells_what_was_opened(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_not_open"]
+        ).encode()
+        api_client.post.side_effect = [None, APIException("Service unavailable")]
+        with self.assertRaises(APIException) as exception:
+            Product(id=2, api_client=api_client).open_or_consume(amount=3)
+        self.assertEqual(exception.exception.booked, 1)
+
+    @patch("src.api_client.requests.Session.get")
     def test_open_or_consume_raises_on_no_entries(self, mock_get, mock_getenv):
         mock_get.return_value = MagicMock(
             status_code=200,
-            json=lambda: self.response_data["stock_entries_open"],
+            content=json.dumps(self.response_data["stock_entries_open"]).encode(),
         )
         product = Product(id=235, stock_id="non_existing")
         with self.assertRaises(Exception) as exception:
             product.open_or_consume()
         self.assertIn("No stock entries found", str(exception.exception))
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_open_raise_on_inexisting_product(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(
             status_code=400,
@@ -111,7 +149,7 @@ class TestProduct(unittest.TestCase):
         with self.assertRaises(ProductNotExistsException):
             product.open()
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_consume_raise_on_inexisting_product(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(
             status_code=400,
@@ -122,7 +160,7 @@ class TestProduct(unittest.TestCase):
         with self.assertRaises(ProductNotExistsException):
             product.consume()
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_open_raise_on_inexisting_stock_entries(self, mock_post, mock_getenv):
         mock_post.return_value = MagicMock(
             status_code=400,
@@ -134,7 +172,7 @@ class TestProduct(unittest.TestCase):
         with self.assertRaises(NoStockEntriesException):
             product.open()
 
-    @patch("src.api_client.requests.post")
+    @patch("src.api_client.requests.Session.post")
     def test_consume_raise_on_inexisting_stock_entries(self, mock_post, mock_getenv):
         product = Product(id=235)
 
@@ -147,6 +185,97 @@ class TestProduct(unittest.TestCase):
         with self.assertRaises(NoStockEntriesException):
             product.consume()
 
+    @patch("src.api_client.requests.Session.post")
+    def test_open_raises_unmatched_api_errors(self, mock_post, mock_getenv):
+        mock_post.return_value = MagicMock(
+            status_code=500, json=lambda: {"error_message": "Internal error"}
+        )
+        with self.assertRaises(APIException):
+            Product(id=235).open()
+
+    @patch("src.product.ApiClient")
+    def test_open_or_consume_uses_injected_client(self, mock_client, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_open"]
+        ).encode()
+        product = Product(id=235, stock_id="62505f88ea718", api_client=api_client)
+        product.open_or_consume()
+        mock_client.assert_not_called()
+        api_client.get_raw.assert_called_once()
+        api_client.post.assert_called_once()
+
+    def test_open_or_consume_async_consumes_when_open(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_open"]
+        ).encode()
+        product = Product(id=235, stock_id="62505f88ea718", api_client=api_client)
+        asyncio.run(product.open_or_consume_async())
+        self.assertRegex(api_client.post.call_args.args[0], r".*/consume$")
+
+    def test_open_or_consume_async_opens_when_not_open(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_not_open"]
+        ).encode()
+        product = Product(id=239, stock_id="62505f88ea718", api_client=api_client)
+        asyncio.run(product.open_or_consume_async())
+        self.assertRegex(api_client.post.call_args.args[0], r".*/open$")
+
+    def test_open_async_raise_on_inexisting_product(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.post.side_effect = ProductNotFoundError(
+            "Product does not exist or is inactive", 400
+        )
+        with self.assertRaises(ProductNotExistsException):
+            asyncio.run(Product(id=235, api_client=api_client).open_async())
+
+    def test_consume_at_location(self, mock_getenv):
+        api_client = MagicMock()
+        Product(id=235, location_id=3, api_client=api_client).consume()
+        self.assertEqual(api_client.post.call_args.kwargs["data"]["location_id"], 3)
+
+    def test_open_or_consume_raises_on_invalid_entries(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = b"<html></html>"
+        with self.assertRaises(APIException) as error:
+            Product(id=235, api_client=api_client).open_or_consume()
+        self.assertIn("Invalid response from Grocy", str(error.exception))
+        api_client.post.assert_not_called()
+
+    def test_open_at_location_names_the_entry(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            [
+                {"stock_id": "kitchen", "amount": "2", "open": "0", "location_id": "3"},
+                {"stock_id": "pantry", "amount": "2", "open": "0", "location_id": "4"},
+            ]
+        ).encode()
+        Product(id=235, location_id=4, api_client=api_client).open_or_consume()
+        self.assertRegex(api_client.post.call_args.kwargs["path"], r".*/open$")
+        self.assertEqual(
+            api_client.post.call_args.kwargs["data"],
+            {"amount": 1, "stock_entry_id": "pantry"},
+        )
+
+    def test_open_without_location_is_left_to_grocy(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_not_open"]
+        ).encode()
+        Product(id=235, api_client=api_client).open_or_consume()
+        self.assertEqual(api_client.post.call_args.kwargs["data"], {"amount": 1})
+
+    def test_open_or_consume_only_looks_at_location(self, mock_getenv):
+        api_client = MagicMock()
+        api_client.get_raw.return_value = json.dumps(
+            self.response_data["stock_entries_open"]
+        ).encode()
+        product = Product(id=235, location_id=4, api_client=api_client)
+        with self.assertRaises(NoStockEntriesException):
+            product.open_or_consume()
+
 
 if __name__ == "__main__":
     unittest.main()
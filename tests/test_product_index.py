@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import unittest
+
+from src.api_client import ApiClient
+from src.change_watcher import ChangeEvent
+from src.pipeline import ScanPipeline
+from src.product import NoStockEntriesException, ProductNotExistsException
+from src.product_index import ProductIndex, ProductInfo
+from tests.mock_grocy import MockGrocy
+
+PRODUCTS = {
+    1: {"id": "1", "name": "Milk", "active": "1", "qu_id_stock": "2"},
+    2: {"id": "2", "name": "Old milk", "active": "0", "qu_id_stock": "2"},
+}
+
+
+class TestProductIndex(unittest.TestCase):
+    def setUp(self):
+        self.grocy = MockGrocy(products=PRODUCTS).start()
+        self.index = ProductIndex(ApiClient(api_url=self.grocy.url, api_key="key"))
+
+    def tearDown(self):
+        self.grocy.stop()
+
+    def test_load(self):
+        self.index.load()
+        self.assertEqual(
+            self.index.get(1), ProductInfo(id=1, name="Milk", active=True, qu_id=2)
+        )
+        self.assertEqual(self.index.check(1), self.index.get(1))
+
+    def test_not_loaded_does_not_reject(self):
+        self.assertIsNone(self.index.check(3))
+        self.assertEqual(self.grocy.count(), 0)
+
+    def test_inactive_is_rejected_locally(self):
+        self.index.load()
+        requests = self.grocy.count()
+        with self.assertRaises(ProductNotExistsException) as error:
+            self.index.check(2)
+        self.assertEqual(
+            str(error.exception), "Product Old milk (2) does not exist or is inactive"
+        )
+        self.assertEqual(self.grocy.count(), requests)
+
+    def test_unknown_is_looked_up_once(self):
+        self.index.load()
+        for _ in range(2):
+            with self.assertRaises(ProductNotExistsException):
+                self.index.check(3)
+        self.assertEqual(self.grocy.count("GET", "/api/objects/products/3"), 1)
+        self.assertEqual(self.index.stats()["rejected"], 2)
+
+    def test_product_created_since_load(self):
+        self.index.load()
+        self.grocy.products[3] = {"id": "3", "name": "Butter", "active": "1"}
+        self.assertEqual(self.index.check(3).name, "Butter")  # type: ignore
+
+    def test_async_lookup_does_not_block_the_loop(self):
+        self.index.load()
+        self.grocy.products[3] = {"id": "3", "name": "Butter", "active": "1"}
+        threads = []
+        get = self.index.api_client.get
+
+        def recording_get(path):
+            threads.append(threading.current_thread())
+            return get(path)
+
+        self.index.api_client.get = recording_get  # type: ignore
+
+        async def check():
+            return await self.index.check_async(3), threading.current_thread()
+
+        info, loop_thread = asyncio.run(check())
+        self.assertEqual(info.name, "Butter")  # type: ignore
+        self.assertNotIn(loop_thread, threads)
+
+    def test_refresh_only_when_grocy_changed(self):
+        self.index.load()
+        self.assertFalse(self.index.refresh())
+        self.grocy.changes += 1
+        self.assertTrue(self.index.refresh())
+        self.assertEqual(self.grocy.count("GET", "/api/objects/products"), 2)
+
+    def test_change_reloads_at_most_once_per_interval(self):
+        self.index.refresh_interval = 0
+        self.index.load()
+        self.index.on_change(ChangeEvent("2022-04-10 11:00:00", False, 0))
+        self.index.on_change(ChangeEvent("2022-04-10 11:00:01", True, 0))
+        self.assertEqual(self.grocy.count("GET", "/api/objects/products"), 2)
+        self.index.refresh_interval = 300
+        self.index.on_change(ChangeEvent("2022-04-10 11:00:02", True, 0))
+        self.assertEqual(self.grocy.count("GET", "/api/objects/products"), 2)
+
+
+class TestPipelineWithProductIndex(unittest.TestCase):
+    def test_rejects_before_any_stock_request(self):
+        with MockGrocy(products=PRODUCTS) as grocy:
+            api_client = ApiClient(api_url=grocy.url, api_key="key")
+            index = ProductIndex(api_client)
+            index.load()
+            pipeline = ScanPipeline(api_client=api_client, product_index=index)
+            with self.assertRaises(ProductNotExistsException):
+                pipeline.process("grcy:p:2")
+            self.assertEqual(grocy.count(suffix="/entries"), 0)
+            self.assertEqual(grocy.count("POST"), 0)
+
+    def test_messages_name_the_product(self):
+        with MockGrocy(entries={1: []}, products=PRODUCTS) as grocy:
+            api_client = ApiClient(api_url=grocy.url, api_key="key")
+            index = ProductIndex(api_client)
+            index.load()
+            pipeline = ScanPipeline(api_client=api_client, product_index=index)
+            with self.assertRaises(NoStockEntriesException) as error:
+                pipeline.process("grcy:p:1")
+            self.assertIn("product Milk (1)", str(error.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
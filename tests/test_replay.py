@@ -0,0 +1,102 @@
+import gzip
+import io
+import itertools
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+from src.api_client import ApiClient
+from src.pipeline import ScanPipeline, scan_log_message
+from src.replay import Replayer, Scan, main, read_scans
+from tests.mock_grocy import MockGrocy
+
+LOG = """\
+2022-04-10 11:00:00,000 [__main__] INFO     App started, watiting for barcode input
+2022-04-10 11:00:01,000 [__main__] DEBUG    Scanned grcy:p:1 at location 2
+2022-04-10 11:00:02,000 [__main__] WARNING  No stock entries found for product 3
+2022-04-10 11:00:03,000 [__main__] DEBUG    Scanned grcy:p:3
+"""
+
+
+class TestReadScans(unittest.TestCase):
+    def test_plain(self):
+        lines = ["grcy:p:1\n", "\n", "grcy:p:2\t3\n", "grcy:p:4\tx\n"]
+        self.assertEqual(
+            list(read_scans(lines)), [Scan("grcy:p:1"), Scan("grcy:p:2", 3)]
+        )
+
+    def test_log_skips_other_messages(self):
+        self.assertEqual(
+            list(read_scans(LOG.splitlines(keepends=True))),
+            [Scan("grcy:p:1", 2), Scan("grcy:p:3")],
+        )
+
+    def test_json_lines(self):
+        lines = [
+            '{"code": "grcy:p:1", "location_id": 2}\n',
+            "not json\n",
+            '{"time": "2022-04-10", "message": "Scanned grcy:p:3"}\n',
+            '{"time": "2022-04-10", "message": "App started"}\n',
+        ]
+        self.assertEqual(
+            list(read_scans(lines)), [Scan("grcy:p:1", 2), Scan("grcy:p:3")]
+        )
+
+    def test_logged_message_is_read_back(self):
+        line = f"2022-04-10 11:00:01,000 [__main__] DEBUG    {scan_log_message('4006381333931', 5)}"
+        self.assertEqual(list(read_scans([line])), [Scan("4006381333931", 5)])
+
+    def test_reads_lazily(self):
+        endless = itertools.cycle(["grcy:p:1\n"])
+        self.assertEqual(len(list(itertools.islice(read_scans(endless), 3))), 3)
+
+
+class TestReplayer(unittest.TestCase):
+    def test_dry_run_sends_nothing(self):
+        output = io.StringIO()
+        replayer = Replayer(dry_run=True, output=output)
+        summary = replayer.run([Scan("grcy:p:1"), Scan("nonsense")])
+        self.assertEqual(summary.counts, {"valid": 1, "failed": 1})
+        self.assertIn("nonsense\tfailed\t", output.getvalue())
+
+    def test_keeps_order_per_product(self):
+        entries = {
+            product_id: [{"stock_id": "abc", "amount": "2", "open": "0"}]
+            for product_id in range(1, 5)
+        }
+        with MockGrocy(entries=entries, latency=0.002) as grocy:
+            pipeline = ScanPipeline(ApiClient(api_url=grocy.url, api_key="key"))
+            scans = [Scan(f"grcy:p:{product_id}") for product_id in range(1, 5)] * 2
+            summary = Replayer(pipeline, concurrency=3).run(scans)
+            self.assertEqual(summary.counts, {"done": 8})
+            for product_id in range(1, 5):
+                actions = [
+                    path.rsplit("/", 1)[1]
+                    for method, path in grocy.requests
+                    if method == "POST" and f"grcy:p:{product_id}/" in path
+                ]
+                self.assertEqual(actions, ["open", "consume"])
+
+    def test_rate_limit(self):
+        start = time.monotonic()
+        Replayer(dry_run=True, rate=100).run([Scan("grcy:p:1")] * 11)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+
+class TestReplayMain(unittest.TestCase):
+    def test_replays_compressed_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grocy_client.log.gz")
+            with gzip.open(path, "wt") as f:
+                f.write(LOG)
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                self.assertEqual(main([path, "--dry-run"]), 0)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 2)
+        self.assertIn("Replayed 2 scans: 2 valid", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
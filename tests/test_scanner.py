@@ -0,0 +1,134 @@
+import asyncio
+import os
+import pty
+import tty
+import unittest
+
+from src.scanner import Scanner, ScannerDisconnectedException, ScannerGroup
+
+
+class TestScanner(unittest.TestCase):
+    def setUp(self):
+        # A pty pair behaves like the serial port of a real scanner
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.fdopen(slave, "rb", buffering=0)
+        self.scanner = Scanner(self.port, timeout=0.05)
+
+    def tearDown(self):
+        self.scanner.close()
+        self.port.close()
+        try:
+            os.close(self.master)
+        except OSError:
+            pass
+
+    def test_reads_code(self):
+        os.write(self.master, b"grcy:p:1:x624f2505ded59\r\n")
+        self.assertEqual(self.scanner.read_codes(), ["grcy:p:1:x624f2505ded59"])
+
+    def test_assembles_partial_reads(self):
+        os.write(self.master, b"grcy:p:1")
+        self.assertEqual(self.scanner.read_codes(), [])
+        os.write(self.master, b":x624f2505ded59\r")
+        self.assertEqual(self.scanner.read_codes(), ["grcy:p:1:x624f2505ded59"])
+
+    def test_reads_several_codes_at_once(self):
+        os.write(self.master, b"grcy:p:1\r\ngrcy:p:2\n")
+        self.assertEqual(self.scanner.read_codes(), ["grcy:p:1", "grcy:p:2"])
+
+    def test_returns_nothing_on_timeout(self):
+        self.assertEqual(self.scanner.read_codes(), [])
+
+    def test_codes_generator(self):
+        os.write(self.master, b"grcy:p:1\rgrcy:p:2\r")
+        codes = self.scanner.codes()
+        self.assertEqual(next(codes), "grcy:p:1")
+        self.assertEqual(next(codes), "grcy:p:2")
+
+    def test_raises_on_disconnect(self):
+        os.close(self.master)
+        with self.assertRaises(ScannerDisconnectedException):
+            self.scanner.read_codes()
+
+    def test_async_codes(self):
+        async def read_two():
+            codes = self.scanner.async_codes()
+            os.write(self.master, b"grcy:p:1\rgrcy:")
+            first = await asyncio.wait_for(codes.__anext__(), 1)
+            os.write(self.master, b"p:2\r")
+            second = await asyncio.wait_for(codes.__anext__(), 1)
+            await codes.aclose()
+            return [first, second]
+
+        self.assertEqual(asyncio.run(read_two()), ["grcy:p:1", "grcy:p:2"])
+
+    def test_async_codes_raises_on_disconnect(self):
+        async def read():
+            async for _ in self.scanner.async_codes():
+                pass
+
+        os.close(self.master)
+        with self.assertRaises(ScannerDisconnectedException):
+            asyncio.run(asyncio.wait_for(read(), 1))
+
+    def test_drops_unterminated_garbage(self):
+        self.scanner.feed(b"x" * 5000)
+        self.assertEqual(self.scanner.feed(b"grcy:p:1\r"), ["grcy:p:1"])
+
+
+class TestScannerGroup(unittest.TestCase):
+    def setUp(self):
+        self.group = ScannerGroup(timeout=0.05)
+        self.masters = {}
+        for name, location_id in (("kitchen", 1), ("pantry", 2)):
+            master, slave = pty.openpty()
+            tty.setraw(slave)
+            port = os.fdopen(slave, "rb", buffering=0)
+            self.group.add(Scanner(port, name=name, location_id=location_id))
+            self.masters[name] = master
+
+    def tearDown(self):
+        self.group.close()
+        for master in self.masters.values():
+            try:
+                os.close(master)
+            except OSError:
+                pass
+
+    def test_reads_all_scanners(self):
+        os.write(self.masters["kitchen"], b"grcy:p:1\r")
+        os.write(self.masters["pantry"], b"grcy:p:2\r")
+        codes = []
+        for _ in range(10):
+            codes.extend(
+                (scanner.location_id, code) for scanner, code in self.group.read_codes()
+            )
+            if len(codes) == 2:
+                break
+        self.assertEqual(sorted(codes), [(1, "grcy:p:1"), (2, "grcy:p:2")])
+
+    def test_disconnected_scanner_is_removed(self):
+        os.close(self.masters["pantry"])
+        with self.assertLogs("src.scanner", level="WARNING") as logs:
+            self.group.read_codes()
+        self.assertEqual(
+            logs.output, ["WARNING:src.scanner:Scanner pantry was disconnected"]
+        )
+        self.assertEqual(list(self.group.scanners), ["kitchen"])
+        os.write(self.masters["kitchen"], b"grcy:p:1\r")
+        self.assertEqual([code for _, code in self.group.read_codes()], ["grcy:p:1"])
+
+    def test_async_codes(self):
+        async def read():
+            codes = self.group.async_codes()
+            os.write(self.masters["pantry"], b"grcy:p:2\r")
+            scanner, code = await asyncio.wait_for(codes.__anext__(), 1)
+            await codes.aclose()
+            return scanner.name, code
+
+        self.assertEqual(asyncio.run(read()), ("pantry", "grcy:p:2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
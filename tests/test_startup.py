@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+# Cold start budget for importing the application, in seconds
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "1.5"))
+
+# Only needed by optional features, they must not be imported at startup
+LAZY_MODULES = (
+    "asyncio",
+    "pendulum",
+    "pydantic",
+    "src.gateway",
+    "src.ntfy",
+    "src.replay",
+)
+
+
+def run(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+
+
+class TestStartup(unittest.TestCase):
+    def test_optional_modules_are_not_imported(self):
+        loaded = run(
+            f"import sys, main; print(*(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+        ).split()
+        self.assertEqual(loaded, [])
+
+    def test_cold_start_budget(self):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            run("import main")
+            timings.append(time.perf_counter() - start)
+        self.assertLess(min(timings), STARTUP_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
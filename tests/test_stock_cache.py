@@ -0,0 +1,197 @@
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.api_client import APIException, UnavailableError
+from src.change_watcher import ChangeEvent
+from src.product import NoStockEntriesException, Product
+from src.stock_cache import StockCache
+from src.stock_entry import StockEntry, parse_entries
+
+
+def load_json(name: str) -> list[dict]:
+    with open(f"tests/responses/{name}", "r") as f:
+        return json.load(f)
+
+
+def load_entries(name: str) -> list[StockEntry]:
+    return parse_entries(load_json(name))
+
+
+class TestStockCache(unittest.TestCase):
+    def setUp(self):
+        self.entries = load_entries("product_stock_entries_not_open.json")
+
+    def test_miss_then_hit(self):
+        cache = StockCache(ttl=60, max_size=10)
+        self.assertIsNone(cache.get(2))
+        cache.put(2, self.entries)
+        self.assertEqual(cache.get(2), self.entries)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    @patch("src.stock_cache.time.monotonic")
+    def test_entries_expire(self, mock_monotonic):
+        cache = StockCache(ttl=60, max_size=10)
+        mock_monotonic.return_value = 0
+        cache.put(2, self.entries)
+        mock_monotonic.return_value = 61
+        self.assertIsNone(cache.get(2))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = StockCache(ttl=60, max_size=2)
+        cache.put(1, self.entries)
+        cache.put(2, self.entries)
+        cache.get(1)
+        cache.put(3, self.entries)
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+
+    def test_get_returns_a_copy(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(2, self.entries)
+        cache.get(2).clear()  # type: ignore
+        self.assertEqual(cache.get(2), self.entries)
+
+    def test_record_open_splits_entry(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(2, self.entries[1:])
+        cache.record_open(2, "62505f88ea718", 1)
+        entries = cache.get(2)
+        self.assertEqual([(e.amount, e.open) for e in entries], [(1, True), (4, False)])  # type: ignore
+
+    def test_record_consume_uses_opened_entry_first(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(2, load_entries("product_stock_entries_open.json"))
+        cache.record_consume(2, "62505f88ea718", 1)
+        entries = cache.get(2)
+        self.assertEqual(len(entries), 1)  # type: ignore
+        self.assertFalse(entries[0].open)  # type: ignore
+
+    def test_record_at_location_leaves_other_locations(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(
+            2,
+            [
+                StockEntry("kitchen", 2.0, False, location_id=3),
+                StockEntry("pantry", 2.0, True, location_id=4),
+                StockEntry("pantry", 2.0, False, location_id=4),
+            ],
+        )
+        cache.record_open(2, None, 2, location_id=4)
+        cache.record_consume(2, None, 3, location_id=4)
+        self.assertEqual(
+            cache.get(2),
+            [
+                StockEntry("kitchen", 2.0, False, location_id=3),
+                StockEntry("pantry", 1.0, True, location_id=4),
+            ],
+        )
+
+    def test_record_consume_more_than_cached_invalidates(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(2, self.entries)
+        cache.record_consume(2, "62505f88ea718", 10)
+        self.assertIsNone(cache.get(2))
+
+    def test_replace_keeps_products_changed_since_the_snapshot(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(1, self.entries)
+        cache.put(2, self.entries)
+        fetched = time.monotonic()
+        cache.record_open(2, "62505f88ea718", 1)
+        snapshot = {2: self.entries, 3: self.entries}
+        cache.replace(snapshot, fetched)
+        self.assertIsNone(cache.get(1))
+        self.assertTrue(cache.get(2)[0].open)  # type: ignore
+        self.assertEqual(cache.get(3), self.entries)
+        # A later snapshot includes our change
+        cache.replace(snapshot, time.monotonic())
+        self.assertEqual(cache.get(2), self.entries)
+
+    def test_snapshot_is_not_cut_to_max_size(self):
+        cache = StockCache(ttl=60, max_size=2)
+        cache.replace({product_id: self.entries for product_id in range(5)}, 0)
+        cache.put(5, self.entries)
+        cache.put(6, self.entries)
+        for product_id in range(7):
+            self.assertEqual(cache.get(product_id), self.entries)
+        # Beyond the snapshot, products fetched one by one are still bounded
+        cache.put(7, self.entries)
+        self.assertIsNone(cache.get(0))
+
+    @patch("src.stock_cache.time.monotonic")
+    def test_unchanged_grocy_keeps_entries(self, mock_monotonic):
+        cache = StockCache(ttl=60, max_size=10)
+        mock_monotonic.return_value = 0
+        cache.put(2, self.entries)
+        mock_monotonic.return_value = 50
+        cache.on_change(ChangeEvent("2022-04-10 11:00:00", False, 40))
+        mock_monotonic.return_value = 100
+        self.assertEqual(cache.get(2), self.entries)
+
+    @patch("src.stock_cache.time.monotonic")
+    def test_changed_grocy_drops_entries_we_did_not_change(self, mock_monotonic):
+        cache = StockCache(ttl=60, max_size=10)
+        mock_monotonic.return_value = 0
+        cache.put(1, self.entries)
+        cache.put(2, self.entries)
+        mock_monotonic.return_value = 5
+        cache.record_open(2, "62505f88ea718", 1)
+        mock_monotonic.return_value = 10
+        cache.on_change(ChangeEvent("2022-04-10 11:00:01", True, 1))
+        self.assertIsNone(cache.get(1))
+        self.assertTrue(cache.get(2)[0].open)  # type: ignore
+
+    def test_invalidate(self):
+        cache = StockCache(ttl=60, max_size=10)
+        cache.put(1, self.entries)
+        cache.put(2, self.entries)
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+        cache.invalidate()
+        self.assertIsNone(cache.get(2))
+
+
+class TestProductWithStockCache(unittest.TestCase):
+    def setUp(self):
+        self.api_client = MagicMock()
+        self.api_client.get_raw.return_value = json.dumps(
+            load_json("product_stock_entries_not_open.json")
+        ).encode()
+        self.cache = StockCache(ttl=60, max_size=10)
+
+    def product(self) -> Product:
+        return Product(
+            id=2,
+            stock_id="62505f88ea718",
+            api_client=self.api_client,
+            stock_cache=self.cache,
+        )
+
+    def test_repeat_scans_skip_entries_request(self):
+        self.product().open_or_consume()
+        self.product().open_or_consume()
+        self.assertEqual(self.api_client.get_raw.call_count, 1)
+        paths = [call.kwargs["path"] for call in self.api_client.post.call_args_list]
+        self.assertRegex(paths[0], r".*/open$")
+        self.assertRegex(paths[1], r".*/consume$")
+
+    def test_api_error_invalidates(self):
+        self.product().open_or_consume()
+        self.api_client.post.side_effect = UnavailableError("Server error", 500)
+        with self.assertRaises(APIException):
+            self.product().open_or_consume()
+        self.api_client.post.side_effect = None
+        self.product().open_or_consume()
+        self.assertEqual(self.api_client.get_raw.call_count, 2)
+
+    def test_no_entries_invalidates(self):
+        self.api_client.get_raw.return_value = b"[]"
+        with self.assertRaises(NoStockEntriesException):
+            self.product().open_or_consume()
+        self.assertIsNone(self.cache.get(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from src.stock_entry import StockEntry, iter_entries, load_entries, parse_entries
+
+
+class TestStockEntry(unittest.TestCase):
+    def test_parse_entries(self):
+        with open("tests/responses/product_stock_entries_open.json", "r") as f:
+            entries = parse_entries(json.load(f))
+        self.assertEqual(
+            entries[0],
+            StockEntry(stock_id="62505f88ea718", amount=1.0, open=True, location_id=3),
+        )
+        self.assertFalse(entries[1].open)
+
+    def test_location_is_optional(self):
+        entry = StockEntry.from_json({"stock_id": "abc", "amount": "2", "open": "0"})
+        self.assertIsNone(entry.location_id)
+        self.assertEqual(entry.amount, 2.0)
+
+
+class TestRawEntries(unittest.TestCase):
+    def setUp(self):
+        with open("tests/responses/product_stock_entries_open.json", "rb") as f:
+            self.data = f.read()
+
+    def test_iter_entries_matches_full_parse(self):
+        self.assertEqual(list(iter_entries(self.data)), load_entries(self.data))
+        self.assertEqual(list(iter_entries(b" [ ] ")), [])
+
+    def test_iter_entries_stops_early(self):
+        # The first entry is parsed before the broken rest is reached
+        data = b'[{"stock_id": "abc", "amount": "1", "open": "1"}, {"broken'
+        entries = iter_entries(data)
+        self.assertTrue(next(entries).open)
+        with self.assertRaises(ValueError):
+            next(entries)
+
+    def test_iter_entries_rejects_other_documents(self):
+        for data in (b'{"error_message": "x"}', b"[1]", b"[{}]", b"[{} {}]", b""):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                list(iter_entries(data))
+        with self.assertRaises(ValueError):
+            load_entries(b"[{}]")
+
+
+if __name__ == "__main__":
+    unittest.main()
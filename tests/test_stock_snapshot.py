@@ -0,0 +1,51 @@
+import json
+import time
+import unittest
+
+from src.api_client import ApiClient
+from src.product import Product
+from src.stock_cache import StockCache
+from src.stock_snapshot import StockSnapshot
+from tests.mock_grocy import MockGrocy
+
+
+class TestStockSnapshot(unittest.TestCase):
+    def setUp(self):
+        with open("tests/responses/product_stock_entries_not_open.json") as f:
+            entries = json.load(f)
+        self.grocy = MockGrocy(entries={2: entries, 3: entries}).start()
+        self.api_client = ApiClient(api_url=self.grocy.url, api_key="key")
+        self.cache = StockCache(ttl=60, max_size=10)
+        self.snapshot = StockSnapshot(self.cache, api_client=self.api_client)
+
+    def tearDown(self):
+        self.grocy.stop()
+
+    def product(self, product_id: int) -> Product:
+        return Product(
+            id=product_id, api_client=self.api_client, stock_cache=self.cache
+        )
+
+    def test_scans_answer_from_snapshot(self):
+        self.snapshot.refresh()
+        self.assertEqual(self.snapshot.stats(), {"refreshes": 1, "entries": 4})
+        self.product(2).open_or_consume()
+        self.product(3).open_or_consume()
+        self.product(2).open_or_consume()
+        self.assertEqual(self.grocy.count(suffix="/entries"), 0)
+        actions = [path for method, path in self.grocy.requests if method == "POST"]
+        self.assertRegex(actions[0], r".*/2/open$")
+        self.assertRegex(actions[2], r".*/2/consume$")
+
+    def test_background_refresh(self):
+        self.snapshot.interval = 60
+        self.snapshot.start()
+        deadline = time.monotonic() + 5
+        while not self.snapshot.refreshes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.snapshot.stop(timeout=5)
+        self.assertIsNotNone(self.cache.get(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.api_client import ApiClient
+from src.barcode import BarcodeResolver
+from src.product_index import ProductIndex
+from src.stock_cache import StockCache
+from src.stock_entry import StockEntry
+from src.warm_state import STATE_VERSION, WarmState
+from tests.mock_grocy import MockGrocy
+
+ENTRIES = {1: [{"stock_id": "abc", "amount": "2", "open": "0"}]}
+
+
+class TestWarmState(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.json")
+        self.grocy = MockGrocy(entries=ENTRIES, barcodes={"4006381333931": 1}).start()
+        self.api_client = ApiClient(api_url=self.grocy.url, api_key="key")
+
+    def tearDown(self):
+        self.grocy.stop()
+        self.directory.cleanup()
+
+    def state(self) -> WarmState:
+        return WarmState(
+            self.path,
+            api_client=self.api_client,
+            stock_cache=StockCache(),
+            product_index=ProductIndex(api_client=self.api_client),
+            barcode_resolver=BarcodeResolver(self.api_client),
+        )
+
+    def save(self) -> None:
+        state = self.state()
+        state.stock_cache.put(1, [StockEntry("abc", 2.0, False)])  # type: ignore
+        state.product_index.load()  # type: ignore
+        state.barcode_resolver.resolve("4006381333931")  # type: ignore
+        state.save()
+
+    def test_restores_what_was_saved(self):
+        self.save()
+        restored = self.state()
+        self.assertTrue(restored.restore())
+        self.assertEqual(
+            restored.stock_cache.get(1), [StockEntry("abc", 2.0, False)]  # type: ignore
+        )
+        self.assertEqual(restored.product_index.get(1).name, "Product 1")  # type: ignore
+        self.assertFalse(restored.product_index.refresh())  # type: ignore
+
+        before = self.grocy.count("GET", "/by-barcode/4006381333931")
+        self.assertEqual(restored.barcode_resolver.resolve("4006381333931"), 1)  # type: ignore
+        self.assertEqual(self.grocy.count("GET", "/by-barcode/4006381333931"), before)
+
+    def test_stock_is_dropped_when_grocy_changed(self):
+        self.save()
+        self.grocy.changes += 1
+        restored = self.state()
+        self.assertTrue(restored.restore())
+        self.assertIsNone(restored.stock_cache.get(1))  # type: ignore
+        self.assertTrue(restored.product_index.refresh())  # type: ignore
+
+    def test_missing_file(self):
+        self.assertFalse(self.state().restore())
+
+    def test_other_version_is_ignored(self):
+        with open(self.path, "w") as f:
+            json.dump({"version": STATE_VERSION + 1, "barcodes": {"1": 1}}, f)
+        state = self.state()
+        with self.assertLogs(level="INFO"):
+            self.assertFalse(state.restore())
+        self.assertEqual(state.barcode_resolver.dump(), {})  # type: ignore
+
+    def test_corrupt_file_is_ignored(self):
+        with open(self.path, "w") as f:
+            f.write('{"version": 1, "stock"')
+        with self.assertLogs(level="WARNING"):
+            self.assertFalse(self.state().restore())
+
+    def test_save_replaces_file_atomically(self):
+        self.save()
+        self.save()
+        self.assertEqual(os.listdir(self.directory.name), ["state.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()